@@ -0,0 +1,119 @@
+# Importing all necessary libraries
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import json
+from videos_to_images_all_folders import image_extraction_video
+
+
+#This code compares the extraction backends of image_extraction_video on a video
+#using only the CPU. Every backend extracts the same frames into a temporary
+#folder, and the wall time, frames/sec and bytes written are reported, e.g.:
+#   python benchmark_backends.py --video sample.mp4 --fpsinterval 30 --resize
+
+
+#Backends measured by the benchmark: (name, options of image_extraction_video)
+backend_settings = [
+    ('opencv read', {'backend':'opencv'}),
+    ('opencv sparse exact', {'backend':'opencv','sparse_extraction':True,'frame_accuracy':'exact'}),
+    ('opencv sparse keyframe', {'backend':'opencv','sparse_extraction':True,'frame_accuracy':'keyframe'}),
+    ('ffmpeg pipe', {'backend':'ffmpeg-pipe'}),
+    ('ffmpeg native', {'backend':'ffmpeg'}),
+]
+
+
+#function to get the bytes written in a folder.
+def folder_bytes(path):
+    """
+    @args
+    path: path of the folder.
+    """
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+#function to measure every backend
+def benchmark_backends(videopath,framerate_extraction_interval,settings=backend_settings,
+                        **extraction_options):
+    """
+    @args
+    videopath: path of the video.
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    settings: list of (name, options) of the backends.
+    extraction_options: options of image_extraction_video shared by all the backends.
+
+    returns a list of dictionaries with the results of every backend.
+    """
+    results=[]
+
+    for setting_name, backend_options in settings:
+        #the frames are saved in a temporary folder, also the "all" copies.
+        working_directory=tempfile.mkdtemp(prefix='benchmark_backends_')
+        output=os.path.join(working_directory,'frames')
+        all_directory=os.path.join(working_directory,'all_'+str(extraction_options.get('new_width',1980))+
+                                    '_'+str(extraction_options.get('new_height',1080)))
+        os.makedirs(output)
+        os.makedirs(all_directory)
+
+        current_directory=os.getcwd()
+        videopath_absolute=os.path.abspath(videopath)
+        os.chdir(working_directory)
+
+        try:
+            start=time.perf_counter()
+            saved_frames=image_extraction_video(videopath_absolute,framerate_extraction_interval,output,
+                                                rename_videoframe=True,new_name='frame',
+                                                **dict(extraction_options,**backend_options))
+            elapsed=time.perf_counter()-start
+
+            results.append({'backend':setting_name,'frames':saved_frames,'seconds':elapsed,
+                            'frames_per_second':saved_frames/elapsed if elapsed > 0 else 0.0,
+                            'bytes':folder_bytes(output)})
+
+        except Exception as error:
+            #e.g. FFmpeg is not installed
+            results.append({'backend':setting_name,'error':str(error)})
+
+        finally:
+            os.chdir(current_directory)
+            shutil.rmtree(working_directory)
+
+    return results
+
+
+if __name__ == '__main__':
+
+    #Parser to make this code work.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', type=str, required=True, help='video used in the benchmark')
+    parser.add_argument('--fpsinterval', type=int, default=30, help='fps interval')
+    parser.add_argument('--reshaped_width', type=int, default=1920,
+                        help='width of the retrieved images')
+    parser.add_argument('--reshaped_height', type=int, default=1080,
+                        help='height of the retrieved images')
+    parser.add_argument('--resize', action='store_true', help='Resize the frames')
+    parser.add_argument('--hrotation', action='store_true', help='Save images horizontally')
+    parser.add_argument('--vrotation', action='store_true', help='Save images vertically')
+    parser.add_argument('--image_format', type=str, default='png', help='Format of the saved images')
+    parser.add_argument('--output', type=str, default=None, help='json file to save the results')
+
+    args=parser.parse_args()
+
+    results=benchmark_backends(args.video,args.fpsinterval,resize=args.resize,
+                                horizontal_rotation=args.hrotation,vertical_rotation=args.vrotation,
+                                new_width=args.reshaped_width,new_height=args.reshaped_height,
+                                image_format=args.image_format)
+
+    #print the table with the results
+    print ('%-24s %8s %10s %12s %14s' %('backend','frames','seconds','frames/sec','bytes'))
+    for result in results:
+        if 'error' in result:
+            print ('%-24s failed: %s' %(result['backend'],result['error']))
+        else:
+            print ('%-24s %8d %10.2f %12.1f %14d' %(result['backend'],result['frames'],result['seconds'],
+                                                    result['frames_per_second'],result['bytes']))
+
+    if args.output is not None:
+        f = open(args.output,"w")
+        f.write(json.dumps(results))
+        f.close()
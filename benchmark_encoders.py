@@ -0,0 +1,111 @@
+# Importing all necessary libraries
+import cv2
+import time
+import argparse
+import json
+from image_output import encode_image
+
+
+#This code measures the cost of every output encoder on a sample clip.
+#For every setting it reports the bytes per frame and the milliseconds per frame
+#needed to encode the frames of the clip, e.g.:
+#   python benchmark_encoders.py --video sample.mp4 --frames 60
+
+
+#Settings measured by the benchmark: (name, format, encoder options)
+encoder_settings = [
+    ('png default', 'png', {}),
+    ('png level 0', 'png', {'png_compression':0}),
+    ('png level 1', 'png', {'png_compression':1}),
+    ('png level 3', 'png', {'png_compression':3}),
+    ('png level 9', 'png', {'png_compression':9}),
+    ('png fast', 'png', {'png_fast':True}),
+    ('jpg q75', 'jpg', {'quality':75}),
+    ('jpg q90', 'jpg', {'quality':90}),
+    ('jpg q95', 'jpg', {'quality':95}),
+    ('jpg q95 simd', 'jpg', {'quality':95,'encoder_backend':'simd'}),
+    ('webp q80', 'webp', {'quality':80}),
+    ('webp lossless', 'webp', {'quality':101}),
+]
+
+
+#function to read the frames used in the benchmark
+def read_sample_frames(videopath,number_frames,framerate_extraction_interval=1):
+    """
+    @args
+    videopath: path of the sample clip.
+    number_frames: number of frames read.
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    """
+    cam = cv2.VideoCapture(videopath)
+    frames=[]
+    currentframe=0
+
+    while(len(frames) < number_frames):
+        ret,frame = cam.read()
+        if not ret:
+            break
+
+        if currentframe % framerate_extraction_interval == 0:
+            frames.append(frame)
+        currentframe += 1
+
+    cam.release()
+
+    return frames
+
+#function to measure every encoder setting
+def benchmark_encoders(frames,repetitions=1):
+    """
+    @args
+    frames: list of image arrays.
+    repetitions: number of times every frame is encoded.
+
+    returns a list of dictionaries with the results of every setting.
+    """
+    results=[]
+
+    for setting_name, image_format, encoding_options in encoder_settings:
+        encoded_bytes=0
+        start=time.perf_counter()
+
+        for repetition in range(repetitions):
+            for frame in frames:
+                encoded_bytes+=len(encode_image(frame,'frame.'+image_format,**encoding_options))
+
+        elapsed=time.perf_counter()-start
+        encoded_frames=len(frames)*repetitions
+
+        results.append({'setting':setting_name,'format':image_format,'options':encoding_options,
+                        'bytes_per_frame':encoded_bytes/float(encoded_frames),
+                        'ms_per_frame':1000.0*elapsed/float(encoded_frames)})
+
+    return results
+
+
+if __name__ == '__main__':
+
+    #Parser to make this code work.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', type=str, required=True, help='sample clip')
+    parser.add_argument('--frames', type=int, default=30, help='number of frames encoded')
+    parser.add_argument('--fpsinterval', type=int, default=1, help='fps interval')
+    parser.add_argument('--repetitions', type=int, default=1, help='times every frame is encoded')
+    parser.add_argument('--output', type=str, default=None, help='json file to save the results')
+
+    args=parser.parse_args()
+
+    frames=read_sample_frames(args.video,args.frames,args.fpsinterval)
+    print ('Encoding %s frames of %s' %(str(len(frames)),str(args.video)))
+
+    results=benchmark_encoders(frames,repetitions=args.repetitions)
+
+    #print the table with the results
+    print ('%-16s %16s %14s' %('setting','bytes/frame','ms/frame'))
+    for result in results:
+        print ('%-16s %16.0f %14.2f' %(result['setting'],result['bytes_per_frame'],result['ms_per_frame']))
+
+    if args.output is not None:
+        f = open(args.output,"w")
+        f.write(json.dumps(results))
+        f.close()
@@ -0,0 +1,438 @@
+# Importing all necessary libraries
+import cv2
+import numpy as np
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import multiprocessing
+import resource
+
+
+#This code measures the whole extraction (video_to_frame_folders) and image
+#modification (image_modification) on synthetic media generated locally, so the
+#same benchmark can be repeated on any machine and before/after a change, e.g.:
+#   python benchmark_suite.py --entry both --save_baseline baseline.json
+#   python benchmark_suite.py --entry both --baseline baseline.json
+#
+#The synthetic media follows the layout of the fields:
+#-<media_dir>/bench
+#   |---<resolution> (one date per resolution, e.g. 1080p)
+#           |--->videos: <videos_per_resolution> .avi files
+#           |--->raw_images: <images_per_resolution> images, half of them vertical
+#
+#Every configuration of the parameter grid runs in a new process, in a temporary
+#folder, and the wall time, outputs per second, peak RSS (including the workers)
+#and bytes written are recorded.
+
+
+#sizes of the synthetic media (width, height)
+resolutions = {'720p':(1280,720), '1080p':(1920,1080), '4k':(3840,2160)}
+
+#parameter grid used when --grid is not given
+default_grid = {'fpsinterval':[30], 'resize':[True], 'rotation':['h'], 'ratio':['16:9'],
+                'workers':[1,2], 'image_format':['png','jpg']}
+
+#parameters of the grid used by every entry point
+entry_parameters = {'videos':['fpsinterval','resize','rotation','workers','image_format'],
+                    'images':['resize','rotation','ratio','workers','image_format']}
+
+#name of the field of the synthetic media
+benchmark_field = 'bench'
+
+
+#function to write a synthetic video
+def synthetic_video(path,width,height,fps,seconds,seed=0):
+    """
+    @args
+    path: path of the new .avi video.
+    width: width of the frames.
+    height: height of the frames.
+    fps: frames per second.
+    seconds: duration of the video.
+    seed: seed of the random texture, the same seed gives the same video.
+
+    The frames are a smooth random texture moving across the image, with the
+    frame number written on them, so every frame is different and compresses
+    like a real recording more than a flat color.
+    """
+    random_generator=np.random.default_rng(seed)
+    texture=random_generator.integers(0,256,(height//40+2,width//40+2,3),dtype=np.uint8)
+    texture=cv2.resize(texture,(2*width,height),interpolation=cv2.INTER_CUBIC)
+
+    video=cv2.VideoWriter(path,cv2.VideoWriter_fourcc(*'MJPG'),fps,(width,height))
+    for frame_number in range(int(fps*seconds)):
+        shift=(frame_number*8) % width
+        frame=np.ascontiguousarray(texture[:,shift:shift+width])
+        cv2.putText(frame,str(frame_number),(width//20,height//2),cv2.FONT_HERSHEY_SIMPLEX,
+                    height/200.0,(255,255,255),max(1,height//100))
+        video.write(frame)
+    video.release()
+
+#function to write a synthetic image
+def synthetic_image(path,width,height,seed=0):
+    """
+    @args
+    path: path of the new image, the extension decides the format.
+    width: width of the image.
+    height: height of the image.
+    seed: seed of the random texture.
+    """
+    random_generator=np.random.default_rng(seed)
+    texture=random_generator.integers(0,256,(height//40+2,width//40+2,3),dtype=np.uint8)
+    cv2.imwrite(path,cv2.resize(texture,(width,height),interpolation=cv2.INTER_CUBIC))
+
+#function to create (or reuse) the synthetic media
+def synthetic_media(media_dir,media_resolutions,fps=30,seconds=10,videos_per_resolution=1,
+                    images_per_resolution=8):
+    """
+    @args
+    media_dir: folder of the synthetic media.
+    media_resolutions: list of names of resolutions, e.g. ['720p','1080p'].
+    fps: frames per second of the videos.
+    seconds: duration of the videos.
+    videos_per_resolution: number of videos of every resolution.
+    images_per_resolution: number of images of every resolution.
+
+    returns the description of the media. The media is only generated again if
+    the description changed.
+    """
+    specification={'resolutions':list(media_resolutions),'fps':fps,'seconds':seconds,
+                    'videos_per_resolution':videos_per_resolution,
+                    'images_per_resolution':images_per_resolution}
+
+    specification_path=os.path.join(media_dir,'media.json')
+    if os.path.exists(specification_path):
+        with open(specification_path,'r') as specification_file:
+            if json.load(specification_file) == specification:
+                return specification
+        shutil.rmtree(media_dir)
+
+    print ('Generating the synthetic media in %s' %str(media_dir))
+
+    for resolution_index, resolution in enumerate(media_resolutions):
+        width, height = resolutions[resolution]
+        date_path=os.path.join(media_dir,benchmark_field,resolution)
+        os.makedirs(os.path.join(date_path,'videos'),exist_ok=True)
+        os.makedirs(os.path.join(date_path,'raw_images'),exist_ok=True)
+
+        for video_number in range(videos_per_resolution):
+            synthetic_video(os.path.join(date_path,'videos','video_'+str(video_number)+'.avi'),
+                            width,height,fps,seconds,seed=100*resolution_index+video_number)
+
+        #half of the images are vertical, and they alternate jpg and png
+        for image_number in range(images_per_resolution):
+            image_size=(width,height) if image_number % 2 == 0 else (height,width)
+            extension='jpg' if image_number % 4 < 2 else 'png'
+            synthetic_image(os.path.join(date_path,'raw_images','image_'+str(image_number)+'.'+extension),
+                            image_size[0],image_size[1],seed=1000+100*resolution_index+image_number)
+
+    with open(specification_path,'w') as specification_file:
+        json.dump(specification,specification_file)
+
+    return specification
+
+#function to get the configurations of a parameter grid
+def grid_configurations(grid,entry_point):
+    """
+    @args
+    grid: dictionary parameter -> list of values.
+    entry_point: 'videos' or 'images'. Only the parameters used by the entry
+    point are combined.
+    """
+    names=[name for name in entry_parameters[entry_point] if name in grid]
+    return [dict(zip(names,values)) for values in itertools.product(*[grid[name] for name in names])]
+
+#function to get the command options of a configuration
+def configuration_command(configuration,reshaped_width,reshaped_height):
+    """
+    @args
+    configuration: dictionary with the parameters of the grid.
+    reshaped_width: width of the outputs.
+    reshaped_height: height of the outputs.
+    """
+    command=['--fields',benchmark_field,'--reshaped_width',str(reshaped_width),
+            '--reshaped_height',str(reshaped_height)]
+
+    for name, value in sorted(configuration.items()):
+        if name == 'rotation':
+            if value == 'h':
+                command.append('--hrotation')
+            elif value == 'v':
+                command.append('--vrotation')
+        elif name == 'ratio':
+            ratio_width, ratio_height = str(value).split(':')
+            command+=['--ratiolongside',ratio_width,'--ratioshortside',ratio_height]
+        elif isinstance(value,bool):
+            if value:
+                command.append('--'+name)
+        else:
+            command+=['--'+name,str(value)]
+
+    return command
+
+#function to get the files and bytes written in a folder
+def written_outputs(path):
+    """
+    @args
+    path: folder where the outputs were written. Symbolic links (the inputs) are
+    not followed.
+
+    returns (number of images saved, bytes written). The copies in the
+    all_<width>_<height> folder are counted in the bytes, not in the images.
+    """
+    image_extensions=('.png','.jpg','.jpeg','.webp')
+    outputs=0
+    written_bytes=0
+
+    for directory, directories, files in os.walk(path):
+        for file in files:
+            file_path=os.path.join(directory,file)
+            if os.path.islink(file_path):
+                continue
+            written_bytes+=os.path.getsize(file_path)
+            if file.lower().endswith(image_extensions) and not os.path.relpath(file_path,path).startswith('all_'):
+                outputs+=1
+
+    return outputs, written_bytes
+
+#function to get the peak RSS in megabytes of this process and of its workers
+def peak_rss_megabytes():
+    #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale=1024.0*1024.0 if sys.platform == 'darwin' else 1024.0
+    own_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/scale
+    workers_rss=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/scale
+
+    #On Linux, ru_maxrss keeps the memory of the process that started this one
+    #(before exec), so the peak of this process is read from /proc instead.
+    try:
+        with open('/proc/self/status','r') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    own_rss=int(line.split()[1])/1024.0
+    except OSError:
+        pass
+
+    return max(own_rss,workers_rss)
+
+#function run in a new process for every configuration.
+def run_configuration(media_dir,entry_point,command,results_queue):
+    """
+    @args
+    media_dir: folder of the synthetic media.
+    entry_point: 'videos' or 'images'.
+    command: list of command options of videos_to_images_all_folders.py.
+    results_queue: multiprocessing queue where the result is put.
+    """
+    import videos_to_images_all_folders
+
+    working_directory=tempfile.mkdtemp(prefix='benchmark_suite_')
+    os.symlink(os.path.abspath(os.path.join(media_dir,benchmark_field)),
+                os.path.join(working_directory,benchmark_field))
+    os.chdir(working_directory)
+
+    #the prints of every frame are part of the measure, but not shown. The
+    #descriptor is replaced, so the prints of the workers are not shown either.
+    sys.stdout.flush()
+    standard_output=os.dup(1)
+    null_output=os.open(os.devnull,os.O_WRONLY)
+    os.dup2(null_output,1)
+
+    try:
+        args=videos_to_images_all_folders.command_parser().parse_args(command)
+
+        start=time.perf_counter()
+        if entry_point == 'videos':
+            videos_to_images_all_folders.video_to_frame_folders(args)
+        else:
+            videos_to_images_all_folders.image_modification(args)
+        elapsed=time.perf_counter()-start
+
+        outputs, written_bytes = written_outputs(working_directory)
+        results_queue.put({'seconds':elapsed,'outputs':outputs,'bytes':written_bytes,
+                            'peak_rss_mb':peak_rss_megabytes()})
+
+    except Exception as error:
+        results_queue.put({'error':repr(error)})
+
+    finally:
+        sys.stdout.flush()
+        os.dup2(standard_output,1)
+        os.close(null_output)
+        os.chdir('/')
+        shutil.rmtree(working_directory)
+
+#function to run every configuration of the grid
+def benchmark_suite(media_dir,entry_points,grid,reshaped_width=1920,reshaped_height=1080,repetitions=1):
+    """
+    @args
+    media_dir: folder of the synthetic media.
+    entry_points: list with 'videos' and/or 'images'.
+    grid: dictionary parameter -> list of values.
+    reshaped_width: width of the outputs.
+    reshaped_height: height of the outputs.
+    repetitions: number of runs of every configuration, the median time is kept.
+
+    returns a list of dictionaries with the results of every configuration.
+    """
+    #every run starts from a clean process, without memory used by the previous runs.
+    context=multiprocessing.get_context('spawn')
+    results=[]
+
+    for entry_point in entry_points:
+        for configuration in grid_configurations(grid,entry_point):
+            command=configuration_command(configuration,reshaped_width,reshaped_height)
+            runs=[]
+
+            for repetition in range(repetitions):
+                results_queue=context.Queue()
+                process=context.Process(target=run_configuration,
+                                        args=(media_dir,entry_point,command,results_queue))
+                process.start()
+                run=results_queue.get()
+                process.join()
+                runs.append(run)
+
+                if 'error' in run:
+                    break
+
+            result={'entry':entry_point,'configuration':configuration,
+                    'key':entry_point+' '+json.dumps(configuration,sort_keys=True)}
+
+            if 'error' in runs[-1]:
+                result['error']=runs[-1]['error']
+            else:
+                runs.sort(key=lambda run: run['seconds'])
+                median_run=runs[len(runs)//2]
+                result.update({'seconds':median_run['seconds'],'outputs':median_run['outputs'],
+                                'outputs_per_second':median_run['outputs']/median_run['seconds'] if median_run['seconds'] > 0 else 0.0,
+                                'bytes':median_run['bytes'],
+                                'peak_rss_mb':max(run['peak_rss_mb'] for run in runs)})
+
+            print ('%-6s %-80s %s' %(entry_point,json.dumps(configuration,sort_keys=True),
+                                    result['error'] if 'error' in result else '%.1f outputs/s' %result['outputs_per_second']))
+            results.append(result)
+
+    return results
+
+#function to compare the results with a baseline
+def compare_with_baseline(results,baseline_results,tolerance=0.1):
+    """
+    @args
+    results: list of results given by benchmark_suite.
+    baseline_results: list of results of a previous run.
+    tolerance: relative loss of outputs/sec accepted before a configuration is
+    reported as a regression.
+
+    returns the list of keys of the configurations slower than the baseline.
+    """
+    baseline={result['key']:result for result in baseline_results}
+    regressions=[]
+
+    print ('%-90s %12s %12s %9s %11s' %('configuration','baseline/s','current/s','change','rss MB'))
+    for result in results:
+        previous=baseline.get(result['key'])
+        if previous is None or 'error' in result or 'error' in previous:
+            print ('%-90s %12s' %(result['key'],'no baseline' if previous is None else 'failed'))
+            continue
+
+        change=result['outputs_per_second']/previous['outputs_per_second']-1.0 if previous['outputs_per_second'] > 0 else 0.0
+        flag=''
+        if change < -tolerance:
+            flag=' REGRESSION'
+            regressions.append(result['key'])
+
+        print ('%-90s %12.1f %12.1f %+8.1f%% %5.0f->%-5.0f%s' %(result['key'],previous['outputs_per_second'],
+                                                            result['outputs_per_second'],100.0*change,
+                                                            previous['peak_rss_mb'],result['peak_rss_mb'],flag))
+
+    return regressions
+
+#function to read the parameter grid given in the command, e.g. workers=1,2,4
+def parse_grid(grid_options):
+    """
+    @args
+    grid_options: list of 'parameter=value,value' strings.
+    """
+    grid=dict(default_grid)
+
+    for grid_option in grid_options:
+        name, values = grid_option.split('=',1)
+        parsed_values=[]
+        for value in values.split(','):
+            if name == 'resize':
+                parsed_values.append(value.lower() in ('1','true','yes'))
+            elif name in ('fpsinterval','workers'):
+                parsed_values.append(int(value))
+            else:
+                parsed_values.append(value)
+        grid[name]=parsed_values
+
+    return grid
+
+#function to describe the machine, saved with the results
+def environment_description():
+    return {'platform':platform.platform(),'python':platform.python_version(),
+            'opencv':cv2.__version__,'cpu_count':os.cpu_count()}
+
+
+if __name__ == '__main__':
+
+    #Parser to make this code work.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entry', type=str, default='both', choices=['videos','images','both'],
+                        help='Entry point measured')
+    parser.add_argument('--media_dir', type=str, default='./benchmark_media',
+                        help='Folder of the synthetic media, reused between runs')
+    parser.add_argument('--resolutions', type=str, default='720p,1080p',
+                        help='Resolutions of the synthetic media: 720p, 1080p and/or 4k')
+    parser.add_argument('--fps', type=int, default=30, help='Frames per second of the synthetic videos')
+    parser.add_argument('--seconds', type=float, default=10, help='Duration of the synthetic videos')
+    parser.add_argument('--videos', type=int, default=1, help='Videos of every resolution')
+    parser.add_argument('--images', type=int, default=8, help='Images of every resolution')
+    parser.add_argument('--grid', type=str, nargs='*', default=[],
+                        help='Parameter values, e.g. fpsinterval=15,30 workers=1,4 rotation=h,v,none '
+                            'ratio=16:9,4:3 resize=1,0 image_format=png,jpg')
+    parser.add_argument('--reshaped_width', type=int, default=1920, help='width of the outputs')
+    parser.add_argument('--reshaped_height', type=int, default=1080, help='height of the outputs')
+    parser.add_argument('--repetitions', type=int, default=1, help='Runs of every configuration (median kept)')
+    parser.add_argument('--output', type=str, default=None, help='json file to save the results')
+    parser.add_argument('--save_baseline', type=str, default=None, help='json file to save the results as baseline')
+    parser.add_argument('--baseline', type=str, default=None, help='json file with the baseline results')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative loss of outputs/sec accepted before reporting a regression')
+
+    args=parser.parse_args()
+
+    media_resolutions=args.resolutions.split(',')
+    specification=synthetic_media(args.media_dir,media_resolutions,fps=args.fps,seconds=args.seconds,
+                                videos_per_resolution=args.videos,images_per_resolution=args.images)
+
+    entry_points=['videos','images'] if args.entry == 'both' else [args.entry]
+    results=benchmark_suite(args.media_dir,entry_points,parse_grid(args.grid),
+                            reshaped_width=args.reshaped_width,reshaped_height=args.reshaped_height,
+                            repetitions=args.repetitions)
+
+    report={'environment':environment_description(),'media':specification,'results':results}
+
+    for report_path in (args.output,args.save_baseline):
+        if report_path is not None:
+            f = open(report_path,"w")
+            f.write(json.dumps(report,indent=2))
+            f.close()
+
+    #compare with the baseline. The exit code is 1 if a configuration is slower.
+    if args.baseline is not None:
+        with open(args.baseline,'r') as baseline_file:
+            baseline_report=json.load(baseline_file)
+
+        if baseline_report.get('environment') != report['environment']:
+            print ('The baseline was measured in a different environment: %s' %str(baseline_report.get('environment')))
+
+        if compare_with_baseline(results,baseline_report['results'],tolerance=args.tolerance):
+            sys.exit(1)
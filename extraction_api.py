@@ -0,0 +1,181 @@
+# Importing all necessary libraries
+import os
+
+
+#Functions to use the extraction from other Python code, e.g. from a worker
+#process that extracts many videos without starting a new interpreter for each
+#one:
+#   from extraction_api import extract_frames
+#   for result in extract_frames('a.mp4',30,output='frames',resize=True):
+#       print (result['output'])
+#
+#Importing this module has no side effects and does not import OpenCV, numpy or
+#FFmpeg. They are imported the first time a function is called, and stay loaded
+#for the next calls of the same process.
+
+
+#generator that extracts the frames of a video.
+def extract_frames(videopath,framerate_extraction_interval=30,output=None,image_name=None,
+                    resize=False,horizontal_rotation=False,vertical_rotation=False,
+                    new_width=1980,new_height=1080,image_format='png',encoding_options=None,
+                    sparse_extraction=False,frame_accuracy='exact',backend='opencv'):
+    """
+    @args
+    videopath: path of the video.
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    output: if given, folder where the frames are saved as
+    <image_name><frame index>.<image_format>. If None, the frames are only given back.
+    image_name: beginning of the names of the saved frames. By default, the name
+    of the video followed by '_'.
+    resize, horizontal_rotation, vertical_rotation, new_width, new_height: see
+    videos_to_images_all_folders.frame_transformation. By default the frames are
+    not transformed.
+    image_format: format of the saved frames, 'png', 'jpg' or 'webp'.
+    encoding_options: options of the encoder. See image_output.encode_image.
+    sparse_extraction, frame_accuracy: see videos_to_images_all_folders.read_video_frames.
+    backend: 'opencv' or 'ffmpeg-pipe'.
+
+    yields a dictionary for every kept frame with 'source', 'frame' (index in the
+    video), 'image' (the transformed array) and, if output is given, 'output'
+    (path of the saved frame).
+    """
+    from videos_to_images_all_folders import read_video_frames, frame_transformation
+    from image_output import encode_image, write_encoded_image
+
+    if backend == 'ffmpeg-pipe':
+        from ffmpeg_backend import read_video_frames_ffmpeg
+        kept_frames=read_video_frames_ffmpeg(videopath,framerate_extraction_interval)
+    elif backend == 'opencv':
+        kept_frames=read_video_frames(videopath,framerate_extraction_interval,
+                                    sparse_extraction=sparse_extraction,
+                                    frame_accuracy=frame_accuracy)
+    else:
+        raise ValueError('backend must be "opencv" or "ffmpeg-pipe", not %s' %str(backend))
+
+    if output is not None:
+        os.makedirs(output,exist_ok=True)
+        if image_name is None:
+            image_name=os.path.basename(videopath).split(".")[0]+'_'
+
+    for currentframe, frame in kept_frames:
+        #the arrays are not reused, the caller can keep them.
+        frame=frame_transformation(frame,resize=resize,horizontal_rotation=horizontal_rotation,
+                                    vertical_rotation=vertical_rotation,new_width=new_width,
+                                    new_height=new_height)
+        result={'source':videopath,'frame':currentframe,'image':frame}
+
+        if output is not None:
+            frame_path=os.path.join(output,str(image_name)+str(currentframe)+'.'+image_format)
+            write_encoded_image(encode_image(frame,frame_path,**(encoding_options or {})),frame_path)
+            result['output']=frame_path
+
+        yield result
+
+#function to crop, rotate and resize an image.
+def process_image(imagepath,output=None,new_name=None,resize=False,horizontal_rotation=False,
+                    vertical_rotation=False,new_width=1980,new_height=1080,image_ratio=False,
+                    ratio_width=16,ratio_height=9,image_format='png',encoding_options=None,
+                    reduced_decode=False):
+    """
+    @args
+    imagepath: path of the image.
+    output: if given, folder where the image is saved as <new_name>.<image_format>.
+    new_name: name of the saved image. By default, the name of the original image.
+    The rest of the arguments are the same as in
+    videos_to_images_all_folders.image_transformation. By default the image is
+    not transformed.
+    reduced_decode (bool): whether a large image is decoded at a reduced size when
+    the output is much smaller. See large_image_reader.
+
+    returns a dictionary with 'source', 'image' (the transformed array) and, if
+    output is given, 'output' (path of the saved image).
+    """
+    from videos_to_images_all_folders import decode_image, image_transformation
+    from image_output import encode_image, write_encoded_image
+
+    image, cropped = decode_image(imagepath,reduced_decode,resize,horizontal_rotation,vertical_rotation,
+                                new_width,new_height,image_ratio,ratio_width,ratio_height)
+    if image is None:
+        raise ValueError('The image %s could not be read' %str(imagepath))
+
+    image=image_transformation(image,resize=resize,horizontal_rotation=horizontal_rotation,
+                                vertical_rotation=vertical_rotation,new_width=new_width,
+                                new_height=new_height,image_ratio=image_ratio and not cropped,
+                                ratio_width=ratio_width,ratio_height=ratio_height)
+    result={'source':imagepath,'image':image}
+
+    if output is not None:
+        os.makedirs(output,exist_ok=True)
+        if new_name is None:
+            new_name=os.path.basename(imagepath).split(".")[0]
+        image_path=os.path.join(output,str(new_name)+'.'+image_format)
+        write_encoded_image(encode_image(image,image_path,**(encoding_options or {})),image_path)
+        result['output']=image_path
+
+    return result
+
+#generator that processes the videos and images of the fields.
+def process_tree(fields,media='both',framerate_extraction_interval=30,new_width=1920,
+                new_height=1080,video_options=None,image_options=None,**options):
+    """
+    @args
+    fields: list of names of the fields. As in the command, the fields are
+    folders of the current directory with the <field>/<date>/videos and
+    <field>/<date>/raw_images layout.
+    media: 'videos', 'images' or 'both'.
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    new_width: width of the outputs, also used in the names of the output folders.
+    new_height: height of the outputs.
+    video_options: options of videos_to_images_all_folders.image_extraction_video
+    only used for the videos, e.g. {'sparse_extraction':True}.
+    image_options: options of videos_to_images_all_folders.image_processing only
+    used for the images, e.g. {'image_ratio':True}.
+    options: options used for both, e.g. resize, horizontal_rotation,
+    image_format or encoding_options.
+
+    yields a dictionary for every video (with the number of 'frames' saved) and
+    for every image (with 'saved'), in the order they are processed. The outputs
+    have the same names and folders as with the command. The videos and images
+    are processed one after another: the pools and --resume of the command are
+    not used.
+    """
+    from videos_to_images_all_folders import image_extraction_video, image_processing
+    from media_discovery import scan_directories, scan_media_files, image_extensions, video_extensions
+
+    if media not in ('videos','images','both'):
+        raise ValueError('media must be "videos", "images" or "both", not %s' %str(media))
+
+    size=str(new_width)+'_'+str(new_height)
+    os.makedirs(os.path.join('./','all_'+size),exist_ok=True)
+
+    for field in fields:
+        for date in scan_directories(os.path.join('./',str(field))):
+            if media in ('videos','both'):
+                save_frames_directory=os.path.join('./',str(field)+'_'+size,str(date),'videos')
+                os.makedirs(save_frames_directory,exist_ok=True)
+
+                video_files_paths=scan_media_files(os.path.join('./',str(field),str(date),'videos'),video_extensions)
+                for video_counter, video_path in enumerate(video_files_paths):
+                    images_video_name=str(field)+'_'+str(date)+'_'+'v'+'_'+str(video_counter)
+                    saved_frames=image_extraction_video(video_path,framerate_extraction_interval,
+                                                        save_frames_directory,new_width=new_width,
+                                                        new_height=new_height,rename_videoframe=True,
+                                                        new_name=images_video_name,
+                                                        **dict(options,**(video_options or {})))
+
+                    yield {'kind':'video','source':video_path,'field':str(field),'date':str(date),
+                            'image_name':images_video_name,'frames':saved_frames}
+
+            if media in ('images','both'):
+                save_images_directory=os.path.join('./',str(field)+'_'+size,str(date),'raw_images')
+                os.makedirs(save_images_directory,exist_ok=True)
+
+                image_files_paths=scan_media_files(os.path.join('./',str(field),str(date),'raw_images'),image_extensions)
+                for image_counter, image_path in enumerate(image_files_paths):
+                    image_name=str(field)+'_'+str(date)+'_'+'i'+'_'+str(image_counter)
+                    saved=image_processing(image_path,save_images_directory,new_width=new_width,
+                                            new_height=new_height,rename_image=True,new_name=image_name,
+                                            **dict(options,**(image_options or {})))
+
+                    yield {'kind':'image','source':image_path,'field':str(field),'date':str(date),
+                            'image_name':image_name,'saved':saved}
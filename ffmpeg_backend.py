@@ -0,0 +1,223 @@
+# Importing all necessary libraries
+import numpy as np
+import os
+import re
+import threading
+from transform_planner import orientation_rotations
+
+
+#FFmpeg extraction backend. Instead of decoding every frame with OpenCV, FFmpeg
+#decodes with all the cores and only passes on the frames we keep (select filter).
+#There are two ways of using it:
+#   - pipe: the kept frames are streamed as raw BGR through a pipe, and they are
+#     transformed and saved in Python as with the OpenCV backend.
+#   - native: FFmpeg also scales (scale filter), rotates (transpose filter) and
+#     encodes the frames, all in one process. Python only creates the copies in
+#     the "all" folder.
+#ffmpeg-python builds the command, the ffmpeg and ffprobe executables must be installed.
+#The size of the frames is always read with ffprobe (video_frame_size): the size
+#given by OpenCV can be different, and the frames of the pipe are cut with it.
+#ffmpeg-python is only imported when one of these backends is used.
+
+
+#function to get the size of the frames of a video.
+def video_frame_size(videopath):
+    """
+    @args
+    videopath: path of the video.
+
+    returns (width, height) of the decoded frames. FFmpeg rotates the frames with
+    the rotation metadata of the container, so the sides are swapped for videos
+    rotated 90 or 270 degrees.
+    """
+    import ffmpeg
+    probe = ffmpeg.probe(videopath,select_streams='v:0')
+    stream = probe['streams'][0]
+    width, height = int(stream['width']), int(stream['height'])
+
+    #rotation in the tags (old containers) or in the display matrix
+    rotation=int(float(stream.get('tags',{}).get('rotate',0)))
+    for side_data in stream.get('side_data_list',[]):
+        if 'rotation' in side_data:
+            rotation=int(float(side_data['rotation']))
+
+    if rotation % 180 != 0:
+        width, height = height, width
+
+    return width, height
+
+#function to get the select filter expression that keeps the frames we want.
+def frame_selection_expression(framerate_extraction_interval,start_frame=0):
+    """
+    @args
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    start_frame: frames before this one are discarded.
+    """
+    expression='not(mod(n,%d))' %int(framerate_extraction_interval)
+
+    if start_frame > 0:
+        expression='gte(n,%d)*%s' %(int(start_frame),expression)
+
+    return expression
+
+#function to get the encoder options of FFmpeg from our encoder options.
+def ffmpeg_encoding_options(image_format,quality=None,png_compression=None,png_fast=False,
+                            encoder_backend='opencv'):
+    """
+    @args
+    image_format: 'png', 'jpg' or 'webp'.
+    quality, png_compression, png_fast: see image_output.encoding_parameters.
+    encoder_backend: ignored, FFmpeg always uses its own encoders.
+    """
+    if image_format in ('jpg','jpeg') and quality is not None:
+        #FFmpeg uses a quantizer scale from 2 (best) to 31 (worst) for JPEG.
+        return {'q:v':max(2,min(31,int(round(31-float(quality)*29.0/100.0))))}
+
+    if image_format == 'webp' and quality is not None:
+        if int(quality) > 100:
+            return {'lossless':1}
+        return {'quality':int(quality)}
+
+    if image_format == 'png':
+        if png_fast:
+            return {'compression_level':1,'pred':'none'}
+        if png_compression is not None:
+            return {'compression_level':int(png_compression)}
+
+    return {}
+
+#function to add the scale and transpose filters to a stream.
+def transformation_filters(stream,width,height,resize=False,horizontal_rotation=True,
+                            vertical_rotation=False,new_width=1980,new_height=1080):
+    """
+    @args
+    stream: ffmpeg-python stream.
+    width: width of the decoded frames.
+    height: height of the decoded frames.
+    The rest of the arguments are the same as in frame_transformation: the frames
+    are resized and then rotated.
+    """
+    if resize:
+        stream=stream.filter('scale',int(new_width),int(new_height),flags='area')
+        width, height = int(new_width), int(new_height)
+
+    #transpose=clock is a clockwise quarter turn
+    for rotation in range(orientation_rotations(height,width,horizontal_rotation,vertical_rotation)):
+        stream=stream.filter('transpose','clock')
+
+    return stream
+
+#generator that reads the kept frames of a video through a pipe.
+def read_video_frames_ffmpeg(videopath,framerate_extraction_interval,start_frame=0,threads=0,frame_size=None):
+    """
+    @args
+    videopath: path of the video where are about to open.
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    start_frame: index of the first frame read. Used to resume an interrupted extraction.
+    threads: number of decoding threads of FFmpeg, 0 uses all the cores.
+    frame_size: (width, height) of the decoded frames, if already known from
+    video_frame_size. By default the video is probed. The size of the OpenCV
+    probe (video_probe) is not always the size decoded by FFmpeg.
+
+    yields (frame index, BGR frame array) for every kept frame, as read_video_frames.
+    Raises RuntimeError if FFmpeg fails, or if its frames do not have the given size.
+    """
+    import ffmpeg
+    width, height = frame_size or video_frame_size(videopath)
+    frame_bytes=width*height*3
+
+    process=(ffmpeg.input(videopath,threads=threads)
+                .filter('select',frame_selection_expression(framerate_extraction_interval,start_frame))
+                .output('pipe:',format='rawvideo',pix_fmt='bgr24',vsync='passthrough')
+                .global_args('-loglevel','error')
+                .run_async(pipe_stdout=True,pipe_stderr=True))
+
+    #the errors are read in another thread, so FFmpeg never blocks writing them
+    error_chunks=[]
+    error_reader=threading.Thread(target=lambda: error_chunks.extend(iter(lambda: process.stderr.read(4096),b'')),
+                                daemon=True)
+    error_reader.start()
+
+    #the k-th kept frame is the frame start + k*interval of the video
+    currentframe=start_frame+(-start_frame) % framerate_extraction_interval
+
+    try:
+        while(True):
+            raw_frame=process.stdout.read(frame_bytes)
+
+            #stop if there are no more frames
+            if len(raw_frame) < frame_bytes:
+                break
+
+            yield currentframe, np.frombuffer(raw_frame,np.uint8).reshape(height,width,3)
+            currentframe+=framerate_extraction_interval
+
+        #the whole output was read, check how FFmpeg ended
+        process.wait()
+        error_reader.join()
+        if process.returncode != 0:
+            raise RuntimeError('FFmpeg failed to decode %s (exit status %d): %s' %(str(videopath),process.returncode,
+                                b''.join(error_chunks).decode('utf-8','replace').strip()))
+        if raw_frame:
+            raise RuntimeError('The frames of %s are not %dx%d' %(str(videopath),width,height))
+
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+#function to extract the frames of a video only with FFmpeg.
+def ffmpeg_extraction_video(videopath,framerate_extraction_interval,output,image_name_prefix,
+                            resize=False,horizontal_rotation=True,vertical_rotation=False,
+                            new_width=1980,new_height=1080,image_format='png',
+                            encoding_options=None,threads=0,frame_size=None):
+    """
+    @args
+    videopath: path of the video where are about to open.
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    output: path where the ouptput is gonna be saved
+    image_name_prefix: the frames are saved as <image_name_prefix>_<number>.<image_format>
+    resize, horizontal_rotation, vertical_rotation, new_width, new_height: see frame_transformation.
+    image_format: format of the saved frames, 'png', 'jpg' or 'webp'.
+    encoding_options: options of the encoder. See ffmpeg_encoding_options.
+    threads: number of decoding threads of FFmpeg, 0 uses all the cores.
+    frame_size: (width, height) of the decoded frames, if already known from
+    video_frame_size. By default the video is probed.
+
+    returns the list of paths of the saved frames. Raises RuntimeError if FFmpeg fails.
+    """
+    import ffmpeg
+    width, height = frame_size or video_frame_size(videopath)
+
+    #the frames of a previous run with the same names (e.g. with a smaller
+    #interval) are removed, so only the frames of this run are counted.
+    previous_frame=re.compile(re.escape(str(image_name_prefix))+r'_\d+\.'+re.escape(image_format)+'$')
+    for name in os.listdir(output):
+        if previous_frame.match(name):
+            os.remove(os.path.join(output,name))
+
+    stream=(ffmpeg.input(videopath,threads=threads)
+                .filter('select',frame_selection_expression(framerate_extraction_interval)))
+    stream=transformation_filters(stream,width,height,resize=resize,
+                                horizontal_rotation=horizontal_rotation,
+                                vertical_rotation=vertical_rotation,
+                                new_width=new_width,new_height=new_height)
+
+    pattern=os.path.join(output,str(image_name_prefix)+'_%d.'+image_format)
+    try:
+        (stream.output(pattern,start_number=0,vsync='passthrough',
+                        **ffmpeg_encoding_options(image_format,**(encoding_options or {})))
+                .global_args('-loglevel','error')
+                .overwrite_output()
+                .run(capture_stderr=True))
+    except ffmpeg.Error as error:
+        raise RuntimeError('FFmpeg failed to extract the frames of %s: %s' %(str(videopath),
+                            (error.stderr or b'').decode('utf-8','replace').strip()))
+
+    #get the frames written by FFmpeg
+    saved_frames=[]
+    while os.path.exists(pattern %len(saved_frames)):
+        saved_frames.append(pattern %len(saved_frames))
+
+    return saved_frames
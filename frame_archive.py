@@ -0,0 +1,284 @@
+# Importing all necessary libraries
+import os
+import json
+import mmap
+import time
+import tarfile
+import threading
+from work_sharding import process_owner
+
+
+#Frame archives: the encoded frames and images are appended to a few large shard
+#files instead of being written as millions of small files. A shard is a tar file
+#in the WebDataset layout, so it can be read with tar, tarfile or webdataset:
+#   f1_d1_v_0_0.png  f1_d1_v_0_0.json  f1_d1_v_0_1.png  f1_d1_v_0_1.json ...
+#where the json member is the metadata of the frame. Next to every shard, an
+#index (<shard>.idx.jsonl) has one JSON line per frame with its key, the offset
+#and size of the encoded frame in the shard, and its metadata:
+#   {"key": "f1_d1_v_0_1", "extension": "png", "offset": 2048, "size": 91822,
+#    "metadata": {"source": ..., "frame": 30, ...}}
+#Every process appends to its own shards (frames-<host>-<pid>-<n>.tar), and a
+#line of the index is only written once its frame is in the shard. The end of
+#archive blocks of tar are written when a shard is closed; tar and tarfile read
+#the shards of a process that was stopped without them.
+#FrameArchive reads the indices, and gives the encoded frames as memoryviews of
+#the memory mapped shards, without copying them.
+
+
+#maximum size of a shard before the next one is started
+shard_megabytes = 1024
+
+#name of the folder of the archive in an all_<width>_<height> folder
+archive_folder = 'frames_archive'
+
+
+#function to get the folder of the archive of an all_<width>_<height> folder.
+def frame_archive_directory(all_directory):
+    return os.path.join(all_directory,archive_folder)
+
+
+#function to write all the parts. os.writev and os.write can write less than
+#asked (e.g. a full disk or a signal), and the rest is written again.
+def write_all(descriptor,parts):
+    """
+    @args
+    descriptor: file descriptor.
+    parts: list of bytes-like objects, written in order.
+    """
+    remaining=sum(len(part) for part in parts)
+    written=os.writev(descriptor,parts)
+
+    if written < remaining:
+        rest=memoryview(b''.join(parts))[written:]
+        while len(rest) > 0:
+            written=os.write(descriptor,rest)
+            if written == 0:
+                raise OSError('No bytes written to the frame archive')
+            rest=rest[written:]
+
+
+class FrameArchiveWriter:
+    """
+    Shards of a frame archive written by this process. It can be used from
+    several threads of the same process.
+    @args
+    archive_directory: folder of the archive.
+    shard_bytes: maximum size of a shard.
+    """
+
+    def __init__(self,archive_directory,shard_bytes=None):
+        self.archive_directory=archive_directory
+        self.shard_bytes=shard_bytes if shard_bytes is not None else shard_megabytes<<20
+        self.lock=threading.Lock()
+        self.shard_number=0
+        self.shard_descriptor=None
+        self.index_descriptor=None
+
+        os.makedirs(archive_directory,exist_ok=True)
+
+    #function to start a new shard. The shards of a previous process with the
+    #same pid are not overwritten.
+    def _open_shard(self):
+        while(True):
+            shard_name='frames-'+process_owner()+'-'+'%05d' %self.shard_number
+            self.shard_number+=1
+            self.shard_path=os.path.join(self.archive_directory,shard_name+'.tar')
+            try:
+                self.shard_descriptor=os.open(self.shard_path,os.O_WRONLY|os.O_CREAT|os.O_EXCL,0o644)
+                break
+            except FileExistsError:
+                continue
+
+        self.index_descriptor=os.open(self.shard_path[:-len('.tar')]+'.idx.jsonl',
+                                    os.O_WRONLY|os.O_APPEND|os.O_CREAT,0o644)
+        self.shard_size=0
+
+    #function to end the current shard.
+    def _close_shard(self):
+        if self.shard_descriptor is None:
+            return
+
+        #end of archive: two empty blocks
+        write_all(self.shard_descriptor,[bytes(2*tarfile.BLOCKSIZE)])
+        os.close(self.shard_descriptor)
+        os.close(self.index_descriptor)
+        self.shard_descriptor=None
+        self.index_descriptor=None
+
+    #function to get a tar member (header, data and padding) and the offset of the data in it
+    def _tar_member(self,name,data):
+        info=tarfile.TarInfo(name)
+        info.size=len(data)
+        info.mtime=int(time.time())
+        info.mode=0o644
+        header=info.tobuf(format=tarfile.GNU_FORMAT)
+        padding=bytes(-len(data) % tarfile.BLOCKSIZE)
+
+        return [header,data,padding], len(header)
+
+    #function to add an encoded frame to the archive.
+    def append(self,key,encoded_image,extension,metadata=None):
+        """
+        @args
+        key: name of the frame, without extension, e.g. f1_d1_v_0_12.
+        encoded_image: bytes-like object with the encoded frame.
+        extension: format of the frame, e.g. 'png'.
+        metadata: dictionary serializable to JSON, saved with the frame.
+        """
+        metadata_bytes=json.dumps(metadata or {},sort_keys=True).encode('utf-8')
+
+        image_member, image_header_size = self._tar_member(key+'.'+extension,encoded_image)
+        metadata_member, metadata_header_size = self._tar_member(key+'.json',metadata_bytes)
+
+        with self.lock:
+            member_size=sum(len(part) for part in image_member+metadata_member)
+            if self.shard_descriptor is None or (self.shard_size > 0 and self.shard_size+member_size > self.shard_bytes):
+                self._close_shard()
+                self._open_shard()
+
+            offset=self.shard_size+image_header_size
+            write_all(self.shard_descriptor,image_member+metadata_member)
+            self.shard_size+=member_size
+
+            #the frame is in the shard before it is in the index
+            line={'key':key,'extension':extension,'offset':offset,'size':len(encoded_image),'metadata':metadata or {}}
+            write_all(self.index_descriptor,[(json.dumps(line,sort_keys=True)+'\n').encode('utf-8')])
+
+    def close(self):
+        with self.lock:
+            self._close_shard()
+
+
+#archives already opened in this process, shared by every video or image of a worker.
+_open_archives = {}
+_open_archives_lock = threading.Lock()
+
+
+#function to open (or get the already opened) archive of a folder.
+def open_frame_archive(archive_directory):
+    """
+    @args
+    archive_directory: folder of the archive.
+    """
+    key=os.path.abspath(archive_directory)
+
+    with _open_archives_lock:
+        archive=_open_archives.get(key)
+        if archive is None:
+            archive=FrameArchiveWriter(archive_directory)
+            _open_archives[key]=archive
+
+    return archive
+
+#function to close the archives opened in this process, writing the end of their shards.
+def close_frame_archives():
+    with _open_archives_lock:
+        for archive in _open_archives.values():
+            archive.close()
+        _open_archives.clear()
+
+
+class FrameArchive:
+    """
+    Reader of a frame archive. The indices are read once (refresh reads the
+    frames added since then), and the shards are memory mapped when a frame is
+    first read. If a key was saved more than once (e.g. a video resumed after a
+    crash) the last one is used.
+    @args
+    archive_directory: folder of the archive.
+    """
+
+    def __init__(self,archive_directory):
+        self.archive_directory=archive_directory
+
+        #key -> (shard path, offset, size, extension, metadata)
+        self.frames={}
+
+        #index path -> bytes already read
+        self.read_bytes={}
+
+        #shard path -> mmap
+        self.mapped_shards={}
+
+        self.refresh()
+
+    #function to read the frames added to the indices since the last time.
+    def refresh(self):
+        index_names=sorted(name for name in os.listdir(self.archive_directory) if name.endswith('.idx.jsonl'))
+
+        for index_name in index_names:
+            index_path=os.path.join(self.archive_directory,index_name)
+            shard_path=index_path[:-len('.idx.jsonl')]+'.tar'
+
+            with open(index_path,'rb') as index_file:
+                index_file.seek(self.read_bytes.get(index_path,0))
+                for line in index_file:
+                    #a line being written is read the next time
+                    if not line.endswith(b'\n'):
+                        break
+                    self.read_bytes[index_path]=self.read_bytes.get(index_path,0)+len(line)
+
+                    record=json.loads(line)
+                    self.frames[record['key']]=(shard_path,record['offset'],record['size'],
+                                                record['extension'],record['metadata'])
+
+    #function to get the memory map of a shard that covers a frame
+    def _mapped_shard(self,shard_path,end):
+        mapped_shard=self.mapped_shards.get(shard_path)
+
+        #the shard grew since it was mapped
+        if mapped_shard is None or len(mapped_shard) < end:
+            with open(shard_path,'rb') as shard_file:
+                mapped_shard=mmap.mmap(shard_file.fileno(),0,access=mmap.ACCESS_READ)
+            self.mapped_shards[shard_path]=mapped_shard
+
+        return mapped_shard
+
+    #function to get an encoded frame.
+    def frame_bytes(self,key):
+        """
+        @args
+        key: name of the frame, e.g. f1_d1_v_0_12.
+
+        returns a memoryview of the encoded frame in the memory mapped shard (no copy).
+        """
+        shard_path, offset, size, extension, metadata = self.frames[key]
+        return memoryview(self._mapped_shard(shard_path,offset+size))[offset:offset+size]
+
+    #function to get the metadata of a frame.
+    def metadata(self,key):
+        return self.frames[key][4]
+
+    #function to decode a frame.
+    def read_image(self,key):
+        """
+        returns the BGR image, like cv2.imread.
+        """
+        import numpy as np
+        import cv2
+
+        return cv2.imdecode(np.frombuffer(self.frame_bytes(key),dtype=np.uint8),cv2.IMREAD_COLOR)
+
+    #generator of the frames of the archive, in the order of the shards.
+    def iterate(self):
+        """
+        yields (key, memoryview of the encoded frame, metadata). Reading the frames
+        in this order reads every shard sequentially.
+        """
+        for key in sorted(self.frames,key=lambda key: self.frames[key][:2]):
+            yield key, self.frame_bytes(key), self.metadata(key)
+
+    def keys(self):
+        return self.frames.keys()
+
+    def __contains__(self,key):
+        return key in self.frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    #function to close the memory maps. The memoryviews given before must be released first.
+    def close(self):
+        for mapped_shard in self.mapped_shards.values():
+            mapped_shard.close()
+        self.mapped_shards={}
@@ -0,0 +1,154 @@
+# Importing all necessary libraries
+import threading
+import queue
+
+
+#Streaming pipeline used to overlap decoding, transforming and encoding/writing.
+#
+#   decoder thread ---> [bounded queue] ---> transform threads ---> [bounded queue] ---> writer threads
+#
+#The queues are bounded, so when the writers fall behind the transform stage
+#blocks, and then the decoder blocks. This backpressure keeps a fixed number of
+#frames in memory no matter how long the video is.
+
+
+#object put in the queues to tell the next stage that there is no more work.
+_END_OF_STREAM = object()
+
+
+#put an element in a bounded queue without blocking forever if the pipeline failed.
+def _put(work_queue,element,stop_event):
+    """
+    @args
+    work_queue: queue where the element is placed.
+    element: element placed in the queue.
+    stop_event: event set when one of the stages failed.
+    """
+    while not stop_event.is_set():
+        try:
+            work_queue.put(element,timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+#get an element from a queue without blocking forever if the pipeline failed.
+def _get(work_queue,stop_event):
+    """
+    @args
+    work_queue: queue where the element is taken from.
+    stop_event: event set when one of the stages failed.
+    """
+    while not stop_event.is_set():
+        try:
+            return work_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+    return _END_OF_STREAM
+
+#function to run a decode -> transform -> write pipeline.
+def run_frame_pipeline(frame_source,transform_function,write_function,
+                        transform_threads=1,writer_threads=2,queue_size=8):
+    """
+    @args
+    frame_source: iterable of (key, image). It is consumed in the decoder thread.
+    transform_function: function(key, image) returning the transformed image.
+    write_function: function(key, image) that encodes and saves the image. Its
+    return value is collected.
+    transform_threads: number of threads running transform_function.
+    writer_threads: number of threads running write_function.
+    queue_size: maximum number of frames waiting between two stages.
+
+    returns a list with the (key, result of write_function) in the order the
+    frames were written.
+    """
+
+    #queues between the stages
+    decoded_queue=queue.Queue(maxsize=queue_size)
+    transformed_queue=queue.Queue(maxsize=queue_size)
+
+    #shared state between the threads
+    stop_event=threading.Event()
+    errors=[]
+    results=[]
+    lock=threading.Lock()
+    running_transformers=[transform_threads]
+
+    #keep the first error and stop the other stages.
+    def fail(error):
+        with lock:
+            errors.append(error)
+        stop_event.set()
+
+    #stage 1: decode
+    def decoder():
+        try:
+            for key, image in frame_source:
+                if not _put(decoded_queue,(key,image),stop_event):
+                    return
+        except BaseException as error:
+            fail(error)
+        finally:
+            #release the video if the pipeline stopped before the end.
+            if hasattr(frame_source,'close'):
+                frame_source.close()
+
+            for thread in range(transform_threads):
+                _put(decoded_queue,_END_OF_STREAM,stop_event)
+
+    #stage 2: transform
+    def transformer():
+        try:
+            while(True):
+                element=_get(decoded_queue,stop_event)
+                if element is _END_OF_STREAM:
+                    break
+
+                key, image = element
+                if not _put(transformed_queue,(key,transform_function(key,image)),stop_event):
+                    return
+        except BaseException as error:
+            fail(error)
+        finally:
+            #the last transformer tells the writers to finish.
+            with lock:
+                running_transformers[0]-=1
+                last_transformer=running_transformers[0] == 0
+
+            if last_transformer:
+                for thread in range(writer_threads):
+                    _put(transformed_queue,_END_OF_STREAM,stop_event)
+
+    #stage 3: encode and write
+    def writer():
+        try:
+            while(True):
+                element=_get(transformed_queue,stop_event)
+                if element is _END_OF_STREAM:
+                    break
+
+                key, image = element
+                result=write_function(key,image)
+                with lock:
+                    results.append((key,result))
+        except BaseException as error:
+            fail(error)
+
+    #start all the threads and wait for them.
+    threads=[threading.Thread(target=decoder,daemon=True)]
+    threads+=[threading.Thread(target=transformer,daemon=True) for thread in range(transform_threads)]
+    threads+=[threading.Thread(target=writer,daemon=True) for thread in range(writer_threads)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    #raise the first error found in any of the stages.
+    if errors:
+        raise errors[0]
+
+    return results
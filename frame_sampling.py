@@ -0,0 +1,123 @@
+#OpenCV and numpy are imported by the functions that use them, so the command
+#line can read the modes of this module without loading them.
+
+
+#Sampling modes of the video frames:
+#   - frames: every Nth frame (--fpsinterval), the original behaviour.
+#   - seconds: one frame every S seconds of video. The interval in frames is
+#     computed from the frame rate of every video.
+#   - scene: every Nth frame is a candidate, and it is only kept if it changed
+#     enough since the last kept frame. The change is measured on a tiny
+#     grayscale copy of the frame, so the candidates that are discarded (e.g. the
+#     drone hovering) never reach the full-resolution transformation and encoding.
+sampling_modes = ['frames', 'seconds', 'scene']
+scene_metrics = ['luma', 'histogram']
+
+#size of the copy of the frame used to measure the change
+signature_size = (64, 36)
+
+#default threshold of every scene metric: mean absolute luma difference (0-255)
+#and Bhattacharyya distance between luma histograms (0-1).
+default_scene_thresholds = {'luma':12.0, 'histogram':0.2}
+
+
+#function to get the frame rate of a video
+def video_frame_rate(videopath):
+    """
+    @args
+    videopath: path of the video.
+
+    returns the frames per second of the video, or None if it is not known.
+    """
+    import cv2
+
+    cam = cv2.VideoCapture(videopath)
+    frame_rate=cam.get(cv2.CAP_PROP_FPS)
+    cam.release()
+
+    if not frame_rate or frame_rate != frame_rate or frame_rate <= 0:
+        return None
+
+    return frame_rate
+
+#function to get the interval in frames equivalent to some seconds of video
+def seconds_frame_interval(videopath,sampling_seconds,frame_rate=None):
+    """
+    @args
+    videopath: path of the video.
+    sampling_seconds: seconds of video between two kept frames.
+    frame_rate: frames per second of the video, if already known (e.g. from
+    video_probe). By default it is read from the video.
+    """
+    if frame_rate is None:
+        frame_rate=video_frame_rate(videopath)
+
+    #without frame rate we assume 30 fps, the most common in our recordings.
+    if frame_rate is None:
+        print ('The frame rate of %s is unknown; using 30 fps' %str(videopath))
+        frame_rate=30.0
+
+    return max(1,int(round(frame_rate*float(sampling_seconds))))
+
+#function to get the small luma copy used to compare frames
+def frame_change_signature(frame,scene_metric='luma'):
+    """
+    @args
+    frame: BGR image array
+    scene_metric: 'luma' or 'histogram'.
+    """
+    import numpy as np
+    import cv2
+
+    #downscale first, so the color conversion only works on a few pixels
+    small_frame=cv2.resize(frame,signature_size,interpolation=cv2.INTER_AREA)
+    if small_frame.ndim == 3:
+        small_frame=cv2.cvtColor(small_frame,cv2.COLOR_BGR2GRAY)
+
+    if scene_metric == 'histogram':
+        histogram=cv2.calcHist([small_frame],[0],None,[32],[0,256])
+        return cv2.normalize(histogram,histogram)
+
+    return small_frame.astype(np.float32)
+
+#function to measure the change between two signatures
+def frame_change_score(signature,previous_signature,scene_metric='luma'):
+    """
+    @args
+    signature: signature of the current frame.
+    previous_signature: signature of the last kept frame.
+    scene_metric: 'luma' or 'histogram'.
+    """
+    import numpy as np
+    import cv2
+
+    if scene_metric == 'histogram':
+        return cv2.compareHist(signature,previous_signature,cv2.HISTCMP_BHATTACHARYYA)
+
+    return float(np.mean(np.abs(signature-previous_signature)))
+
+#generator that only gives back the frames different enough from the last kept one.
+def scene_change_filter(frames,scene_threshold=None,scene_metric='luma'):
+    """
+    @args
+    frames: iterable of (frame index, frame array), e.g. read_video_frames.
+    scene_threshold: minimum change to keep a frame. None uses the default of the metric.
+    scene_metric: 'luma' (mean absolute difference of the luma) or 'histogram'
+    (Bhattacharyya distance of the luma histograms).
+
+    yields (frame index, frame array) for the kept frames. The first frame is always kept.
+    """
+    if scene_metric not in scene_metrics:
+        raise ValueError('scene_metric must be one of %s, not %s' %(str(scene_metrics),str(scene_metric)))
+
+    if scene_threshold is None:
+        scene_threshold=default_scene_thresholds[scene_metric]
+
+    previous_signature=None
+
+    for currentframe, frame in frames:
+        signature=frame_change_signature(frame,scene_metric)
+
+        if previous_signature is None or frame_change_score(signature,previous_signature,scene_metric) >= scene_threshold:
+            previous_signature=signature
+            yield currentframe, frame
@@ -0,0 +1,180 @@
+# Importing all necessary libraries
+import os
+
+
+#OpenCV is imported by the functions that encode, so the command line can read
+#the formats and options of this module without loading it.
+
+
+#Every output image is saved twice: once in the field folder and once in the
+#"all" folder. The image is encoded only once. The second file is a link to the
+#first one, or a plain copy of the encoded bytes.
+all_copy_modes = ['copy', 'hardlink', 'reflink', 'symlink']
+
+#ioctl request to clone a file in Linux filesystems with copy-on-write support
+#(btrfs, xfs, ...). Value of FICLONE in linux/fs.h.
+FICLONE = 0x40049409
+
+
+#Formats of the output images, and encoders. The "simd" encoder uses simplejpeg
+#(libjpeg-turbo with SIMD) for JPEG images when it is installed, and OpenCV otherwise.
+image_formats = ['png', 'jpg', 'webp']
+encoder_backends = ['opencv', 'simd']
+
+
+#function to get the OpenCV parameters of an encoder.
+def encoding_parameters(image_format,quality=None,png_compression=None,png_fast=False):
+    """
+    @args
+    image_format: 'png', 'jpg' or 'webp'.
+    quality: quality of 'jpg' (0-100) and 'webp' (1-100, above 100 is lossless) images.
+    None keeps the OpenCV default.
+    png_compression: zlib level of 'png' images (0-9). None keeps the OpenCV default (1 in
+    recent versions, 3 in older ones).
+    png_fast (bool): lossless fast mode for 'png' images. Level 1 with run-length
+    encoding, much faster than the default, with bigger files.
+    """
+    import cv2
+
+    parameters=[]
+
+    if image_format in ('jpg','jpeg') and quality is not None:
+        parameters+=[cv2.IMWRITE_JPEG_QUALITY,int(quality)]
+
+    elif image_format == 'webp' and quality is not None:
+        parameters+=[cv2.IMWRITE_WEBP_QUALITY,int(quality)]
+
+    elif image_format == 'png':
+        if png_fast:
+            parameters+=[cv2.IMWRITE_PNG_COMPRESSION,1,cv2.IMWRITE_PNG_STRATEGY,cv2.IMWRITE_PNG_STRATEGY_RLE]
+        elif png_compression is not None:
+            parameters+=[cv2.IMWRITE_PNG_COMPRESSION,int(png_compression)]
+
+    return parameters
+
+#function to encode JPEG images with simplejpeg. Returns None if it is not installed.
+def simd_jpeg_encoding(image,quality=None):
+    """
+    @args
+    image: BGR image array
+    quality: JPEG quality (0-100). None uses 95, the OpenCV default.
+    """
+    try:
+        import simplejpeg
+    except ImportError:
+        return None
+
+    #simplejpeg needs contiguous arrays with a channel axis, also for gray images
+    if image.ndim == 2:
+        image=image[...,None]
+    if not image.flags['C_CONTIGUOUS']:
+        image=image.copy(order='C')
+
+    return simplejpeg.encode_jpeg(image,quality=95 if quality is None else int(quality),
+                                colorspace='BGR' if image.shape[2] == 3 else 'GRAY')
+
+#function to encode an image once with the format given by the file extension.
+def encode_image(image,image_name,quality=None,png_compression=None,png_fast=False,
+                encoder_backend='opencv'):
+    """
+    @args
+    image: image array
+    image_name: path of the image, the extension decides the format.
+    quality, png_compression, png_fast: encoder options. See encoding_parameters.
+    encoder_backend: 'opencv' or 'simd'.
+
+    returns the encoded image as a bytes-like object.
+    """
+    import cv2
+
+    extension=os.path.splitext(image_name)[1]
+    image_format=extension[1:].lower()
+
+    #SIMD accelerated JPEG encoder
+    if encoder_backend == 'simd' and image_format in ('jpg','jpeg'):
+        encoded_image=simd_jpeg_encoding(image,quality=quality)
+        if encoded_image is not None:
+            return encoded_image
+
+    success, encoded_image = cv2.imencode(extension,image,
+                                encoding_parameters(image_format,quality=quality,
+                                                    png_compression=png_compression,
+                                                    png_fast=png_fast))
+
+    if not success:
+        raise ValueError('The image %s could not be encoded' %str(image_name))
+
+    return encoded_image
+
+#function to write encoded bytes in a file.
+def write_encoded_image(encoded_image,image_name):
+    """
+    @args
+    encoded_image: bytes-like object with the encoded image.
+    image_name: path of the new file.
+
+    returns True if the file was written. As cv2.imwrite, it returns False
+    instead of failing when the file cannot be created.
+    """
+    try:
+        with open(image_name,'wb') as image_file:
+            image_file.write(encoded_image)
+    except OSError as error:
+        print ('The image %s could not be written: %s' %(str(image_name),str(error)))
+        return False
+
+    return True
+
+#function to create a copy-on-write clone of a file.
+def reflink_file(source,destination):
+    """
+    @args
+    source: path of the existing file.
+    destination: path of the clone.
+    """
+    import fcntl
+
+    with open(source,'rb') as source_file, open(destination,'wb') as destination_file:
+        fcntl.ioctl(destination_file.fileno(),FICLONE,source_file.fileno())
+
+#function to create the second copy of an image that was already written.
+def duplicate_output(encoded_image,image_name,all_image_name,all_copy_mode='copy'):
+    """
+    @args
+    encoded_image: bytes-like object with the encoded image, used when the link fails.
+    image_name: path of the image already written.
+    all_image_name: path of the second copy.
+    all_copy_mode: 'copy' writes the encoded bytes again, 'hardlink', 'reflink' and
+    'symlink' link the second copy to the first one. If the link is not possible
+    (different filesystem, not supported...) the encoded bytes are written.
+
+    returns True if the second copy was created.
+    """
+    if all_copy_mode not in all_copy_modes:
+        raise ValueError('all_copy_mode must be one of %s, not %s' %(str(all_copy_modes),str(all_copy_mode)))
+
+    #links cannot replace an existing file, and a plain copy must not write
+    #through a link left by a previous run.
+    if all_copy_mode != 'copy' or os.path.islink(all_image_name):
+        if os.path.lexists(all_image_name):
+            os.remove(all_image_name)
+
+    if all_copy_mode != 'copy':
+        try:
+            if all_copy_mode == 'hardlink':
+                os.link(image_name,all_image_name)
+            elif all_copy_mode == 'symlink':
+                os.symlink(os.path.relpath(image_name,os.path.dirname(os.path.abspath(all_image_name))),
+                            all_image_name)
+            else:
+                reflink_file(image_name,all_image_name)
+
+            return True
+
+        except (OSError,ImportError):
+            #a failed reflink leaves an empty file behind.
+            if all_copy_mode == 'reflink' and os.path.lexists(all_image_name):
+                os.remove(all_image_name)
+
+    #plain copy of the encoded bytes
+    return write_encoded_image(encoded_image,all_image_name)
@@ -0,0 +1,252 @@
+# Importing all necessary libraries
+import numpy as np
+import cv2
+import mmap
+from transform_planner import ratio_cropping_window, orientation_rotations
+
+
+#Decoding of large still images (e.g. 100+ MP orthomosaic tiles) with a bounded
+#memory, when the output is much smaller than the image:
+#- JPEG images are decoded at 1/2, 1/4 or 1/8 of their size by libjpeg (DCT
+#  scaling, cv2.IMREAD_REDUCED_COLOR_*). The size is read from the header first.
+#  OpenCV decodes the other formats at full size even with the reduced flags, so
+#  they are not reduced this way.
+#- Uncompressed TIFF images are memory mapped. tifffile (optional) finds where
+#  the pixels are. Only the part kept by the crop is read, band by band, and
+#  every band is reduced by averaging blocks of pixels. The pages of a band are
+#  released once it is reduced, so the whole image is never in memory.
+#The reduced image is never smaller than the output in any orientation, so it is
+#only downscaled by the transformation afterwards.
+
+
+#size of the bands of the memory mapped images
+_band_megabytes = 64
+
+#markers of the JPEG frames that have the size of the image
+_jpeg_size_markers = frozenset(range(0xC0,0xD0))-frozenset([0xC4,0xC8,0xCC])
+
+#reduced decoding flags of OpenCV for each scale
+_reduced_flags = {2:cv2.IMREAD_REDUCED_COLOR_2, 4:cv2.IMREAD_REDUCED_COLOR_4, 8:cv2.IMREAD_REDUCED_COLOR_8}
+
+
+#function to read the size of a JPEG image from its header.
+def jpeg_size(imagepath):
+    """
+    @args
+    imagepath: path of the image.
+
+    returns (height, width) before the EXIF orientation, or None if the file is
+    not a JPEG image.
+    """
+    with open(imagepath,'rb') as image_file:
+        if image_file.read(2) != b'\xff\xd8':
+            return None
+
+        while(True):
+            #markers start with one or more 0xFF bytes
+            byte=image_file.read(1)
+            if not byte:
+                return None
+            if byte != b'\xff':
+                continue
+
+            marker=image_file.read(1)
+            while marker == b'\xff':
+                marker=image_file.read(1)
+            if not marker:
+                return None
+            marker=ord(marker)
+
+            #markers without a segment
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                continue
+            #the image data starts before any size was found
+            if marker in (0xD9,0xDA):
+                return None
+
+            length=int.from_bytes(image_file.read(2),'big')
+            if marker in _jpeg_size_markers:
+                segment=image_file.read(5)
+                return int.from_bytes(segment[1:3],'big'), int.from_bytes(segment[3:5],'big')
+            image_file.seek(length-2,1)
+
+#function to get how much an image can be reduced before it is transformed.
+def reduction_factor(height,width,new_width,new_height,horizontal_rotation=True,vertical_rotation=False,
+                    image_ratio=False,ratio_width=16,ratio_height=9):
+    """
+    @args
+    height: height of the image.
+    width: width of the image.
+    The rest of the arguments are the same as in
+    videos_to_images_all_folders.image_transformation, with resize=True.
+
+    returns the largest integer factor that keeps the image, cropped and
+    rotated, at least as large as the output.
+    """
+    factor=None
+
+    #the EXIF orientation is not known from the header, so both orientations are checked
+    for rows, columns in ((height,width),(width,height)):
+        if image_ratio:
+            rows, columns = ratio_cropping_window(rows,columns,ratio_width,ratio_height)
+        if orientation_rotations(rows,columns,horizontal_rotation,vertical_rotation) % 2:
+            rows, columns = columns, rows
+
+        orientation_factor=min(rows//max(1,int(new_height)),columns//max(1,int(new_width)))
+        factor=orientation_factor if factor is None else min(factor,orientation_factor)
+
+    return max(1,factor)
+
+#function to get the layout of an uncompressed TIFF image that can be memory mapped.
+def tiff_layout(imagepath):
+    """
+    @args
+    imagepath: path of the image.
+
+    returns a dictionary with the 'offset' of the pixels in the file, their
+    'shape' and 'photometric' ('rgb' or 'gray'), or None if tifffile is not
+    installed or the image is not an uncompressed 8 bit RGB or gray TIFF image.
+    """
+    try:
+        import tifffile
+    except ImportError:
+        return None
+
+    try:
+        with tifffile.TiffFile(imagepath) as tiff:
+            page=tiff.pages[0]
+            orientation=page.tags.get('Orientation')
+
+            if (not page.is_memmappable or page.dtype != np.uint8 or
+                    (orientation is not None and orientation.value != 1)):
+                return None
+
+            if page.photometric == tifffile.PHOTOMETRIC.RGB and len(page.shape) == 3 and page.shape[2] in (3,4):
+                photometric='rgb'
+            elif page.photometric == tifffile.PHOTOMETRIC.MINISBLACK and len(page.shape) == 2:
+                photometric='gray'
+            else:
+                return None
+
+            return {'offset':page.dataoffsets[0],'shape':tuple(page.shape),'photometric':photometric}
+    except (tifffile.TiffFileError,ValueError,IndexError):
+        return None
+
+#function to read the cropped part of a memory mapped TIFF image reduced by a factor.
+def read_mapped_tiff(imagepath,layout,rows,columns,factor):
+    """
+    @args
+    imagepath: path of the image.
+    layout: dictionary given by tiff_layout.
+    rows: number of rows kept, from the top.
+    columns: number of columns kept, from the left.
+    factor: the image is reduced by averaging blocks of factor x factor pixels.
+    The last rows and columns that do not fill a block are dropped.
+
+    returns the BGR image, like cv2.imread.
+    """
+    with open(imagepath,'rb') as image_file:
+        mapped_file=mmap.mmap(image_file.fileno(),0,access=mmap.ACCESS_READ)
+
+    try:
+        return _reduced_bands(mapped_file,layout,rows,columns,factor)
+    finally:
+        mapped_file.close()
+
+def _reduced_bands(mapped_file,layout,rows,columns,factor):
+    shape=layout['shape']
+    channels=shape[2] if len(shape) == 3 else 1
+    pixels=np.frombuffer(mapped_file,dtype=np.uint8,count=int(np.prod(shape)),
+                        offset=layout['offset']).reshape(shape)
+
+    if layout['photometric'] == 'gray':
+        conversion=cv2.COLOR_GRAY2BGR
+    else:
+        conversion=cv2.COLOR_RGB2BGR if channels == 3 else cv2.COLOR_RGBA2BGR
+
+    rows=rows//factor*factor
+    columns=columns//factor*factor
+    image=np.empty((rows//factor,columns//factor,3),dtype=np.uint8)
+
+    #rows of every band, a multiple of the factor
+    row_bytes=shape[1]*channels
+    band_rows=max(factor,(_band_megabytes<<20)//row_bytes//factor*factor)
+
+    for first_row in range(0,rows,band_rows):
+        last_row=min(rows,first_row+band_rows)
+        band=pixels[first_row:last_row,0:columns]
+
+        #INTER_AREA with an integer factor is the average of the blocks
+        if factor > 1:
+            band=cv2.resize(band,(columns//factor,(last_row-first_row)//factor),interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(band,conversion,dst=image[first_row//factor:last_row//factor])
+
+        #release the pages of the band, they are not read again
+        if hasattr(mmap,'MADV_DONTNEED'):
+            start=layout['offset']+first_row*row_bytes
+            aligned_start=start-start % mmap.PAGESIZE
+            mapped_file.madvise(mmap.MADV_DONTNEED,aligned_start,
+                                min(len(mapped_file),layout['offset']+last_row*row_bytes)-aligned_start)
+
+    return image
+
+#function to read an image at the smallest size that gives the same output.
+def read_reduced_image(imagepath,resize=False,horizontal_rotation=True,vertical_rotation=False,
+                    new_width=1980,new_height=1080,image_ratio=False,ratio_width=16,ratio_height=9):
+    """
+    @args
+    imagepath: path of the image.
+    The rest of the arguments are the same as in
+    videos_to_images_all_folders.image_transformation.
+
+    returns (image, cropped). image is the BGR image, like cv2.imread, or None
+    if it cannot be read. cropped is True if the image is already cropped to
+    ratio_width:ratio_height.
+    """
+    #uncompressed TIFF: read only the crop, reduced while it is read
+    layout=tiff_layout(imagepath)
+    if layout is not None:
+        rows, columns = layout['shape'][0], layout['shape'][1]
+        factor=1
+        if resize:
+            factor=reduction_factor(rows,columns,new_width,new_height,horizontal_rotation,
+                                    vertical_rotation,image_ratio,ratio_width,ratio_height)
+        if image_ratio:
+            rows, columns = ratio_cropping_window(rows,columns,ratio_width,ratio_height)
+
+        return read_mapped_tiff(imagepath,layout,rows,columns,factor), image_ratio
+
+    #JPEG: decode at 1/2, 1/4 or 1/8 of the size
+    size=jpeg_size(imagepath) if resize else None
+    if size is not None:
+        factor=reduction_factor(size[0],size[1],new_width,new_height,horizontal_rotation,
+                                vertical_rotation,image_ratio,ratio_width,ratio_height)
+        for scale in (8,4,2):
+            if factor >= scale:
+                return cv2.imread(imagepath,_reduced_flags[scale]), False
+
+    return cv2.imread(imagepath), False
+
+
+#function to reset the peak memory of this process (Linux 4.0 or later).
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs','w') as clear_refs:
+            clear_refs.write('5')
+    except (IOError,OSError):
+        pass
+
+#function to get the peak memory of this process since the last reset, in megabytes.
+def peak_rss_megabytes():
+    """
+    returns None if it is not known (e.g. not on Linux).
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024.0
+    except (IOError,OSError):
+        pass
+
+    return None
@@ -0,0 +1,61 @@
+# Importing all necessary libraries
+import os
+
+
+#Discovery of the videos and images of the fields. Every directory is read only
+#once with os.scandir, and the extension of every entry is matched against a set
+#of lowercase extensions, so ".MKV", ".Mp4" or ".JPG" are found without listing
+#the directory once per extension. The files are given back by generators, so
+#the processing of the first files starts before the scan of the directory ends.
+image_extensions = frozenset(['bmp', 'jpg', 'jpeg', 'png', 'tif', 'tiff', 'dng', 'webp'])
+video_extensions = frozenset(['mov', 'avi', 'mp4', 'mpg', 'mpeg', 'm4v', 'wmv', 'mkv'])
+
+
+#function to check the extension of a file name, ignoring the case.
+def has_extension(file_name,extensions):
+    """
+    @args
+    file_name: name or path of the file.
+    extensions: set of lowercase extensions without the dot, e.g. video_extensions.
+    """
+    return os.path.splitext(file_name)[1][1:].lower() in extensions
+
+#generator of the subdirectories of a directory (e.g. the dates of a field).
+def scan_directories(directory):
+    """
+    @args
+    directory: path of the directory.
+
+    yields the names of the subdirectories. The files in the directory are ignored.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                yield entry.name
+
+#generator of the media files of a directory.
+def scan_media_files(directory,extensions,sort=False):
+    """
+    @args
+    directory: path of the directory, e.g. ./<field>/<date>/videos
+    extensions: set of lowercase extensions without the dot, e.g. video_extensions.
+    sort (bool): whether the files are given in the order of their names, which is
+    the same on every machine. The whole directory is read before the first file.
+
+    yields the paths of the files with one of the extensions, in the order of the
+    directory. A directory that does not exist has no files.
+    """
+    try:
+        entries=os.scandir(directory)
+    except FileNotFoundError:
+        print ('The directory %s does not exist; skipping it' %str(directory))
+        return
+
+    with entries:
+        if sort:
+            entries=sorted(entries,key=lambda entry: entry.name)
+
+        for entry in entries:
+            #is_file uses the type given by scandir, without another stat on most systems
+            if has_extension(entry.name,extensions) and entry.is_file():
+                yield os.path.join(directory,entry.name)
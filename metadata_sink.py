@@ -0,0 +1,182 @@
+# Importing all necessary libraries
+import os
+import json
+import threading
+
+
+#Metadata of the saved frames and images. Every saved output gets one JSON line,
+#written as soon as the output is saved, e.g.:
+#   {"source": "./f1/d1/videos/a.mp4", "frame": 30, "timestamp": 1.0,
+#    "output": "./f1_1920_1080/d1/videos/f1_d1_v_0_1.png",
+#    "all_output": "./all_1920_1080/f1_d1_v_0_1.png", "width": 1920, "height": 1080,
+#    "parameters": {...}, "field": "f1", "date": "d1", "video": "a.mp4"}
+#Nothing is kept in memory, so a crash only loses the outputs being written, and
+#several processes can append to the same file. MetadataIndex reads the file
+#back and finds the records of a field, date or video without parsing the rest.
+
+
+class MetadataSink:
+    """
+    Append-only JSON Lines file of metadata records. It can be used from several
+    threads of the same process, and several processes can append to the same file.
+    @args
+    metadata_path: path of the JSON Lines file.
+    """
+
+    def __init__(self,metadata_path):
+        self.metadata_path=metadata_path
+        self.lock=threading.Lock()
+        self.descriptor=os.open(metadata_path,os.O_WRONLY|os.O_APPEND|os.O_CREAT,0o644)
+
+    #function to add a record.
+    def record(self,**fields):
+        """
+        @args
+        fields: fields of the record. They must be serializable to JSON.
+        """
+        #one write per line, so the lines of several processes do not mix.
+        line=(json.dumps(fields,sort_keys=True)+'\n').encode('utf-8')
+
+        with self.lock:
+            os.write(self.descriptor,line)
+
+    def close(self):
+        with self.lock:
+            if self.descriptor is not None:
+                os.close(self.descriptor)
+                self.descriptor=None
+
+
+#sinks already opened in this process, shared by every video or image of a worker.
+_open_sinks = {}
+_open_sinks_lock = threading.Lock()
+
+
+#function to open (or get the already opened) sink of a file.
+def open_metadata_sink(metadata_path):
+    """
+    @args
+    metadata_path: path of the JSON Lines file.
+    """
+    key=os.path.abspath(metadata_path)
+
+    with _open_sinks_lock:
+        sink=_open_sinks.get(key)
+        if sink is None:
+            sink=MetadataSink(metadata_path)
+            _open_sinks[key]=sink
+
+    return sink
+
+
+class JsonObjectWriter:
+    """
+    JSON object written to a file one entry at a time, so the entries are not
+    kept in memory. The file is a valid JSON object once it is closed.
+    @args
+    json_path: path of the JSON file.
+    """
+
+    def __init__(self,json_path):
+        self.json_path=json_path
+        self.entries=0
+        self.json_file=open(json_path,'w')
+        self.json_file.write('{')
+
+    #function to add an entry. The keys must be unique.
+    def add(self,key,value):
+        """
+        @args
+        key: key of the entry.
+        value: value of the entry, serializable to JSON.
+        """
+        if self.entries:
+            self.json_file.write(', ')
+        self.json_file.write(json.dumps(str(key))+': '+json.dumps(value))
+        self.entries+=1
+
+    def close(self):
+        if self.json_file is not None:
+            self.json_file.write('}')
+            self.json_file.close()
+            self.json_file=None
+
+
+class MetadataIndex:
+    """
+    Lookup of the records of a metadata file by field, date and video. The file
+    is read once, and only the position of every record is kept in memory. If an
+    output was recorded more than once (e.g. a video resumed after a crash), the
+    last record is used.
+    @args
+    metadata_path: path of the JSON Lines file.
+    """
+
+    #fields of the records that can be looked up
+    lookup_fields = ('field', 'date', 'video')
+
+    def __init__(self,metadata_path):
+        self.metadata_path=metadata_path
+        self.read_bytes=0
+
+        #output -> position of its last record in the file
+        self.positions={}
+
+        #lookup field -> value -> list of outputs
+        self.outputs={lookup_field:{} for lookup_field in self.lookup_fields}
+
+        self.refresh()
+
+    #function to read the records appended since the last time.
+    def refresh(self):
+        if not os.path.exists(self.metadata_path):
+            return
+
+        with open(self.metadata_path,'rb') as metadata_file:
+            metadata_file.seek(self.read_bytes)
+            while(True):
+                position=metadata_file.tell()
+                line=metadata_file.readline()
+
+                #a line being written is read the next time
+                if not line.endswith(b'\n'):
+                    break
+
+                self.read_bytes+=len(line)
+                record=json.loads(line)
+
+                if record['output'] not in self.positions:
+                    for lookup_field in self.lookup_fields:
+                        if record.get(lookup_field) is not None:
+                            self.outputs[lookup_field].setdefault(record[lookup_field],[]).append(record['output'])
+                self.positions[record['output']]=position
+
+    #generator of the records with the given field, date and video.
+    def lookup(self,field=None,date=None,video=None):
+        """
+        @args
+        field: name of the field, or None for any field.
+        date: name of the date folder, or None for any date.
+        video: name of the video file, or None for any video (and the images).
+
+        yields the records, in the order they were first saved.
+        """
+        conditions={lookup_field:value for lookup_field, value in
+                    zip(self.lookup_fields,(field,date,video)) if value is not None}
+
+        #start from the shortest list of outputs, and check the other conditions
+        if conditions:
+            outputs=min((self.outputs[lookup_field].get(value,[]) for lookup_field, value in conditions.items()),key=len)
+        else:
+            outputs=list(self.positions)
+
+        with open(self.metadata_path,'rb') as metadata_file:
+            for output in outputs:
+                metadata_file.seek(self.positions[output])
+                record=json.loads(metadata_file.readline())
+
+                if all(record.get(lookup_field) == value for lookup_field, value in conditions.items()):
+                    yield record
+
+    def __len__(self):
+        return len(self.positions)
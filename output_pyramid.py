@@ -0,0 +1,91 @@
+# Importing all necessary libraries
+import cv2
+import time
+from transform_planner import ratio_cropping_window
+
+
+#Several output resolutions from a single decode. Every frame or image is
+#transformed once to the main resolution (--reshaped_width, --reshaped_height),
+#and every other level of the pyramid is made by downscaling the smallest level
+#already made that is at least as large, e.g. 1920x1080 -> 1280x720 -> 640x360.
+#A level can also be cropped to its own ratio before it is resized; the cropped
+#levels are not used to make the others. The levels keep the orientation of the
+#main output.
+
+
+#function to parse the levels of the pyramid given in the command.
+def parse_pyramid_levels(text):
+    """
+    @args
+    text: levels separated by spaces. Every level is <width>x<height>, or
+    <width>x<height>:<ratio width>:<ratio height> to crop it to that ratio first,
+    e.g. '1280x720 640x360 480x360:4:3'.
+
+    returns a list of dictionaries with 'new_width', 'new_height', 'ratio_width'
+    and 'ratio_height' (None when the level is not cropped).
+    """
+    levels=[]
+
+    for level_text in str(text or '').split():
+        try:
+            parts=level_text.split(':')
+            new_width, new_height = [int(value) for value in parts[0].lower().split('x')]
+            ratio_width, ratio_height = [int(value) for value in parts[1:]] if len(parts) > 1 else (None,None)
+        except ValueError:
+            raise ValueError('the pyramid levels must be <width>x<height>[:<ratio width>:<ratio height>], not %s' %str(level_text))
+
+        if new_width < 1 or new_height < 1 or (ratio_width is not None and (ratio_width < 1 or ratio_height < 1)):
+            raise ValueError('the sizes and ratios of the pyramid levels must be positive, not %s' %str(level_text))
+
+        levels.append({'new_width':new_width,'new_height':new_height,
+                        'ratio_width':ratio_width,'ratio_height':ratio_height})
+
+    return levels
+
+#function to get the size of a level once it is cropped.
+def _cropped_size(image,level):
+    if level['ratio_width'] is None:
+        return image.shape[0], image.shape[1]
+    return ratio_cropping_window(image.shape[0],image.shape[1],level['ratio_width'],level['ratio_height'])
+
+#function to make the levels of the pyramid from the main output.
+def pyramid_level_images(image,levels,profiler=None):
+    """
+    @args
+    image: main output image (already cropped, rotated and resized).
+    levels: list of dictionaries given by parse_pyramid_levels. They can have
+    other keys (e.g. the output folder).
+    profiler: if given, StageProfiler where the time of every crop and resize is added.
+
+    returns the list of images of the levels, in the order of levels.
+    """
+    level_images=[None]*len(levels)
+
+    #images that can be downscaled to make the next levels
+    sources=[image]
+
+    #the largest levels first, so every level is made from the previous one
+    for level_index in sorted(range(len(levels)),key=lambda index: levels[index]['new_width']*levels[index]['new_height'],
+                            reverse=True):
+        level=levels[level_index]
+
+        #the smallest source that does not need upscaling, or the main output
+        source=image
+        for candidate in sources:
+            rows, columns = _cropped_size(candidate,level)
+            if rows >= level['new_height'] and columns >= level['new_width'] and candidate.size < source.size:
+                source=candidate
+
+        if profiler is not None:
+            start=time.perf_counter()
+        rows, columns = _cropped_size(source,level)
+        level_image=cv2.resize(source[0:rows,0:columns],(level['new_width'],level['new_height']),
+                                interpolation=cv2.INTER_AREA)
+        if profiler is not None:
+            profiler.add('resize',time.perf_counter()-start)
+
+        level_images[level_index]=level_image
+        if level['ratio_width'] is None:
+            sources.append(level_image)
+
+    return level_images
@@ -0,0 +1,280 @@
+# Importing all necessary libraries
+import os
+import fcntl
+import threading
+
+
+#Perceptual hash index of the images saved in the "all" folder. Every frame or
+#image gets a 64 bits perceptual hash (dHash or pHash), and it is only saved if
+#there is no other hash in the index at a Hamming distance lower or equal than
+#max_distance.
+#
+#The lookup uses multi-index hashing: the 64 bits are split in max_distance+1
+#chunks. If two hashes are at distance <= max_distance, at least one of their
+#chunks is identical (pigeonhole principle), so only the hashes sharing a chunk
+#with the new one are compared. Each lookup is a few dictionary accesses, even
+#with millions of hashes in the index.
+#
+#The index is saved as a text file with one "<hash in hex> <source>" line per
+#hash. The file is only appended, so several processes can share it. Every
+#check holds a lock on the file (fcntl) and first reads the hashes appended by
+#the other processes, so two workers never both keep a near-duplicate.
+#Every process keeps a copy of the whole index in memory: with millions of
+#hashes, each worker of the pool needs a few hundred MB for it.
+#OpenCV and numpy are only imported by the functions that hash images.
+hash_methods = ['dhash', 'phash']
+
+
+#function to get the difference hash of an image.
+def dhash(image):
+    """
+    @args
+    image: image array
+
+    returns the hash as a 64 bits integer.
+    """
+    import numpy as np
+    import cv2
+
+    small_image=cv2.resize(image,(9,8),interpolation=cv2.INTER_AREA)
+    if small_image.ndim == 3:
+        small_image=cv2.cvtColor(small_image,cv2.COLOR_BGR2GRAY)
+
+    #every bit compares a pixel with the pixel on its right
+    bits=(small_image[:,1:] > small_image[:,:-1]).flatten()
+
+    return int(np.packbits(bits).view('>u8')[0])
+
+#function to get the DCT hash of an image.
+def phash(image):
+    """
+    @args
+    image: image array
+
+    returns the hash as a 64 bits integer.
+    """
+    import numpy as np
+    import cv2
+
+    small_image=cv2.resize(image,(32,32),interpolation=cv2.INTER_AREA)
+    if small_image.ndim == 3:
+        small_image=cv2.cvtColor(small_image,cv2.COLOR_BGR2GRAY)
+
+    #low frequencies of the image compared with their median
+    frequencies=cv2.dct(small_image.astype(np.float32))[0:8,0:8].flatten()
+    bits=frequencies > np.median(frequencies[1:])
+
+    return int(np.packbits(bits).view('>u8')[0])
+
+#function to get the hash of an image independently of its orientation.
+def image_hash(image,hash_method='dhash'):
+    """
+    @args
+    image: image array
+    hash_method: 'dhash' or 'phash'.
+
+    Vertical images are hashed as if they were rotated to a horizontal orientation,
+    so the same scene saved with both orientations gets the same hash.
+    """
+    import cv2
+
+    if image.shape[0] > image.shape[1]:
+        #rotate a small copy instead of the full image
+        image=cv2.resize(image,(64,64*image.shape[0]//image.shape[1]),interpolation=cv2.INTER_AREA)
+        image=cv2.rotate(image,cv2.ROTATE_90_CLOCKWISE)
+
+    if hash_method == 'phash':
+        return phash(image)
+    return dhash(image)
+
+#function to count the different bits of two hashes.
+def hamming_distance(first_hash,second_hash):
+    """
+    @args
+    first_hash: 64 bits integer.
+    second_hash: 64 bits integer.
+    """
+    return bin(first_hash ^ second_hash).count('1')
+
+
+class PerceptualHashIndex:
+    """
+    Index of perceptual hashes with fast near-duplicate lookup. It can be used
+    from several threads of the same process.
+    @args
+    index_path: path of the text file where the hashes are saved. None keeps the
+    index only in memory.
+    max_distance: maximum Hamming distance between two near-duplicates (0-63).
+    """
+
+    def __init__(self,index_path=None,max_distance=4):
+        self.index_path=index_path
+        self.max_distance=int(max_distance)
+        self.lock=threading.Lock()
+        self.sources={}
+        self.read_bytes=0
+
+        #descriptor where the hashes are appended and the file is locked
+        self.descriptor=None
+        if index_path is not None:
+            self.descriptor=os.open(index_path,os.O_WRONLY|os.O_APPEND|os.O_CREAT,0o644)
+
+        #split the 64 bits in max_distance+1 chunks
+        chunks=min(self.max_distance+1,64)
+        chunk_bits=[64//chunks+(1 if chunk < 64 % chunks else 0) for chunk in range(chunks)]
+        self.chunk_masks=[]
+        shift=0
+        for bits in chunk_bits:
+            self.chunk_masks.append((shift,(1<<bits)-1))
+            shift+=bits
+
+        #one dictionary per chunk: chunk value -> list of hashes
+        self.buckets=[{} for chunk in range(chunks)]
+
+        self.refresh()
+
+    #function to read the hashes added to the file by other processes.
+    def refresh(self):
+        if self.index_path is None:
+            return
+
+        with self.lock:
+            self._read_new_hashes()
+
+    def _read_new_hashes(self):
+        #the size is checked first, the file is only read when it grew
+        if os.fstat(self.descriptor).st_size <= self.read_bytes:
+            return
+
+        with open(self.index_path,'rb') as index_file:
+            index_file.seek(self.read_bytes)
+            for line in index_file:
+                #a line being written by another process is read the next time
+                if not line.endswith(b'\n'):
+                    break
+
+                self.read_bytes+=len(line)
+                fields=line.decode('utf-8').rstrip('\n').split(' ',1)
+                self._add(int(fields[0],16),fields[1] if len(fields) > 1 else '')
+
+    #function to add a hash to the dictionaries
+    def _add(self,image_hash_value,source):
+        if image_hash_value in self.sources:
+            return
+
+        self.sources[image_hash_value]=source
+        for bucket, (shift, mask) in zip(self.buckets,self.chunk_masks):
+            bucket.setdefault((image_hash_value>>shift) & mask,[]).append(image_hash_value)
+
+    #function to find a near-duplicate of a hash
+    def _find(self,image_hash_value):
+        if image_hash_value in self.sources:
+            return image_hash_value
+
+        for bucket, (shift, mask) in zip(self.buckets,self.chunk_masks):
+            for candidate in bucket.get((image_hash_value>>shift) & mask,()):
+                if hamming_distance(candidate,image_hash_value) <= self.max_distance:
+                    return candidate
+
+        return None
+
+    #function to get the source of the near-duplicate of a hash, if there is one.
+    def find_duplicate(self,image_hash_value):
+        """
+        @args
+        image_hash_value: 64 bits integer.
+        """
+        with self.lock:
+            duplicate=self._find(image_hash_value)
+            return None if duplicate is None else self.sources[duplicate]
+
+    #function to add a hash unless there is a near-duplicate in the index.
+    def check_and_add(self,image_hash_value,source):
+        """
+        @args
+        image_hash_value: 64 bits integer.
+        source: description of the image (e.g. path of the video and frame number).
+
+        returns the source of the near-duplicate, or None if the hash was added.
+        """
+        with self.lock:
+            if self.index_path is None:
+                duplicate=self._find(image_hash_value)
+                if duplicate is not None:
+                    return self.sources[duplicate]
+                self._add(image_hash_value,source)
+                return None
+
+            #the hashes of the other processes are read and the new one is
+            #written while holding the lock of the file, so the check and the
+            #write are atomic between processes.
+            fcntl.lockf(self.descriptor,fcntl.LOCK_EX)
+            try:
+                self._read_new_hashes()
+
+                duplicate=self._find(image_hash_value)
+                if duplicate is not None:
+                    return self.sources[duplicate]
+
+                self._add(image_hash_value,source)
+
+                #our own line is not read again, unless a line was left half read
+                line=('%016x %s\n' %(image_hash_value,str(source).replace('\n',' '))).encode('utf-8')
+                read_to_end=self.read_bytes == os.fstat(self.descriptor).st_size
+                os.write(self.descriptor,line)
+                if read_to_end:
+                    self.read_bytes+=len(line)
+            finally:
+                fcntl.lockf(self.descriptor,fcntl.LOCK_UN)
+
+        return None
+
+    def __len__(self):
+        return len(self.sources)
+
+
+#indexes already opened in this process, so every video or image of a worker
+#does not read the whole file again.
+_open_indexes = {}
+_open_indexes_lock = threading.Lock()
+
+
+#function to open (or get the already opened) index of a file.
+def open_hash_index(index_path,max_distance=4):
+    """
+    @args
+    index_path: path of the text file where the hashes are saved.
+    max_distance: maximum Hamming distance between two near-duplicates.
+    """
+    key=(os.path.abspath(index_path),int(max_distance))
+
+    with _open_indexes_lock:
+        hash_index=_open_indexes.get(key)
+        if hash_index is None:
+            hash_index=PerceptualHashIndex(index_path,max_distance)
+            _open_indexes[key]=hash_index
+            return hash_index
+
+    #read the hashes added by other processes since the last time
+    hash_index.refresh()
+
+    return hash_index
+
+#generator that discards the frames with a near-duplicate in the index.
+def near_duplicate_filter(frames,hash_index,source_name,hash_method='dhash'):
+    """
+    @args
+    frames: iterable of (frame index, frame array), e.g. read_video_frames.
+    hash_index: PerceptualHashIndex where the hashes are checked and added.
+    source_name: name of the video, saved in the index with the frame index.
+    hash_method: 'dhash' or 'phash'.
+
+    yields (frame index, frame array) for the frames without near-duplicate.
+    """
+    for currentframe, frame in frames:
+        source=str(source_name)+':'+str(currentframe)
+        duplicate=hash_index.check_and_add(image_hash(frame,hash_method),source)
+
+        #a frame found again when resuming an interrupted video is not a duplicate.
+        if duplicate is None or duplicate == source:
+            yield currentframe, frame
@@ -0,0 +1,156 @@
+# Importing all necessary libraries
+import os
+import json
+import hashlib
+import threading
+
+
+#The manifest keeps track of every video or image already processed, so a new
+#run only processes the new or modified sources. Each line of the manifest is a
+#JSON record with:
+#   source: path of the video or image.
+#   size and mtime, or size and sha1 if checksums are used: identity of the source file.
+#   parameters_key: hash of the processing parameters (fpsinterval, resolution, ...)
+#   plus any other information about the outputs (e.g. number of frames).
+#The file is only appended, so a crash never corrupts the records already
+#written. The last record of a source is the valid one.
+
+
+#function to get the hash of the processing parameters.
+def parameters_key(parameters):
+    """
+    @args
+    parameters: dictionary with the parameters used to process a source.
+    """
+    serialized_parameters=json.dumps(parameters,sort_keys=True)
+    return hashlib.sha1(serialized_parameters.encode('utf-8')).hexdigest()
+
+#function to get the identity of a source file.
+def source_signature(path,use_checksum=False):
+    """
+    @args
+    path: path of the video or image.
+    use_checksum (bool): whether the sha1 of the content is used instead of the
+    modification time. Slower, but a copied or touched file is not processed again.
+    """
+    stat=os.stat(path)
+    if not use_checksum:
+        return {'size':stat.st_size,'mtime':stat.st_mtime_ns}
+
+    checksum=hashlib.sha1()
+    with open(path,'rb') as source_file:
+        for block in iter(lambda: source_file.read(1<<20),b''):
+            checksum.update(block)
+
+    return {'size':stat.st_size,'sha1':checksum.hexdigest()}
+
+#function to read a small JSON file describing the progress of a video.
+def read_checkpoint(checkpoint_path):
+    """
+    @args
+    checkpoint_path: path of the checkpoint file.
+
+    returns the checkpoint dictionary or None if there is no valid checkpoint.
+    """
+    try:
+        with open(checkpoint_path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except (OSError,ValueError):
+        return None
+
+#function to save the progress of a video. The file is replaced atomically.
+def write_checkpoint(checkpoint_path,checkpoint):
+    """
+    @args
+    checkpoint_path: path of the checkpoint file.
+    checkpoint: dictionary with the progress.
+    """
+    temporary_path=checkpoint_path+'.tmp'
+    with open(temporary_path,'w') as checkpoint_file:
+        json.dump(checkpoint,checkpoint_file)
+    os.replace(temporary_path,checkpoint_path)
+
+#function to remove the checkpoint of a finished video.
+def remove_checkpoint(checkpoint_path):
+    """
+    @args
+    checkpoint_path: path of the checkpoint file.
+    """
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+class ProcessingManifest:
+    """
+    Append-only record of the processed sources. It can be used from several
+    threads of the same process.
+    @args
+    manifest_path: path of the manifest file (JSON lines).
+    use_checksum (bool): whether the sources are identified by their size and
+    sha1 instead of their size and modification time.
+    """
+
+    def __init__(self,manifest_path,use_checksum=False):
+        self.manifest_path=manifest_path
+        self.use_checksum=use_checksum
+        self.records={}
+        self.lock=threading.Lock()
+
+        #read the records of the previous runs. A line cut by a crash is ignored.
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                for line in manifest_file:
+                    try:
+                        record=json.loads(line)
+                    except ValueError:
+                        continue
+                    self.records[record['source']]=record
+
+        self.manifest_file=open(manifest_path,'a')
+
+    #function to check whether a source was already processed with the same parameters.
+    def processed_record(self,source,parameters):
+        """
+        @args
+        source: path of the video or image.
+        parameters: dictionary with the processing parameters.
+
+        returns the record of the previous run, or None if the source has to be processed.
+        """
+        record=self.records.get(source)
+
+        if record is None or record['parameters_key'] != parameters_key(parameters):
+            return None
+
+        #a file with another size changed, there is no need to read it
+        if record.get('size') != os.path.getsize(source):
+            return None
+
+        #compare the identity of the file
+        signature=source_signature(source,use_checksum=self.use_checksum)
+        for key, value in signature.items():
+            if record.get(key) != value:
+                return None
+
+        return record
+
+    #function to add the record of a processed source.
+    def record(self,source,parameters,**information):
+        """
+        @args
+        source: path of the video or image.
+        parameters: dictionary with the processing parameters.
+        information: any other value saved in the record (output name, frames...).
+        """
+        record={'source':source,'parameters_key':parameters_key(parameters)}
+        record.update(source_signature(source,use_checksum=self.use_checksum))
+        record.update(information)
+
+        with self.lock:
+            self.records[source]=record
+            self.manifest_file.write(json.dumps(record)+'\n')
+            self.manifest_file.flush()
+
+    #function to close the manifest file.
+    def close(self):
+        self.manifest_file.close()
@@ -0,0 +1,256 @@
+# Importing all necessary libraries
+import sys
+import time
+import math
+import json
+import threading
+
+
+#Instrumentation of the extraction. Every stage of a frame or image (decode,
+#crop, rotate, resize, encode, write) is timed with time.perf_counter and added
+#to a histogram with logarithmic buckets (20 per decade, about 12% wide). The
+#histograms of several videos, fields or processes are merged by adding the
+#buckets, so the percentiles of a whole field are computed without keeping
+#every measure in memory.
+stages = ['decode', 'crop', 'rotate', 'resize', 'encode', 'write']
+
+#first bucket (1 microsecond) and buckets per decade of the histograms
+_smallest_time = 1e-6
+_buckets_per_decade = 20
+
+
+#function to get the bucket of a duration
+def _bucket(seconds):
+    if seconds <= _smallest_time:
+        return 0
+    return int(math.ceil(math.log10(seconds/_smallest_time)*_buckets_per_decade))
+
+#function to get the upper bound of a bucket in seconds
+def _bucket_time(bucket):
+    return _smallest_time*10**(float(bucket)/_buckets_per_decade)
+
+
+class StageProfiler:
+    """
+    Timings of the stages of the frames or images. It can be used from several
+    threads of the same process (e.g. the threads of the pipeline).
+    """
+
+    def __init__(self):
+        self.lock=threading.Lock()
+        #stage -> {'count', 'seconds', 'max', 'buckets': {bucket: count}}
+        self.timings={}
+
+    #function to add a measure of a stage.
+    def add(self,stage,seconds,count=1):
+        """
+        @args
+        stage: name of the stage, e.g. 'resize'.
+        seconds: duration of the stage.
+        count: number of frames in the measure (e.g. a batch). Every frame is
+        counted with seconds/count.
+        """
+        frame_seconds=seconds/count
+
+        with self.lock:
+            timing=self.timings.get(stage)
+            if timing is None:
+                timing={'count':0,'seconds':0.0,'max':0.0,'buckets':{}}
+                self.timings[stage]=timing
+
+            timing['count']+=count
+            timing['seconds']+=seconds
+            timing['max']=max(timing['max'],frame_seconds)
+            bucket=_bucket(frame_seconds)
+            timing['buckets'][bucket]=timing['buckets'].get(bucket,0)+count
+
+    #generator that times how long every item of an iterable takes to be ready.
+    def timed_iterator(self,stage,iterable):
+        """
+        @args
+        stage: name of the stage, e.g. 'decode'.
+        iterable: e.g. the generator of the frames of a video.
+        """
+        iterator=iter(iterable)
+        while(True):
+            start=time.perf_counter()
+            try:
+                item=next(iterator)
+            except StopIteration:
+                return
+            self.add(stage,time.perf_counter()-start)
+            yield item
+
+    #function to add the timings of another profiler (e.g. from another process).
+    def merge(self,timings):
+        """
+        @args
+        timings: dictionary given by to_dict.
+        """
+        with self.lock:
+            for stage, other in timings.items():
+                timing=self.timings.setdefault(stage,{'count':0,'seconds':0.0,'max':0.0,'buckets':{}})
+                timing['count']+=other['count']
+                timing['seconds']+=other['seconds']
+                timing['max']=max(timing['max'],other['max'])
+                for bucket, count in other['buckets'].items():
+                    timing['buckets'][int(bucket)]=timing['buckets'].get(int(bucket),0)+count
+
+    #function to get the timings as a dictionary that can be saved in JSON.
+    def to_dict(self):
+        with self.lock:
+            return {stage:{'count':timing['count'],'seconds':timing['seconds'],'max':timing['max'],
+                            'buckets':{str(bucket):count for bucket, count in timing['buckets'].items()}}
+                    for stage, timing in self.timings.items()}
+
+    #function to get the statistics of every stage.
+    def summary(self):
+        """
+        returns a dictionary stage -> {count, seconds, mean_ms, p50_ms, p95_ms,
+        p99_ms, max_ms, frames_per_second}. frames_per_second is the throughput of
+        the stage alone.
+        """
+        summary={}
+
+        with self.lock:
+            for stage in sorted(self.timings,key=lambda stage: stages.index(stage) if stage in stages else len(stages)):
+                timing=self.timings[stage]
+                summary[stage]={'count':timing['count'],'seconds':timing['seconds'],
+                                'mean_ms':1000.0*timing['seconds']/timing['count'] if timing['count'] else 0.0,
+                                'p50_ms':1000.0*self._percentile(timing,0.50),
+                                'p95_ms':1000.0*self._percentile(timing,0.95),
+                                'p99_ms':1000.0*self._percentile(timing,0.99),
+                                'max_ms':1000.0*timing['max'],
+                                'frames_per_second':timing['count']/timing['seconds'] if timing['seconds'] > 0 else 0.0}
+
+        return summary
+
+    #function to get a percentile of a stage from its histogram
+    def _percentile(self,timing,fraction):
+        target=fraction*timing['count']
+        accumulated=0
+        for bucket in sorted(timing['buckets']):
+            accumulated+=timing['buckets'][bucket]
+            if accumulated >= target:
+                #the bucket bound can be larger than the slowest measure
+                return min(_bucket_time(bucket),timing['max'])
+        return timing['max']
+
+
+class ProgressBar:
+    """
+    One line with the progress of the extraction, redrawn at most every
+    refresh_seconds. It replaces the print of every saved frame or image.
+    It can be updated from several threads.
+    @args
+    unit: name of the counted items, e.g. 'frames'.
+    refresh_seconds: minimum time between two redraws.
+    stream: where the line is written.
+    """
+
+    def __init__(self,unit='frames',refresh_seconds=0.5,stream=None):
+        self.unit=unit
+        self.refresh_seconds=refresh_seconds
+        self.stream=stream if stream is not None else sys.stderr
+        self.lock=threading.Lock()
+        self.count=0
+        self.description=''
+        self.start=time.perf_counter()
+        self.last_draw=0.0
+
+    #function to count new items.
+    def update(self,count=1,description=None):
+        """
+        @args
+        count: number of new items.
+        description: if given, text shown before the counter (e.g. the video).
+        """
+        with self.lock:
+            self.count+=count
+            if description is not None:
+                self.description=description
+
+            now=time.perf_counter()
+            if now-self.last_draw >= self.refresh_seconds:
+                self.last_draw=now
+                self._draw(now)
+
+    def _draw(self,now):
+        elapsed=now-self.start
+        rate=self.count/elapsed if elapsed > 0 else 0.0
+        line='%s %d %s | %.1f %s/s | %02d:%02d' %(self.description,self.count,self.unit,rate,
+                                                self.unit,int(elapsed)//60,int(elapsed)%60)
+        self.stream.write('\r'+line[-120:].ljust(120))
+        self.stream.flush()
+
+    #function to draw the final state and end the line.
+    def close(self):
+        with self.lock:
+            self._draw(time.perf_counter())
+            self.stream.write('\n')
+            self.stream.flush()
+
+
+#function to merge the profiles of the videos or images of a run into a report.
+def profile_report(profile_path,report_path=None,elapsed_seconds=None):
+    """
+    @args
+    profile_path: JSON Lines file with one line per video (or per date of images)
+    with the fields 'frames', 'seconds', 'timings' (StageProfiler.to_dict) and
+    optionally 'field', 'date', 'video' and 'source'.
+    report_path: if given, the report is saved in this JSON file.
+    elapsed_seconds: wall time of the whole run, used for the total frames/sec.
+
+    returns a dictionary with the statistics of every source, every field and
+    the whole run.
+    """
+    sources=[]
+    fields={}
+    total=StageProfiler()
+    total_frames=0
+    total_seconds=0.0
+
+    with open(profile_path,'r') as profile_file:
+        for line in profile_file:
+            if not line.endswith('\n'):
+                break
+            profile=json.loads(line)
+
+            source_profiler=StageProfiler()
+            source_profiler.merge(profile['timings'])
+            total.merge(profile['timings'])
+
+            #wall time of the source, not the sum of the stages
+            sources.append({'source':profile.get('source'),'field':profile.get('field'),
+                            'date':profile.get('date'),'video':profile.get('video'),
+                            'frames':profile['frames'],'seconds':profile['seconds'],
+                            'frames_per_second':profile['frames']/profile['seconds'] if profile['seconds'] > 0 else 0.0,
+                            'stages':source_profiler.summary()})
+
+            field=fields.setdefault(profile.get('field'),{'profiler':StageProfiler(),'frames':0,'seconds':0.0})
+            field['profiler'].merge(profile['timings'])
+            field['frames']+=profile['frames']
+            field['seconds']+=profile['seconds']
+
+            total_frames+=profile['frames']
+            total_seconds+=profile['seconds']
+
+    #with several workers the sources overlap, so the wall time of the run is used
+    if elapsed_seconds is None:
+        elapsed_seconds=total_seconds
+
+    report={'sources':sources,
+            'fields':{str(field_name):{'frames':field['frames'],'seconds':field['seconds'],
+                                    'frames_per_second':field['frames']/field['seconds'] if field['seconds'] > 0 else 0.0,
+                                    'stages':field['profiler'].summary()}
+                    for field_name, field in fields.items()},
+            'total':{'frames':total_frames,'seconds':elapsed_seconds,
+                    'frames_per_second':total_frames/elapsed_seconds if elapsed_seconds > 0 else 0.0,
+                    'stages':total.summary()}}
+
+    if report_path is not None:
+        f = open(report_path,"w")
+        f.write(json.dumps(report,indent=2))
+        f.close()
+
+    return report
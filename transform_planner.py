@@ -0,0 +1,200 @@
+# Importing all necessary libraries
+import cv2
+import time
+
+
+#The crop, rotation and resizing of an image are planned once from the shape of
+#the image, instead of running each step on a full-size copy:
+#   - the crop is a view of the decoded image (no copy).
+#   - the image is resized before it is rotated when it is downscaled, so
+#     cv2.rotate only moves the small image.
+#   - the intermediate and output arrays can be preallocated and reused for
+#     every frame of a video.
+#The result has the same shape as running the steps one after another. A single
+#warpAffine is not used because it does not support INTER_AREA, which is the
+#interpolation used to downscale the images.
+
+
+#codes of cv2.rotate for each number of clockwise quarter turns
+_rotation_codes = {1:cv2.ROTATE_90_CLOCKWISE, 2:cv2.ROTATE_180, 3:cv2.ROTATE_90_COUNTERCLOCKWISE}
+
+
+#function to get the part of the image kept when cropping to a ratio.
+def ratio_cropping_window(height,width,ratio_width,ratio_height):
+    """
+    @args
+    height: height of the image.
+    width: width of the image.
+    ratio_width: proportion of the width e.g. 16
+    ratio_height: proportion of the height e.g. 9
+
+    returns (number of rows kept, number of columns kept). The kept part always
+    starts at the top left corner.
+    """
+    #orientation independent cropping
+    if width > height:
+        longest_side= width
+        shortest_side= height
+    else:
+        longest_side= height
+        shortest_side= width
+
+    #get the current width to height ratio.
+    current_ratio=float(float(longest_side)/float(shortest_side))
+
+    #Get the desired ratio
+    desired_ratio=float(float(ratio_width)/float(ratio_height))
+
+    #In the new image, we need to decrease the "advantage" of the shortest side over the longest side
+    if desired_ratio > current_ratio:
+        new_shortest_side=int(float((float(longest_side)*float(ratio_height))/float(ratio_width)))
+
+        if width > height:
+            return new_shortest_side, width
+        return height, new_shortest_side
+
+    #In the new image, we need to reduce the advantage of the longest side over the shortest side
+    elif desired_ratio < current_ratio:
+        new_longest_side=int(float((float(shortest_side)*float(ratio_width))/float(ratio_height)))
+
+        if width > height:
+            return height, new_longest_side
+        return new_longest_side, width
+
+    return height, width
+
+#function to count the clockwise quarter turns done by the rotation options.
+def orientation_rotations(height,width,horizontal_rotation=True,vertical_rotation=False):
+    """
+    @args
+    height: height of the image before the rotations.
+    width: width of the image before the rotations.
+    horizontal_rotation (bool): rotate vertical images to a horizontal orientation.
+    vertical_rotation (bool): rotate horizontal images to a vertical orientation.
+    """
+    rotations=0
+
+    if horizontal_rotation and height > width:
+        rotations+=1
+        height, width = width, height
+
+    if vertical_rotation and width > height:
+        rotations+=1
+
+    return rotations
+
+#function to plan the transformation of an image given its shape.
+def transformation_plan(height,width,resize=False,horizontal_rotation=True,vertical_rotation=False,
+                        new_width=1980,new_height=1080,image_ratio=False,ratio_width=16,
+                        ratio_height=9,rotate_before_resize=True):
+    """
+    @args
+    height: height of the decoded image.
+    width: width of the decoded image.
+    resize, horizontal_rotation, vertical_rotation, new_width, new_height, image_ratio,
+    ratio_width, ratio_height: same options as image_transformation.
+    rotate_before_resize (bool): order of the requested steps. True for images
+    (crop, rotate, resize), False for video frames (resize, rotate).
+
+    returns a dictionary with:
+        crop: (rows, columns) kept, or None.
+        steps: list of ('resize', (width, height)) and ('rotate', quarter turns) in
+        the order they are applied.
+        output_shape: (height, width) of the result.
+        input_shape: (height, width) of the image the plan was made for.
+    """
+    input_shape=(height,width)
+    crop=None
+    if image_ratio:
+        crop=ratio_cropping_window(height,width,ratio_width,ratio_height)
+        height, width = crop
+
+    #video frames: resize and then rotate the resized frame.
+    if not rotate_before_resize:
+        steps=[]
+        if resize:
+            steps.append(('resize',(int(new_width),int(new_height))))
+            height, width = int(new_height), int(new_width)
+
+        rotations=orientation_rotations(height,width,horizontal_rotation,vertical_rotation)
+        if rotations:
+            steps.append(('rotate',rotations))
+            if rotations % 2:
+                height, width = width, height
+
+        return {'crop':crop,'steps':steps,'output_shape':(height,width),'input_shape':input_shape}
+
+    #images: rotate the cropped image and then resize it. When the output is
+    #smaller in both sides, the same result (up to rounding) is obtained resizing
+    #to the rotated size first. INTER_AREA interpolates when upscaling a side, and
+    #then the order changes which pixels are sampled, so the order is kept.
+    rotations=orientation_rotations(height,width,horizontal_rotation,vertical_rotation)
+
+    if not resize:
+        steps=[('rotate',rotations)] if rotations else []
+        if rotations % 2:
+            height, width = width, height
+        return {'crop':crop,'steps':steps,'output_shape':(height,width),'input_shape':input_shape}
+
+    output_shape=(int(new_height),int(new_width))
+
+    #size of the image after the rotations, before resizing.
+    rotated_height, rotated_width = (width, height) if rotations % 2 else (height, width)
+    downscaling=int(new_height) <= rotated_height and int(new_width) <= rotated_width
+
+    if rotations == 0:
+        steps=[('resize',(int(new_width),int(new_height)))]
+    elif downscaling:
+        if rotations % 2:
+            steps=[('resize',(int(new_height),int(new_width))),('rotate',rotations)]
+        else:
+            steps=[('resize',(int(new_width),int(new_height))),('rotate',rotations)]
+    else:
+        steps=[('rotate',rotations),('resize',(int(new_width),int(new_height)))]
+
+    return {'crop':crop,'steps':steps,'output_shape':output_shape,'input_shape':input_shape}
+
+#function to apply a transformation plan.
+def apply_transformation_plan(image,plan,buffers=None,reuse_output=True,profiler=None):
+    """
+    @args
+    image: image array
+    plan: dictionary given by transformation_plan.
+    buffers: dictionary where the arrays of every step are kept to be reused with
+    the next image with the same plan. None allocates new arrays.
+    reuse_output (bool): whether the array returned can be reused with the next
+    image. It has to be False if the result is still used (e.g. by a writer
+    thread) when the next image is transformed.
+    profiler: if given, StageProfiler where the time of the crop and of every
+    step is added. See stage_profiler.
+    """
+    #the crop is a view, there is no copy.
+    if plan['crop'] is not None:
+        if profiler is not None:
+            start=time.perf_counter()
+        rows, columns = plan['crop']
+        image=image[0:rows,0:columns]
+        if profiler is not None:
+            profiler.add('crop',time.perf_counter()-start)
+
+    for step_index, (step, value) in enumerate(plan['steps']):
+        #get the array where the result of this step is written
+        destination=None
+        last_step=step_index == len(plan['steps'])-1
+        if buffers is not None and (reuse_output or not last_step):
+            destination=buffers.get(step_index)
+
+        if profiler is not None:
+            start=time.perf_counter()
+        if step == 'resize':
+            image=cv2.resize(image,value,dst=destination,interpolation=cv2.INTER_AREA)
+        else:
+            image=cv2.rotate(image,_rotation_codes[value],dst=destination)
+        if profiler is not None:
+            profiler.add(step,time.perf_counter()-start)
+
+        #keep the array for the next image
+        if buffers is not None and (reuse_output or not last_step):
+            buffers[step_index]=image
+
+    return image
@@ -0,0 +1,214 @@
+# Importing all necessary libraries
+import os
+import json
+import math
+import threading
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from transform_planner import transformation_plan
+from work_sharding import stable_path_key
+
+
+#Properties of the videos read before they are decoded, and the plan of the
+#extraction made from them:
+#- probe_video opens the container and reads the number of frames, the frame
+#  rate, the size of the decoded frames and the rotation of the container.
+#  OpenCV and FFmpeg rotate the frames with the rotation of the container, so
+#  the size given is the size of the rotated frames. It is the size decoded by
+#  OpenCV; the FFmpeg backends read the size again with ffprobe and only use
+#  this probe for the plan and the frame rate.
+#- VideoProbeCache keeps the probes in an append-only JSON Lines file, one line
+#  per video, e.g.:
+#     {"path": "f1/d1/videos/a.mp4", "size": 10485760, "mtime": 1700000000000000000,
+#      "probe": {"frame_count": 1800, "fps": 30.0, "width": 1920, "height": 1080,
+#                "rotation": 90, "duration": 60.0}}
+#  A video is probed again only if its size or modification time changed.
+#  A video that cannot be read or probed (e.g. corrupt, or removed after the
+#  scan) gets an unknown probe, with None values, and is extracted as without
+#  a probe; its own extraction fails, not the whole run.
+#- video_extraction_plan estimates the frames and bytes saved from every video,
+#  and the cost of decoding it, so the longest videos are sent first to the pool.
+
+
+#bytes of an encoded frame for every byte of the raw BGR frame. They are rough
+#averages of our field recordings with the default encoder options.
+compression_ratios = {'png':0.5, 'jpg':0.1, 'webp':0.08}
+
+
+#function to get the probe of a video whose properties are not known.
+def unknown_probe():
+    return {'frame_count':None,'fps':None,'width':None,'height':None,'rotation':None,'duration':None}
+
+#function to read the properties of a video from its container.
+def probe_video(videopath):
+    """
+    @args
+    videopath: path of the video.
+
+    returns a dictionary with 'frame_count', 'fps', 'width', 'height' (of the
+    decoded frames, after the rotation of the container), 'rotation' (clockwise
+    degrees in the container) and 'duration' (seconds). The values that are not
+    known are None.
+    """
+    cam = cv2.VideoCapture(videopath)
+
+    try:
+        if not cam.isOpened():
+            return unknown_probe()
+
+        frame_count=int(cam.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_rate=cam.get(cv2.CAP_PROP_FPS)
+        width=int(cam.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height=int(cam.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        rotation=int(cam.get(cv2.CAP_PROP_ORIENTATION_META)) % 360
+    finally:
+        cam.release()
+
+    #some containers do not report the number of frames or the frame rate
+    if frame_count <= 0:
+        frame_count=None
+    if not frame_rate or frame_rate != frame_rate or frame_rate <= 0:
+        frame_rate=None
+
+    return {'frame_count':frame_count,'fps':frame_rate,'width':width or None,'height':height or None,
+            'rotation':rotation,'duration':frame_count/frame_rate if frame_count and frame_rate else None}
+
+
+class VideoProbeCache:
+    """
+    Probes of the videos saved in a JSON Lines file. The file is read once, and
+    the new probes are appended to it, so several processes can share it.
+    @args
+    cache_path: path of the JSON Lines file.
+    """
+
+    def __init__(self,cache_path):
+        self.cache_path=cache_path
+        self.lock=threading.Lock()
+
+        #path -> (size, modification time, probe). The last line of a path is used.
+        self.probes={}
+
+        if os.path.exists(cache_path):
+            with open(cache_path) as cache_file:
+                for line in cache_file:
+                    #a line being written by another process is skipped
+                    try:
+                        record=json.loads(line)
+                    except ValueError:
+                        continue
+                    self.probes[record['path']]=(record['size'],record['mtime'],record['probe'])
+
+        self.descriptor=os.open(cache_path,os.O_WRONLY|os.O_APPEND|os.O_CREAT,0o644)
+
+    #function to get the probe of a video, probing it if it is not in the cache.
+    def probe(self,videopath):
+        """
+        @args
+        videopath: path of the video relative to the directory of the fields.
+        """
+        key=stable_path_key(videopath)
+
+        #the probes that fail are not saved, the video is probed again next time
+        try:
+            stat=os.stat(videopath)
+        except OSError as error:
+            print ('The video %s could not be probed: %s' %(str(videopath),repr(error)))
+            return unknown_probe()
+
+        with self.lock:
+            cached=self.probes.get(key)
+        if cached is not None and cached[:2] == (stat.st_size,stat.st_mtime_ns):
+            return cached[2]
+
+        try:
+            probe=probe_video(videopath)
+        except Exception as error:
+            print ('The video %s could not be probed: %s' %(str(videopath),repr(error)))
+            return unknown_probe()
+
+        #one write per line, so the lines of several processes do not mix.
+        line={'path':key,'size':stat.st_size,'mtime':stat.st_mtime_ns,'probe':probe}
+        with self.lock:
+            self.probes[key]=(stat.st_size,stat.st_mtime_ns,probe)
+            os.write(self.descriptor,(json.dumps(line,sort_keys=True)+'\n').encode('utf-8'))
+
+        return probe
+
+    #function to get the probes of many videos.
+    def probe_all(self,videopaths,threads=8):
+        """
+        @args
+        videopaths: list of paths of the videos.
+        threads: number of videos opened at the same time. Opening a container is
+        mostly waiting for the disk.
+
+        returns a dictionary path -> probe. The videos that cannot be probed get
+        unknown_probe().
+        """
+        with ThreadPoolExecutor(max_workers=max(1,threads)) as executor:
+            return dict(zip(videopaths,executor.map(self.probe,videopaths)))
+
+    def close(self):
+        with self.lock:
+            if self.descriptor is not None:
+                os.close(self.descriptor)
+                self.descriptor=None
+
+
+#function to estimate the extraction of a video from its probe.
+def video_extraction_plan(probe,framerate_extraction_interval,resize=False,horizontal_rotation=True,
+                        vertical_rotation=False,new_width=1980,new_height=1080,sampling='frames',
+                        sampling_seconds=1.0,image_format='png',pyramid_levels=None,copies=1):
+    """
+    @args
+    probe: dictionary given by probe_video.
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    resize, horizontal_rotation, vertical_rotation, new_width, new_height: see
+    videos_to_images_all_folders.frame_transformation.
+    sampling, sampling_seconds: see videos_to_images_all_folders.image_extraction_video.
+    With 'scene' sampling the frames are an upper bound.
+    image_format: format of the saved frames, used to estimate their size.
+    pyramid_levels: list of the levels of the pyramid. See output_pyramid.
+    copies: number of copies written of every frame (2 when the copy in the "all"
+    folder is a real copy).
+
+    returns a dictionary with 'frames' (kept frames), 'bytes' (estimated size of
+    the outputs), 'output_shape' (height, width) and 'cost' (pixels decoded, to
+    order the videos), or None values when the probe is not complete.
+    """
+    frame_count=probe.get('frame_count')
+    width, height = probe.get('width'), probe.get('height')
+
+    if not frame_count or not width or not height:
+        return {'frames':None,'bytes':None,'output_shape':None,'cost':None}
+
+    #the interval in frames depends on the frame rate of the video
+    if sampling == 'seconds':
+        framerate_extraction_interval=max(1,int(round((probe.get('fps') or 30.0)*float(sampling_seconds))))
+
+    kept_frames=int(math.ceil(frame_count/float(framerate_extraction_interval)))
+
+    output_shape=transformation_plan(height,width,resize=resize,horizontal_rotation=horizontal_rotation,
+                                    vertical_rotation=vertical_rotation,new_width=new_width,
+                                    new_height=new_height,rotate_before_resize=False)['output_shape']
+
+    frame_pixels=output_shape[0]*output_shape[1]
+    frame_pixels+=sum(level['new_width']*level['new_height'] for level in pyramid_levels or [])
+
+    return {'frames':kept_frames,
+            'bytes':int(kept_frames*frame_pixels*3*compression_ratios.get(image_format,1.0)*copies),
+            'output_shape':output_shape,'cost':frame_count*width*height}
+
+#function to order the videos so the longest ones start first.
+def longest_first(videopaths,plans):
+    """
+    @args
+    videopaths: list of paths of the videos.
+    plans: dictionary path -> plan given by video_extraction_plan.
+
+    returns the paths with the largest cost first. The videos without cost keep
+    their order, at the end. With a pool, the long videos do not start last and
+    leave the other workers waiting.
+    """
+    return sorted(videopaths,key=lambda videopath: -(plans[videopath]['cost'] or -1))
@@ -1,10 +1,17 @@
 # Importing all necessary libraries
-import numpy as np
-import cv2
 import os
 import argparse
-import ffmpeg
 import json
+import multiprocessing.util
+import shutil
+import threading
+import time
+from media_discovery import scan_directories, scan_media_files, image_extensions, video_extensions
+from metadata_sink import open_metadata_sink, JsonObjectWriter
+from stage_profiler import StageProfiler, ProgressBar, profile_report
+from processing_manifest import ProcessingManifest, parameters_key, read_checkpoint, write_checkpoint, remove_checkpoint
+from work_sharding import parse_shard, in_shard, stable_path_key, WorkQueue, process_owner, shard_part_path, merge_shard_dictionaries
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 
 #This code is made to run using the following structure:
@@ -35,6 +42,8 @@ def image_resizing(image,new_width,new_height):
     new_width: new width in the image
     new_height: new height in the image
     """
+    import cv2
+
     #set up the new dimension and resize
     dim=(int(new_width),int(new_height))
     resized_image=cv2.resize(image, dim, interpolation = cv2.INTER_AREA)
@@ -48,6 +57,8 @@ def horizontal_rotation_function(image):
     @args:
     image: image array
     """
+    import cv2
+
     #image dimensions
     height, width, color_channel = image.shape
 
@@ -66,6 +77,8 @@ def vertical_rotation_function(image):
     @args:
     image: image array
     """
+    import cv2
+
     #image dimensions
     height, width, color_channel = image.shape
 
@@ -85,55 +98,427 @@ def image_ratio_cropping(image,ratio_width,ratio_height):
     ratio_width: proportion of the width e.g. 16
     ratio_height: proportion of the height e.g. 9
     """
+    from transform_planner import ratio_cropping_window
 
     #image dimensions
     height, width, color_channel = image.shape
 
-    #orientation independent cropping
-    if width > height:
-        longest_side= width
-        shortest_side= height
-    else:
-        longest_side= height
-        shortest_side= width
+    #get the part of the image we keep and crop the image
+    new_height, new_width = ratio_cropping_window(height,width,ratio_width,ratio_height)
+    image=image[0:new_height,0:new_width]
+
+    #we have finished with the cropping. Then, return image
+    return image
+
+#The batch functions work on a N x H x W x C stack of frames or on a list of
+#frames with the same shape (e.g. frames of the same video). The orientation and
+#the crop are decided once for the whole batch, and the crop and rotations are
+#numpy views of the batch.
+
+#function to get the shape of the frames in a batch.
+def batch_frame_shape(frames):
+    """
+    @args
+    frames: N x H x W x C array or list of H x W x C arrays with the same shape.
+    """
+    import numpy as np
+
+    if isinstance(frames,np.ndarray):
+        return frames.shape[1:]
+    return frames[0].shape
+
+#function to resize a batch of frames
+def batch_image_resizing(frames,new_width,new_height,output=None):
+    """
+    @args
+    frames: N x H x W x C array or list of frames with the same shape.
+    new_width: new width in the frames
+    new_height: new height in the frames
+    output: N x new_height x new_width x C array reused to save the result. If it
+    is None or it has a different shape, a new array is created.
+    """
+    import numpy as np
+    import cv2
+
+    #set up the new dimension
+    dim=(int(new_width),int(new_height))
+    output_shape=(len(frames),dim[1],dim[0])+tuple(batch_frame_shape(frames)[2:])
+
+    if output is None or output.shape != output_shape or output.dtype != frames[0].dtype:
+        output=np.empty(output_shape,dtype=frames[0].dtype)
+
+    #OpenCV does not resize batches, every frame is written in its place of the output.
+    for frame_index in range(len(frames)):
+        cv2.resize(frames[frame_index],dim,dst=output[frame_index],interpolation=cv2.INTER_AREA)
+
+    return output
+
+#function to rotate a batch of frames clockwise a number of quarter turns.
+def batch_rotation(frames,rotations):
+    """
+    @args
+    frames: N x H x W x C array or list of frames with the same shape.
+    rotations: number of clockwise quarter turns.
+    """
+    import numpy as np
+
+    if rotations % 4 == 0:
+        return frames
+
+    if isinstance(frames,np.ndarray):
+        return np.rot90(frames,k=-rotations,axes=(1,2))
+    return [np.rot90(frame,k=-rotations) for frame in frames]
+
+#function to flip a batch of frames to have an horizontal ratio
+def batch_horizontal_rotation_function(frames):
+    """
+    @args
+    frames: N x H x W x C array or list of frames with the same shape.
+    """
+    from transform_planner import orientation_rotations
+
+    #frames dimensions
+    height, width = batch_frame_shape(frames)[:2]
+
+    #Check whether the frames are in vertical orientation to rotate them horizontally.
+    return batch_rotation(frames,orientation_rotations(height,width,True,False))
+
+#function to flip a batch of frames to have an vertical ratio
+def batch_vertical_rotation_function(frames):
+    """
+    @args
+    frames: N x H x W x C array or list of frames with the same shape.
+    """
+    from transform_planner import orientation_rotations
+
+    #frames dimensions
+    height, width = batch_frame_shape(frames)[:2]
 
+    #Check whether the frames are in horizontal orientation to rotate them vertically.
+    return batch_rotation(frames,orientation_rotations(height,width,False,True))
+
+#function to crop a batch of frames to a ratio
+def batch_image_ratio_cropping(frames,ratio_width,ratio_height):
+    """
+    @args
+    frames: N x H x W x C array or list of frames with the same shape.
+    ratio_width: proportion of the width e.g. 16
+    ratio_height: proportion of the height e.g. 9
+    """
+    import numpy as np
+    from transform_planner import ratio_cropping_window
 
-    #get the current width to height ratio.
-    current_ratio=float(float(longest_side)/float(shortest_side))
+    #frames dimensions
+    height, width = batch_frame_shape(frames)[:2]
 
-    #Get the desired ratio
-    desired_ratio=float(float(ratio_width)/float(ratio_height))
+    #get the part of the frames we keep and crop them
+    new_height, new_width = ratio_cropping_window(height,width,ratio_width,ratio_height)
 
-    #In the new image, we need to decrease the "advantage" of the shortest side over the longest side
-    if desired_ratio > current_ratio:
-        #get the height we need to get
-        new_shortest_side=int(float((float(longest_side)*float(ratio_height))/float(ratio_width)))
+    if isinstance(frames,np.ndarray):
+        return frames[:,0:new_height,0:new_width]
+    return [frame[0:new_height,0:new_width] for frame in frames]
 
-        #crop the image
-        if width > height:
-            image=image[0:new_shortest_side,:]
+#generator that groups the kept frames of a video in batches.
+def frame_batches(kept_frames,batch_size):
+    """
+    @args
+    kept_frames: iterator of (frame index, frame array).
+    batch_size: maximum number of frames in a batch.
+
+    yields lists of (frame index, frame array) with the same shape. A frame with
+    another shape (e.g. a recording concatenated to another one with a different
+    resolution) starts a new batch, so the last batch before it can be shorter.
+    """
+    batch=[]
+
+    for currentframe, frame in kept_frames:
+        if batch and frame.shape != batch[0][1].shape:
+            yield batch
+            batch=[]
+
+        batch.append((currentframe,frame))
+        if len(batch) == batch_size:
+            yield batch
+            batch=[]
+
+    #the last batch can be shorter
+    if batch:
+        yield batch
+
+#function to resize and rotate a batch of video frames.
+def batch_frame_transformation(frames,resize=False,horizontal_rotation=True,vertical_rotation=False,
+                                new_width=1980,new_height=1080,buffers=None,profiler=None,plan=None):
+    """
+    @args
+    frames: N x H x W x C array or list of frames with the same shape (see
+    frame_batches). The rest of the arguments are the same as in
+    frame_transformation. The plan is computed once for the batch, unless the
+    plan of the video is given. OpenCV resizes one frame at a time, so batching
+    saves the planning and the allocations, not the resizing itself.
+    buffers: dictionary where the resized batch is kept to be reused with the next batch.
+    profiler: if given, StageProfiler where the time of every step is added, split
+    between the frames of the batch.
+
+    returns a N x H x W x C array (or list if nothing was resized). It can be a
+    view of the resized batch.
+    """
+    import numpy as np
+    from transform_planner import transformation_plan
+
+    #the orientation is decided once for the batch, so all the frames must have its shape
+    if not isinstance(frames,np.ndarray) and any(frame.shape != frames[0].shape for frame in frames):
+        raise ValueError('The frames of a batch must have the same shape; split them with frame_batches')
+
+    height, width = batch_frame_shape(frames)[:2]
+    if plan is None or plan['input_shape'] != (height,width):
+        plan=transformation_plan(height,width,resize=resize,horizontal_rotation=horizontal_rotation,
+                                vertical_rotation=vertical_rotation,new_width=new_width,
+                                new_height=new_height,rotate_before_resize=False)
+
+    for step, value in plan['steps']:
+        if profiler is not None:
+            start=time.perf_counter()
+        if step == 'resize':
+            frames=batch_image_resizing(frames,value[0],value[1],
+                                        output=None if buffers is None else buffers.get('resize'))
+            if buffers is not None:
+                buffers['resize']=frames
         else:
-            image=image[:,0:new_shortest_side]
+            frames=batch_rotation(frames,value)
+        if profiler is not None:
+            profiler.add(step,time.perf_counter()-start,count=len(frames))
+
+    return frames
+
+#generator that reads a video and only gives back the frames we want to keep.
+def read_video_frames(videopath,framerate_extraction_interval,sparse_extraction=False,
+                        frame_accuracy='exact',start_frame=0):
+    """
+    @args
+    videopath: path of the video where are about to open.
+    framerate_extraction_interval: Every how many frames of the video we get an image
+    sparse_extraction (bool): Whether the frames we discard are skipped without being
+    converted. If False, every frame is fully read as in the original behaviour.
+    frame_accuracy: 'exact' or 'keyframe'. With 'exact', the skipped frames are
+    grabbed (demuxed and decoded but never converted to BGR) and only the kept frames
+    are retrieved, so the output is identical to reading every frame. With 'keyframe',
+    the video is seeked to every target frame. The backend may land on the nearest
+    keyframe, but it is much cheaper when the interval is larger than the GOP size.
+    Only used when sparse_extraction == True.
+    start_frame: index of the first frame read. Used to resume an interrupted extraction.
+
+    yields (frame index, frame array) for every kept frame.
+    """
+    import cv2
+
+    #check the accuracy option before opening the video
+    if frame_accuracy not in ('exact','keyframe'):
+        raise ValueError('frame_accuracy must be "exact" or "keyframe", not %s' %str(frame_accuracy))
 
-    #In the new image, we need to reduce the advantage of the longest side over the shortest side
-    elif desired_ratio < current_ratio:
-        #get the width we need to get.
-        new_longest_side=float((float(shortest_side)*float(ratio_width))/float(ratio_height))
+    #read the video from specified path
+    cam = cv2.VideoCapture(videopath)
 
-        #crop the image
-        if width > height:
-            image=image[:,0:new_longest_side]
+    #frame counter for filtering frames
+    currentframe = 0
+
+    #jump to the first frame when resuming an extraction. Seeking can land on a
+    #keyframe, so it is only done with frame_accuracy == 'keyframe'. Otherwise the
+    #frames before are grabbed (decoded but not converted), as in a full run.
+    if start_frame > 0:
+        if sparse_extraction and frame_accuracy == 'keyframe':
+            cam.set(cv2.CAP_PROP_POS_FRAMES,start_frame)
+            currentframe = start_frame
         else:
-            image=image[0:new_longest_side:]
+            while currentframe < start_frame and cam.grab():
+                currentframe += 1
 
-    #we have finished with the cropping. Then, return image
-    return image
+    try:
+        #Original behaviour. Read and convert every frame in the video.
+        if not sparse_extraction:
+            while(True):
+                ret,frame = cam.read()
+
+                #stop if there are no more frames
+                if not ret:
+                    break
+
+                if currentframe % framerate_extraction_interval == 0:
+                    yield currentframe, frame
+
+                currentframe += 1
+
+        #Frame exact sparse extraction. grab() the frames we discard and only
+        #retrieve() the ones we keep.
+        elif frame_accuracy == 'exact':
+            while(True):
+                if currentframe % framerate_extraction_interval == 0:
+                    ret,frame = cam.read()
+
+                    if not ret:
+                        break
+
+                    yield currentframe, frame
+
+                elif not cam.grab():
+                    break
+
+                currentframe += 1
+
+        #Seek straight to the frames we keep.
+        else:
+            #some containers do not report the number of frames, in that case
+            #we rely on read() failing at the end of the video.
+            total_frames=int(cam.get(cv2.CAP_PROP_FRAME_COUNT))
+
+            while(total_frames <= 0 or currentframe < total_frames):
+                if currentframe > 0:
+                    cam.set(cv2.CAP_PROP_POS_FRAMES,currentframe)
+
+                ret,frame = cam.read()
+
+                if not ret:
+                    break
+
+                yield currentframe, frame
+
+                currentframe += framerate_extraction_interval
+
+    finally:
+        # Release all space once done
+        cam.release()
+
+#function to resize and rotate a video frame depending on the given information
+def frame_transformation(frame,resize=False,horizontal_rotation=True,vertical_rotation=False,
+                        new_width=1980,new_height=1080,buffers=None,reuse_output=True,profiler=None,
+                        plan=None):
+    """
+    @args
+    frame: image array
+    resize (bool): whether the  frames are resized or not.
+    horizontal_rtation (bool): Whether rotate the image to have a horizontal orientation.
+    vertical_rotation (bool): Whether rotate the image to have a vertical orientation.
+    new_width: In case resize == True, this is the new width of the image.
+    new_height:In case resize == True, this is the new height of the image.
+    buffers: dictionary with the arrays reused between frames. See
+    transform_planner.apply_transformation_plan.
+    reuse_output (bool): whether the returned array is reused with the next frame.
+    profiler: if given, StageProfiler where the time of every step is added.
+    plan: plan made once for the video from the size of its frames given by the
+    container (see video_probe). It is used if the frame has that size.
+    """
+    from transform_planner import transformation_plan, apply_transformation_plan
+
+    #The frame is resized and then rotated, all planned from the frame shape.
+    if plan is None or plan['input_shape'] != frame.shape[:2]:
+        plan=transformation_plan(frame.shape[0],frame.shape[1],resize=resize,
+                                horizontal_rotation=horizontal_rotation,
+                                vertical_rotation=vertical_rotation,new_width=new_width,
+                                new_height=new_height,rotate_before_resize=False)
+
+    return apply_transformation_plan(frame,plan,buffers=buffers,reuse_output=reuse_output,profiler=profiler)
+
+#function to crop, rotate and resize an image depending on the given information
+def image_transformation(image,resize=False,horizontal_rotation=True,vertical_rotation=False,
+                        new_width=1980,new_height=1080,image_ratio=False,ratio_width=16,
+                        ratio_height=9,buffers=None,reuse_output=True,profiler=None):
+    """
+    @args
+    image: image array
+    resize (bool): whether the  frames are resized or not.
+    horizontal_rtation (bool): Whether rotate the image to have a horizontal orientation.
+    vertical_rotation (bool): Whether rotate the image to have a vertical orientation.
+    new_width: In case resize == True, this is the new width of the image.
+    new_height:In case resize == True, this is the new height of the image.
+    image_ratio (bool): Whether crop the image to ratio_width:ratio_height.
+    ratio_width: proportion of the width e.g. 16
+    ratio_height: proportion of the height e.g. 9
+    buffers: dictionary with the arrays reused between images. See
+    transform_planner.apply_transformation_plan.
+    reuse_output (bool): whether the returned array is reused with the next image.
+    profiler: if given, StageProfiler where the time of the crop and every step is added.
+    """
+    from transform_planner import transformation_plan, apply_transformation_plan
+
+    #The image is cropped, rotated and resized. The plan crops with a view and
+    #resizes before rotating when the output is smaller.
+    plan=transformation_plan(image.shape[0],image.shape[1],resize=resize,
+                            horizontal_rotation=horizontal_rotation,
+                            vertical_rotation=vertical_rotation,new_width=new_width,
+                            new_height=new_height,image_ratio=image_ratio,
+                            ratio_width=ratio_width,ratio_height=ratio_height)
+
+    return apply_transformation_plan(image,plan,buffers=buffers,reuse_output=reuse_output,profiler=profiler)
+
+#function to save an image in its folder and in the "all" folder.
+def save_output_image(image,image_name,all_image_name,all_copy_mode='copy',encoding_options=None,
+                    profiler=None,verbose=True,output_sink='files',archive_metadata=None):
+    """
+    @args
+    image: image array
+    image_name: path of the image in the field folder.
+    all_image_name: path of the image in the "all" folder.
+    all_copy_mode: how the copy in the "all" folder is made. The image is encoded
+    only once. See image_output.duplicate_output.
+    encoding_options: dictionary with the options of the encoder (quality,
+    png_compression, png_fast, encoder_backend). See image_output.encode_image.
+    The format is given by the extension of image_name.
+    profiler: if given, StageProfiler where the time of the encoding and of the
+    writing (both copies) is added.
+    verbose (bool): whether the paths of the image are printed.
+    output_sink: 'files' saves the two files. 'archive' only appends the image,
+    with the key <name of all_image_name without extension>, to the frame
+    archive of the "all" folder. See frame_archive.
+    archive_metadata: dictionary saved with the image in the frame archive.
+    """
+    from image_output import encode_image, write_encoded_image, duplicate_output
+
+    #encode the image only once
+    if profiler is not None:
+        start=time.perf_counter()
+    encoded_image=encode_image(image,image_name,**(encoding_options or {}))
+    if profiler is not None:
+        profiler.add('encode',time.perf_counter()-start)
+
+    #one record in a shard of the archive instead of two small files
+    if output_sink == 'archive':
+        from frame_archive import open_frame_archive, frame_archive_directory
+
+        if profiler is not None:
+            start=time.perf_counter()
+        archive_key, extension = os.path.splitext(os.path.basename(all_image_name))
+        if verbose:
+            print (archive_key)
+        open_frame_archive(frame_archive_directory(os.path.dirname(all_image_name))).append(
+                            archive_key,encoded_image,extension[1:],metadata=archive_metadata)
+        if profiler is not None:
+            profiler.add('write',time.perf_counter()-start)
+        return
+
+    #save the frame
+    if profiler is not None:
+        start=time.perf_counter()
+    if verbose:
+        print (image_name)
+    write_encoded_image(encoded_image,image_name)
+    if verbose:
+        print (all_image_name)
+    duplicate_output(encoded_image,image_name,all_image_name,all_copy_mode=all_copy_mode)
+    if profiler is not None:
+        profiler.add('write',time.perf_counter()-start)
 
 #fucnction to extract images from a video given a framerate extraction
 def image_extraction_video(videopath,framerate_extraction_interval,output,
                             resize=False, horizontal_rotation=True,vertical_rotation=False,
                             new_width=1980, new_height=1080, rename_videoframe=False,
-                            new_name='initial'):
+                            new_name='initial', sparse_extraction=False, frame_accuracy='exact',
+                            pipelined=False, writer_threads=2, queue_size=8, all_copy_mode='copy',
+                            checkpoint_path=None, checkpoint_every=100, image_format='png',
+                            encoding_options=None, batch_size=1, backend='opencv', sampling='frames',
+                            sampling_seconds=1.0, scene_threshold=None, scene_metric='luma',
+                            dedup_index_path=None, dedup_distance=4, dedup_hash='dhash',
+                            metadata_path=None, metadata_fields=None, profile_path=None,
+                            progress_bar=None, verbose=True, pyramid_levels=None, output_sink='files',
+                            video_probe=None):
     """
     @args
     videopath: path of the video where are about to open.
@@ -144,76 +529,420 @@ def image_extraction_video(videopath,framerate_extraction_interval,output,
     vertical_rotation (bool): Whether rotate the image to have a vertical orientation.
     new_width: In case resize == True, this is the new width of the image.
     new_height:In case resize == True, this is the new height of the image.
+    sparse_extraction (bool): Whether to skip the discarded frames without converting them.
+    frame_accuracy: 'exact' or 'keyframe'. See read_video_frames.
+    pipelined (bool): Whether decoding, transforming and writing run in their own
+    threads. See frame_pipeline.run_frame_pipeline.
+    writer_threads: In case pipelined == True, number of threads encoding and writing.
+    queue_size: In case pipelined == True, maximum number of frames between two stages.
+    all_copy_mode: 'copy', 'hardlink', 'reflink' or 'symlink'. How the copy in the
+    "all" folder is made. See image_output.duplicate_output.
+    checkpoint_path: if given, the progress of the extraction is saved in this file
+    every checkpoint_every frames, and an interrupted extraction with the same
+    arguments resumes after the last saved frame. The file is removed at the end.
+    checkpoint_every: number of saved frames between two checkpoints.
+    image_format: format of the saved frames, 'png', 'jpg' or 'webp'.
+    encoding_options: options of the encoder. See save_output_image.
+    batch_size: number of frames transformed together with batch_frame_transformation.
+    Only used when pipelined == False.
+    backend: 'opencv' decodes the video with OpenCV. 'ffmpeg-pipe' decodes and selects
+    the frames with FFmpeg and streams them through a pipe to be processed here.
+    'ffmpeg' does the selection, resizing, rotation and encoding in FFmpeg (the
+    checkpoint, sparse_extraction and pipeline options are not used). See ffmpeg_backend.
+    sampling: 'frames' keeps every framerate_extraction_interval frames. 'seconds' keeps
+    one frame every sampling_seconds seconds of video. 'scene' keeps the frames, among
+    every framerate_extraction_interval frames, that changed at least scene_threshold
+    since the last kept frame (not available with the 'ffmpeg' backend). See frame_sampling.
+    sampling_seconds: In case sampling == 'seconds', seconds between two kept frames.
+    scene_threshold: In case sampling == 'scene', minimum change to keep a frame.
+    scene_metric: In case sampling == 'scene', 'luma' or 'histogram'.
+    dedup_index_path: if given, path of the perceptual hash index. The frames with a
+    near-duplicate in the index are not saved (not available with the 'ffmpeg'
+    backend). See perceptual_hash_index.
+    dedup_distance: maximum Hamming distance between the hashes of two near-duplicates.
+    dedup_hash: 'dhash' or 'phash'.
+    metadata_path: if given, a JSON line with the source, frame index, timestamp,
+    paths, size and transformation of every saved frame is appended to this file.
+    See metadata_sink.
+    metadata_fields: dictionary of fields added to every metadata record, e.g.
+    the field, date and video.
+    profile_path: if given, the time of every stage (decode, rotate, resize, encode,
+    write) of every frame is measured, and one JSON line with the timings of the
+    video is appended to this file. See stage_profiler.
+    progress_bar: if given, ProgressBar updated with every saved frame.
+    verbose (bool): whether the paths of every saved frame are printed.
+    pyramid_levels: list of other resolutions saved from every frame, given by
+    output_pyramid.parse_pyramid_levels, each one with the 'output' folder of its
+    frames. The frames of a level are saved with the same names in output and in
+    ./all_<width>_<height> (not available with the 'ffmpeg' backend). See output_pyramid.
+    output_sink: 'files' or 'archive'. With 'archive' the frames are only appended,
+    with their metadata, to the frame archive of the "all" folder (not available
+    with the 'ffmpeg' backend). See save_output_image.
+    video_probe: properties of the video given by video_probe.probe_video, if it
+    was already probed. The frame rate and the size of the frames (after the
+    rotation of the container) are taken from it instead of opening the video
+    again, and the transformation of the frames is planned once from that size.
+
+    returns the number of frames saved.
     """
+    from image_output import duplicate_output
+    from transform_planner import transformation_plan
+    from frame_sampling import video_frame_rate, seconds_frame_interval, scene_change_filter, sampling_modes
 
-    #read the video from specified path
-    cam = cv2.VideoCapture(videopath)
+    #the backends and the optional features are only imported when they are used
+    if pyramid_levels:
+        from output_pyramid import pyramid_level_images
+
+    #get the video name
     video_name=os.path.basename(videopath)
     video_name_no_extension=video_name.split(".")[0]
 
-    #frame counter for filtering frames (currentframe) and for naming (frame_saving_name)
-    currentframe = 0
-    frame_saving_name=0
-
     #print statement
-    print ('Saving information in %s' %str(output))
+    if verbose:
+        print ('Saving information in %s' %str(output))
+
+    #function to get the paths of a frame given its number
+    def frame_names(frame_saving_name,level=None):
+        #folders of the main output or of a level of the pyramid
+        if level is None:
+            level_output, level_width, level_height = output, new_width, new_height
+        else:
+            level_output, level_width, level_height = level['output'], level['new_width'], level['new_height']
 
-    #While loop to go through all the frame in the video.
-    while(True):
+        #If rename_videoframe is "True", then, it will rename the frame with
+        #the name given in new_name
+        if rename_videoframe:
+            image_name = os.path.join(level_output,str(new_name)+'_'+str(frame_saving_name)+'.'+image_format)
+        else:
+            image_name = os.path.join(level_output,video_name_no_extension+'_'+str(frame_saving_name)+'.'+image_format)
+
+        all_image_name = os.path.join('./all_'+str(level_width)+"_"+str(level_height),str(new_name)+'_'+str(frame_saving_name)+'.'+image_format)
+
+        return image_name, all_image_name
+
+    #transformation options
+    transformation_options={'resize':resize,'horizontal_rotation':horizontal_rotation,
+                            'vertical_rotation':vertical_rotation,
+                            'new_width':new_width,'new_height':new_height}
+
+    #check the sampling options
+    if sampling not in sampling_modes:
+        raise ValueError('sampling must be one of %s, not %s' %(str(sampling_modes),str(sampling)))
+    if sampling == 'scene' and backend == 'ffmpeg':
+        raise ValueError('The scene sampling is not available with the ffmpeg backend')
+    if dedup_index_path is not None and backend == 'ffmpeg':
+        raise ValueError('The near-duplicate index is not available with the ffmpeg backend')
+    if pyramid_levels and backend == 'ffmpeg':
+        raise ValueError('The pyramid levels are not available with the ffmpeg backend')
+    if output_sink == 'archive' and backend == 'ffmpeg':
+        raise ValueError('The frame archive is not available with the ffmpeg backend')
+
+    #frame rate and size of the rotated frames given by the container, when the
+    #video was probed. The orientation of the frames is decided once for the video.
+    probed_frame_rate=None
+    frame_size=None
+    video_plan=None
+    if video_probe is not None:
+        probed_frame_rate=video_probe.get('fps')
+        if video_probe.get('width') and video_probe.get('height'):
+            frame_size=(video_probe['width'],video_probe['height'])
+            video_plan=transformation_plan(frame_size[1],frame_size[0],rotate_before_resize=False,
+                                            **transformation_options)
+
+    #the probe gives the size of the frames decoded by OpenCV. FFmpeg rotates and
+    #decodes the frames by itself, and the size can be different (e.g. containers
+    #where OpenCV does not read the rotation), so the FFmpeg backends use the size
+    #given by ffprobe. With a wrong size the raw frames of the pipe are cut wrongly.
+    if backend in ('ffmpeg','ffmpeg-pipe'):
+        from ffmpeg_backend import video_frame_size
+        ffmpeg_frame_size=video_frame_size(videopath)
+        if frame_size is not None and tuple(frame_size) != tuple(ffmpeg_frame_size):
+            print ('The frames of %s are %dx%d for OpenCV and %dx%d for FFmpeg; the FFmpeg size is used'
+                    %((videopath,)+tuple(frame_size)+tuple(ffmpeg_frame_size)))
+        frame_size=ffmpeg_frame_size
+        video_plan=transformation_plan(frame_size[1],frame_size[0],rotate_before_resize=False,
+                                        **transformation_options)
+
+    #the interval in frames depends on the frame rate of the video
+    if sampling == 'seconds':
+        framerate_extraction_interval=seconds_frame_interval(videopath,sampling_seconds,
+                                                            frame_rate=probed_frame_rate)
+
+    #arguments that must be the same to resume from a checkpoint
+    checkpoint_identity={'videopath':videopath,'interval':framerate_extraction_interval,
+                        'output':output,'new_name':new_name,'rename':rename_videoframe,
+                        'sparse':sparse_extraction,'accuracy':frame_accuracy,
+                        'sampling':sampling,'scene_threshold':scene_threshold,
+                        'scene_metric':scene_metric,'dedup_index_path':dedup_index_path,
+                        'dedup_distance':dedup_distance,'dedup_hash':dedup_hash,
+                        'pyramid_levels':pyramid_levels or [],'output_sink':output_sink,
+                        'image_format':image_format,
+                        #as read back from the checkpoint file, e.g. None is {}
+                        'encoding_options':json.loads(json.dumps(encoding_options or {},sort_keys=True))}
+    checkpoint_identity.update(transformation_options)
+
+    #first frame to read and first number for naming.
+    progress={'next_frame':0,'saved_frames':0}
+    if checkpoint_path is not None:
+        checkpoint=read_checkpoint(checkpoint_path)
+        if checkpoint is not None and checkpoint.get('identity') == checkpoint_identity:
+            progress.update(checkpoint['progress'])
+            print ('Resuming %s from frame %s' %(str(videopath),str(progress['next_frame'])))
+
+    #metadata of the saved frames, written in the metadata file and in the frame
+    #archive. The timestamp is computed from the frame rate.
+    metadata_sink=None
+    if metadata_path is not None:
+        metadata_sink=open_metadata_sink(metadata_path)
+    frame_metadata_needed=metadata_sink is not None or output_sink == 'archive'
+    if frame_metadata_needed:
+        frame_rate=probed_frame_rate if probed_frame_rate is not None else video_frame_rate(videopath)
+        metadata_parameters=dict(transformation_options,interval=framerate_extraction_interval,
+                                sampling=sampling,image_format=image_format)
+
+    def frame_metadata(frame_saving_name,currentframe,frame_shape,level=None):
+        #the levels of the pyramid have their own size and crop
+        parameters=metadata_parameters
+        if level is not None:
+            parameters=dict(metadata_parameters,new_width=level['new_width'],new_height=level['new_height'],
+                            ratio_width=level['ratio_width'],ratio_height=level['ratio_height'])
+
+        image_name, all_image_name = frame_names(frame_saving_name,level)
+        return dict(source=videopath,frame=currentframe,
+                    timestamp=currentframe/frame_rate if frame_rate else None,
+                    output=image_name,all_output=all_image_name,
+                    width=frame_shape[1],height=frame_shape[0],
+                    parameters=parameters,**(metadata_fields or {}))
+
+    def record_frame_metadata(frame_saving_name,currentframe,frame_shape,level=None):
+        if metadata_sink is None:
+            return
+
+        metadata_sink.record(**frame_metadata(frame_saving_name,currentframe,frame_shape,level))
+
+    #timings of the stages of the frames
+    profiler=None
+    if profile_path is not None:
+        profiler=StageProfiler()
+        profile_start=time.perf_counter()
+
+    def record_profile(saved_frames):
+        if profiler is None:
+            return
+
+        open_metadata_sink(profile_path).record(source=videopath,frames=saved_frames,
+                                                seconds=time.perf_counter()-profile_start,
+                                                timings=profiler.to_dict(),**(metadata_fields or {}))
+
+    #frames already written. When pipelined, the frames can finish out of order,
+    #so the checkpoint only moves past frames with every previous frame written.
+    written_frames={}
+    progress_lock=threading.Lock()
+
+    def frame_saved(frame_saving_name,currentframe):
+        if progress_bar is not None:
+            progress_bar.update(1,description=video_name)
+
+        if checkpoint_path is None:
+            return
+
+        with progress_lock:
+            written_frames[frame_saving_name]=currentframe
+            while progress['saved_frames'] in written_frames:
+                written_frame=written_frames.pop(progress['saved_frames'])
+                progress['next_frame']=written_frame+framerate_extraction_interval
+                progress['saved_frames']+=1
+
+                if progress['saved_frames'] % checkpoint_every == 0:
+                    write_checkpoint(checkpoint_path,{'identity':checkpoint_identity,'progress':progress})
+
+    #function to save a transformed frame (or a level of the pyramid) and its metadata.
+    def save_level_frame(frame,frame_saving_name,currentframe,level=None):
+        metadata=None
+        if frame_metadata_needed:
+            metadata=frame_metadata(frame_saving_name,currentframe,frame.shape,level)
+
+        save_output_image(frame,*frame_names(frame_saving_name,level),all_copy_mode=all_copy_mode,
+                            encoding_options=encoding_options,profiler=profiler,verbose=verbose,
+                            output_sink=output_sink,archive_metadata=metadata)
+
+        if metadata_sink is not None:
+            metadata_sink.record(**metadata)
+
+    #function to save a transformed frame, and the levels of the pyramid made from it.
+    def save_frame(frame,frame_saving_name,currentframe):
+        save_level_frame(frame,frame_saving_name,currentframe)
+
+        if pyramid_levels:
+            for level, level_image in zip(pyramid_levels,pyramid_level_images(frame,pyramid_levels,profiler=profiler)):
+                save_level_frame(level_image,frame_saving_name,currentframe,level)
+
+        frame_saved(frame_saving_name,currentframe)
+
+    #FFmpeg does everything, we only make the copies in the "all" folder.
+    if backend == 'ffmpeg':
+        from ffmpeg_backend import ffmpeg_extraction_video
+        saved_frames=ffmpeg_extraction_video(videopath,framerate_extraction_interval,output,
+                                    new_name if rename_videoframe else video_name_no_extension,
+                                    image_format=image_format,encoding_options=encoding_options,
+                                    frame_size=frame_size,**transformation_options)
+
+        #size of the frames written by FFmpeg
+        if metadata_sink is not None:
+            output_shape=transformation_plan(*reversed(frame_size),
+                                            rotate_before_resize=False,**transformation_options)['output_shape']
+
+        for frame_saving_name, image_name in enumerate(saved_frames):
+            with open(image_name,'rb') as image_file:
+                encoded_image=image_file.read()
+            duplicate_output(encoded_image,image_name,frame_names(frame_saving_name)[1],
+                            all_copy_mode=all_copy_mode)
+            if metadata_sink is not None:
+                record_frame_metadata(frame_saving_name,frame_saving_name*framerate_extraction_interval,output_shape)
+
+        #FFmpeg runs all the stages together
+        if profiler is not None and saved_frames:
+            profiler.add('ffmpeg',time.perf_counter()-profile_start,count=len(saved_frames))
+        record_profile(len(saved_frames))
+
+        if progress_bar is not None:
+            progress_bar.update(len(saved_frames),description=video_name)
+
+        return len(saved_frames)
+
+    #Go through all the frames we keep in the video. frame_saving_name is the
+    #frame counter for naming.
+    if backend == 'ffmpeg-pipe':
+        from ffmpeg_backend import read_video_frames_ffmpeg
+        kept_frames=read_video_frames_ffmpeg(videopath,framerate_extraction_interval,
+                                            start_frame=progress['next_frame'],frame_size=frame_size)
+    elif backend == 'opencv':
+        kept_frames=read_video_frames(videopath,framerate_extraction_interval,
+                                    sparse_extraction=sparse_extraction,
+                                    frame_accuracy=frame_accuracy,
+                                    start_frame=progress['next_frame'])
+    else:
+        raise ValueError('backend must be "opencv", "ffmpeg-pipe" or "ffmpeg", not %s' %str(backend))
+    frame_saving_name=progress['saved_frames']
+    first_frame_saving_name=frame_saving_name
+
+    #time the decoding of every kept frame, before the sampling filters.
+    if profiler is not None:
+        kept_frames=profiler.timed_iterator('decode',kept_frames)
+
+    #only keep the candidate frames with a scene change. The comparison is done
+    #before any transformation or encoding.
+    if sampling == 'scene':
+        kept_frames=scene_change_filter(kept_frames,scene_threshold=scene_threshold,
+                                        scene_metric=scene_metric)
+
+    #skip the frames with a near-duplicate in the index, before they are transformed.
+    if dedup_index_path is not None:
+        from perceptual_hash_index import open_hash_index, near_duplicate_filter
+        kept_frames=near_duplicate_filter(kept_frames,open_hash_index(dedup_index_path,dedup_distance),
+                                        videopath,hash_method=dedup_hash)
+
+    #Decode, transform and write in different threads.
+    if pipelined:
+        from frame_pipeline import run_frame_pipeline
+        numbered_frames=(((frame_number,currentframe),frame) for frame_number,(currentframe,frame) in enumerate(kept_frames,frame_saving_name))
+
+        def write_frame(frame_key,frame):
+            save_frame(frame,frame_key[0],frame_key[1])
+
+        #the transform thread reuses its intermediate arrays. The output array is
+        #not reused because the writers still hold it.
+        transform_buffers={}
+        written=run_frame_pipeline(numbered_frames,
+                            lambda frame_key,frame: frame_transformation(frame,buffers=transform_buffers,
+                                                                reuse_output=False,profiler=profiler,
+                                                                plan=video_plan,**transformation_options),
+                            write_frame,writer_threads=writer_threads,queue_size=queue_size)
+        frame_saving_name+=len(written)
+
+    elif batch_size > 1:
+        #the resized batch array is reused for every batch, the frames are
+        #saved before the next batch is transformed.
+        transform_buffers={}
+
+        for batch in frame_batches(kept_frames,batch_size):
+            transformed_frames=batch_frame_transformation([batch_frame for batch_index, batch_frame in batch],
+                                                        buffers=transform_buffers,profiler=profiler,
+                                                        plan=video_plan,**transformation_options)
+
+            #save the frames
+            for (batch_currentframe, batch_frame), transformed_frame in zip(batch,transformed_frames):
+                save_frame(transformed_frame,frame_saving_name,batch_currentframe)
+                frame_saving_name+=1
 
-        #reading from frame
-        ret,frame = cam.read()
+    else:
+        #the arrays of the transformation are reused for every frame, the frame
+        #is saved before the next one is transformed.
+        transform_buffers={}
 
-        #if there are frames availabel, continue.
-        if ret:
-            # if video is still left continue creating image
-            # writing the extracted images
-            if currentframe % framerate_extraction_interval == 0:
-                #save videos.
+        for currentframe, frame in kept_frames:
+            #Rotation and resizing options depending on the given information
+            frame=frame_transformation(frame,buffers=transform_buffers,profiler=profiler,
+                                        plan=video_plan,**transformation_options)
 
-                #If rename_videoframe is "True", then, it will rename the frame with
+            #save the frame and the levels of the pyramid
+            save_frame(frame,frame_saving_name,currentframe)
+            frame_saving_name+=1
 
-                #the name given in new_name
-                if rename_videoframe:
-                    image_name = os.path.join(output,str(new_name)+'_'+str(frame_saving_name)+'.png')
-                else:
-                    image_name = os.path.join(output,video_name_no_extension+'_'+str(frame_saving_name)+'.png')
+    #the video is finished, the checkpoint is not needed anymore.
+    if checkpoint_path is not None:
+        remove_checkpoint(checkpoint_path)
 
-                #Rotation and resizing options depending on the given information
-                if resize:
-                    frame=image_resizing(frame,new_width,new_height)
+    record_profile(frame_saving_name-first_frame_saving_name)
 
-                #Horizontal rotation true will make the width of the image larger than the height.
-                if horizontal_rotation:
-                    frame=horizontal_rotation_function(frame)
+    return frame_saving_name
 
-                #Vertical rotation true will make the height of the image larger than the width.
-                if vertical_rotation:
-                    frame=vertical_rotation_function(frame)
+#function run once in every worker process of the extraction pool.
+def extraction_worker_initializer(opencv_threads):
+    """
+    @args
+    opencv_threads: maximum number of threads OpenCV can use in this worker.
+    """
+    import cv2
+    from frame_archive import close_frame_archives
 
-                #save the frame
-                print (image_name)
-                cv2.imwrite(image_name, frame)
-                print (os.path.join('./all_'+str(new_width)+"_"+str(new_height),str(new_name)+'_'+str(frame_saving_name)+'.png'))
-                cv2.imwrite(os.path.join('./all_'+str(new_width)+"_"+str(new_height),str(new_name)+'_'+str(frame_saving_name)+'.png'), frame)
-                frame_saving_name+=1
+    #Without this limit every worker spawns one OpenCV thread per core and
+    #the workers fight each other for the CPU.
+    cv2.setNumThreads(int(opencv_threads))
 
-            #increasing counter so that it will,show how many frames are created
-            currentframe += 1
+    #the archives opened by the worker are ended when the pool stops it. The
+    #workers exit without running atexit, but they run the finalizers of multiprocessing.
+    multiprocessing.util.Finalize(None,close_frame_archives,exitpriority=10)
 
-        #stop if there are no more frames
-        else:
-            break
+#function to keep a bounded number of jobs in flight in an executor.
+def wait_for_free_slot(jobs_in_flight,max_in_flight):
+    """
+    @args
+    jobs_in_flight: dictionary future -> description of the job. The finished jobs
+    are removed from it.
+    max_in_flight: maximum number of jobs that can be pending at the same time.
+
+    returns a list of (future, description) of the jobs that finished while waiting.
+    """
+    finished_jobs=[]
 
-    # Release all space and windows once done
-    cam.release()
-    cv2.destroyAllWindows()
+    #block until there is room for another job
+    while len(jobs_in_flight) >= max_in_flight:
+        done, not_done = wait(list(jobs_in_flight), return_when=FIRST_COMPLETED)
+        for future in done:
+            finished_jobs.append((future,jobs_in_flight.pop(future)))
+
+    return finished_jobs
 
 
 #Function to process the images based on our needs.
 def image_processing(imagepath,output,resize=False,horizontal_rotation=True,vertical_rotation=False,
                     new_width=1980, new_height=1080, rename_image=False,new_name='initial',
-                    image_ratio=False, ratio_width=16, ratio_height=9):
+                    image_ratio=False, ratio_width=16, ratio_height=9, all_copy_mode='copy',
+                    image_format='png', encoding_options=None, dedup_index_path=None,
+                    dedup_distance=4, dedup_hash='dhash', metadata_path=None, metadata_fields=None,
+                    profiler=None, progress_bar=None, verbose=True, reduced_decode=False,
+                    pyramid_levels=None, output_sink='files', measure_peak_memory=False):
     """
     @args
     imagepath: path of the image where are about to open.
@@ -223,12 +952,214 @@ def image_processing(imagepath,output,resize=False,horizontal_rotation=True,vert
     vertical_rotation (bool): Whether rotate the image to have a vertical orientation.
     new_width: In case resize == True, this is the new width of the image.
     new_height:In case resize == True, this is the new height of the image.
+    all_copy_mode: how the copy in the "all" folder is made. See image_output.duplicate_output.
+    image_format: format of the saved image, 'png', 'jpg' or 'webp'.
+    encoding_options: options of the encoder. See save_output_image.
+    dedup_index_path: if given, path of the perceptual hash index. The image is not
+    saved if it has a near-duplicate in the index. See perceptual_hash_index.
+    dedup_distance: maximum Hamming distance between the hashes of two near-duplicates.
+    dedup_hash: 'dhash' or 'phash'.
+    metadata_path: if given, a JSON line with the source, paths, size and
+    transformation of the saved image is appended to this file. See metadata_sink.
+    metadata_fields: dictionary of fields added to the metadata record, e.g. the
+    field and date.
+    profiler: if given, StageProfiler where the time of every stage is added.
+    progress_bar: if given, ProgressBar updated when the image is saved.
+    verbose (bool): whether the paths of the saved image are printed.
+    reduced_decode (bool): whether large images are decoded at a reduced size
+    when the output is much smaller. See large_image_reader.
+    pyramid_levels: list of other resolutions saved from the image, given by
+    output_pyramid.parse_pyramid_levels, each one with the 'output' folder of its
+    images. See save_image_pyramid.
+    output_sink: 'files' or 'archive'. With 'archive' the image is only appended,
+    with its metadata, to the frame archive of the "all" folder. See save_output_image.
+    measure_peak_memory (bool): whether the peak memory of the process while the
+    image is processed (peak_rss_mb) is added to the metadata. The peak is of the
+    whole process, so it is only the peak of this image when the images are
+    processed one after another (not in a thread pool or the pipeline).
+
+    returns True if the image was saved, False if it was a near-duplicate.
     """
+    #the peak memory of this image alone
+    measure_peak_memory=measure_peak_memory and metadata_path is not None
+    if measure_peak_memory:
+        from large_image_reader import reset_peak_rss, peak_rss_megabytes
+        reset_peak_rss()
 
     #Open the image
-    image = cv2.imread(imagepath)
+    if profiler is not None:
+        start=time.perf_counter()
+    image, cropped = decode_image(imagepath,reduced_decode,resize,horizontal_rotation,vertical_rotation,
+                                new_width,new_height,image_ratio,ratio_width,ratio_height)
+    if profiler is not None:
+        profiler.add('decode',time.perf_counter()-start)
+
+    #skip the image if it has a near-duplicate
+    if is_near_duplicate(image,imagepath,dedup_index_path,dedup_distance,dedup_hash):
+        return False
+
+    #crop, rotate and resize the image
+    image=image_transformation(image,resize=resize,horizontal_rotation=horizontal_rotation,
+                                vertical_rotation=vertical_rotation,new_width=new_width,
+                                new_height=new_height,image_ratio=image_ratio and not cropped,
+                                ratio_width=ratio_width,ratio_height=ratio_height,profiler=profiler)
+
+    #save the frame
+    image_name, all_image_name = image_output_names(imagepath,output,new_width,new_height,
+                                                rename_image,new_name,image_format=image_format)
+    metadata_parameters=image_metadata_parameters(resize,horizontal_rotation,vertical_rotation,
+                                                new_width,new_height,image_ratio,ratio_width,
+                                                ratio_height,image_format)
+    metadata=image_metadata_record(imagepath,image_name,all_image_name,image,metadata_parameters,metadata_fields)
+    save_output_image(image,image_name,all_image_name,all_copy_mode=all_copy_mode,
+                    encoding_options=encoding_options,profiler=profiler,verbose=verbose,
+                    output_sink=output_sink,archive_metadata=metadata)
+
+    #save the levels of the pyramid made from the image
+    if pyramid_levels:
+        save_image_pyramid(image,imagepath,rename_image,new_name,pyramid_levels,image_format=image_format,
+                            all_copy_mode=all_copy_mode,encoding_options=encoding_options,
+                            metadata_path=metadata_path,metadata_parameters=metadata_parameters,
+                            metadata_fields=metadata_fields,profiler=profiler,verbose=verbose,
+                            output_sink=output_sink)
+
+    if progress_bar is not None:
+        progress_bar.update(1,description=os.path.dirname(imagepath))
+
+    #save the metadata of the image
+    if measure_peak_memory:
+        open_metadata_sink(metadata_path).record(peak_rss_mb=peak_rss_megabytes(),**metadata)
+    elif metadata_path is not None:
+        open_metadata_sink(metadata_path).record(**metadata)
+
+    return True
+
+#function to get the metadata record of a saved image.
+def image_metadata_record(imagepath,image_name,all_image_name,image,parameters,metadata_fields=None):
+    """
+    @args
+    imagepath: path of the original image.
+    image_name, all_image_name: paths of the saved image. See image_output_names.
+    image: saved image array.
+    parameters: transformation parameters, given by image_metadata_parameters.
+    metadata_fields: dictionary of fields added to the record, e.g. the field and date.
+    """
+    return dict(source=imagepath,output=image_name,all_output=all_image_name,
+                width=image.shape[1],height=image.shape[0],parameters=parameters,
+                **(metadata_fields or {}))
+
+#function to save the levels of the pyramid made from a processed image.
+def save_image_pyramid(image,imagepath,rename_image,new_name,pyramid_levels,image_format='png',
+                        all_copy_mode='copy',encoding_options=None,metadata_path=None,
+                        metadata_parameters=None,metadata_fields=None,profiler=None,verbose=True,
+                        output_sink='files'):
+    """
+    @args
+    image: main output image.
+    imagepath: path of the original image.
+    rename_image (bool), new_name: names of the saved images, as in image_processing.
+    pyramid_levels: list of levels given by output_pyramid.parse_pyramid_levels,
+    each one with the 'output' folder of its images. The images of a level are
+    also saved in ./all_<width>_<height>.
+    metadata_parameters: transformation parameters of the main output, given by
+    image_metadata_parameters. The size and crop of every level replace them.
+    The rest of the arguments are the same as in image_processing.
+    """
+    from output_pyramid import pyramid_level_images
+
+    level_images=pyramid_level_images(image,pyramid_levels,profiler=profiler)
+
+    for level, level_image in zip(pyramid_levels,level_images):
+        image_name, all_image_name = image_output_names(imagepath,level['output'],level['new_width'],
+                                                    level['new_height'],rename_image,new_name,
+                                                    image_format=image_format)
+        level_parameters=dict(metadata_parameters,new_width=level['new_width'],new_height=level['new_height'],
+                            ratio_width=level['ratio_width'],ratio_height=level['ratio_height'])
+        metadata=image_metadata_record(imagepath,image_name,all_image_name,level_image,level_parameters,
+                                        metadata_fields)
+        save_output_image(level_image,image_name,all_image_name,all_copy_mode=all_copy_mode,
+                        encoding_options=encoding_options,profiler=profiler,verbose=verbose,
+                        output_sink=output_sink,archive_metadata=metadata)
+
+        if metadata_path is not None:
+            open_metadata_sink(metadata_path).record(**metadata)
+
+#function to open an image.
+def decode_image(imagepath,reduced_decode=False,resize=False,horizontal_rotation=True,vertical_rotation=False,
+                new_width=1980,new_height=1080,image_ratio=False,ratio_width=16,ratio_height=9):
+    """
+    @args
+    imagepath: path of the image.
+    reduced_decode (bool): whether the image is decoded at the smallest size that
+    gives the same output. See large_image_reader.read_reduced_image.
+    The rest of the arguments are the same as in image_transformation.
+
+    returns (image, cropped). cropped is True if the image is already cropped to
+    ratio_width:ratio_height.
+    """
+    import cv2
+    from large_image_reader import read_reduced_image
+
+    if not reduced_decode:
+        return cv2.imread(imagepath), False
+
+    return read_reduced_image(imagepath,resize=resize,horizontal_rotation=horizontal_rotation,
+                            vertical_rotation=vertical_rotation,new_width=new_width,
+                            new_height=new_height,image_ratio=image_ratio,ratio_width=ratio_width,
+                            ratio_height=ratio_height)
+
+#function to get the transformation parameters saved in the metadata of an image.
+def image_metadata_parameters(resize,horizontal_rotation,vertical_rotation,new_width,new_height,
+                            image_ratio,ratio_width,ratio_height,image_format):
+    """
+    @args
+    The same arguments as in image_processing.
+    """
+    return {'resize':resize,'horizontal_rotation':horizontal_rotation,
+            'vertical_rotation':vertical_rotation,'new_width':new_width,'new_height':new_height,
+            'image_ratio':image_ratio,'ratio_width':ratio_width,'ratio_height':ratio_height,
+            'image_format':image_format}
+
+#function to check an image in the perceptual hash index.
+def is_near_duplicate(image,imagepath,dedup_index_path=None,dedup_distance=4,dedup_hash='dhash'):
+    """
+    @args
+    image: image array
+    imagepath: path of the image, saved in the index.
+    dedup_index_path: path of the perceptual hash index. None never finds duplicates.
+    dedup_distance: maximum Hamming distance between the hashes of two near-duplicates.
+    dedup_hash: 'dhash' or 'phash'.
+
+    returns True if there is a near-duplicate of another image in the index. If
+    not, the image is added to the index.
+    """
+    from perceptual_hash_index import open_hash_index, image_hash
+
+    if dedup_index_path is None:
+        return False
+
+    hash_index=open_hash_index(dedup_index_path,dedup_distance)
+    duplicate=hash_index.check_and_add(image_hash(image,dedup_hash),imagepath)
+
+    #the same image processed again is not a duplicate
+    if duplicate is None or duplicate == imagepath:
+        return False
 
+    print ('Image %s is a near-duplicate of %s; skipping it' %(str(imagepath),str(duplicate)))
+    return True
 
+#function to get the paths where a processed image is saved.
+def image_output_names(imagepath,output,new_width,new_height,rename_image,new_name,image_format='png'):
+    """
+    @args
+    imagepath: path of the original image.
+    output: path where the ouptput is gonna be saved
+    new_width: width used in the name of the "all" folder.
+    new_height: height used in the name of the "all" folder.
+    rename_image (bool): whether the image is renamed with new_name.
+    new_name: new name of the image.
+    image_format: extension of the saved image.
+    """
     #get the image name and extension
     image_name=os.path.basename(imagepath)
     image_name_no_extension=image_name.split(".")[0]
@@ -236,45 +1167,300 @@ def image_processing(imagepath,output,resize=False,horizontal_rotation=True,vert
     #We have to make rename_image "True" to change the name of the image according
     #with our needs
     if rename_image:
-        image_name = os.path.join(output,str(new_name)+'.png')
+        image_name = os.path.join(output,str(new_name)+'.'+image_format)
     else:
-        image_name = os.path.join(output,image_name_no_extension+'.png')
+        image_name = os.path.join(output,image_name_no_extension+'.'+image_format)
+
+    all_image_name = os.path.join('./all_'+str(new_width)+"_"+str(new_height), str(new_name)+'.'+image_format)
+
+    return image_name, all_image_name
+
+#Function to process several images with the decode -> transform -> write pipeline.
+def image_processing_pipeline(image_jobs,output,resize=False,horizontal_rotation=True,
+                            vertical_rotation=False,new_width=1980, new_height=1080,
+                            rename_image=False,image_ratio=False, ratio_width=16,
+                            ratio_height=9,writer_threads=2,queue_size=8,all_copy_mode='copy',
+                            image_format='png',encoding_options=None,on_image_saved=None,
+                            dedup_index_path=None,dedup_distance=4,dedup_hash='dhash',
+                            metadata_path=None,metadata_fields=None,profiler=None,
+                            progress_bar=None,verbose=True,reduced_decode=False,pyramid_levels=None,
+                            output_sink='files'):
+    """
+    @args
+    image_jobs: list of (path of the image, new name of the image).
+    The rest of the arguments are the same as in image_processing. The images
+    are decoded in one thread, transformed in another one and written by
+    writer_threads threads. See frame_pipeline.run_frame_pipeline. The images
+    overlap in the threads, so the metadata has no peak memory of every image.
+    on_image_saved: function(path of the image, new name) called from the writer
+    threads after every image is saved.
+
+    returns the number of images saved.
+    """
+    from frame_pipeline import run_frame_pipeline
+
+    #generator to open the images in the decoding thread.
+    def decoded_images():
+        for imagepath, new_name in image_jobs:
+            if profiler is not None:
+                start=time.perf_counter()
+            image, cropped = decode_image(imagepath,reduced_decode,resize,horizontal_rotation,vertical_rotation,
+                                        new_width,new_height,image_ratio,ratio_width,ratio_height)
+            if profiler is not None:
+                profiler.add('decode',time.perf_counter()-start)
+
+            #the near-duplicates are not transformed nor saved
+            if is_near_duplicate(image,imagepath,dedup_index_path,dedup_distance,dedup_hash):
+                if on_image_saved is not None:
+                    on_image_saved(imagepath,new_name)
+                continue
+
+            yield (imagepath,new_name,cropped), image
+
+    #crop, rotate and resize the image
+    def transform(image_job,image):
+        return image_transformation(image,resize=resize,horizontal_rotation=horizontal_rotation,
+                                    vertical_rotation=vertical_rotation,new_width=new_width,
+                                    new_height=new_height,image_ratio=image_ratio and not image_job[2],
+                                    ratio_width=ratio_width,ratio_height=ratio_height,
+                                    profiler=profiler)
+
+    #metadata of the saved images
+    metadata_parameters=image_metadata_parameters(resize,horizontal_rotation,vertical_rotation,
+                                                new_width,new_height,image_ratio,ratio_width,
+                                                ratio_height,image_format)
+    if metadata_path is not None:
+        metadata_sink=open_metadata_sink(metadata_path)
+
+    #save the image
+    def write(image_job,image):
+        imagepath, new_name, cropped = image_job
+        image_name, all_image_name = image_output_names(imagepath,output,new_width,new_height,
+                                                    rename_image,new_name,image_format=image_format)
+        metadata=image_metadata_record(imagepath,image_name,all_image_name,image,metadata_parameters,
+                                        metadata_fields)
+        save_output_image(image,image_name,all_image_name,all_copy_mode=all_copy_mode,
+                        encoding_options=encoding_options,profiler=profiler,verbose=verbose,
+                        output_sink=output_sink,archive_metadata=metadata)
+
+        if pyramid_levels:
+            save_image_pyramid(image,imagepath,rename_image,new_name,pyramid_levels,image_format=image_format,
+                                all_copy_mode=all_copy_mode,encoding_options=encoding_options,
+                                metadata_path=metadata_path,metadata_parameters=metadata_parameters,
+                                metadata_fields=metadata_fields,profiler=profiler,verbose=verbose,
+                                output_sink=output_sink)
+
+        if metadata_path is not None:
+            metadata_sink.record(**metadata)
+
+        if progress_bar is not None:
+            progress_bar.update(1,description=os.path.dirname(imagepath))
+
+        if on_image_saved is not None:
+            on_image_saved(imagepath,new_name)
+
+    written_images=run_frame_pipeline(decoded_images(),transform,write,
+                                    writer_threads=writer_threads,queue_size=queue_size)
+
+    return len(written_images)
+
+
+#function to get the encoder options given in the command.
+def command_encoding_options(args):
+    """
+    args: args indications used in the command to run the code.
+    """
+    return {'quality':args.quality,'png_compression':args.png_compression,
+            'png_fast':args.png_fast,'encoder_backend':args.encoder_backend}
 
-    if image_ratio:
-        image=image_ratio_cropping(image,ratio_width,ratio_height)
+#function to get the path of the perceptual hash index given in the command.
+def command_dedup_index_path(args,all_directory):
+    """
+    args: args indications used in the command to run the code.
+    all_directory: path of the all_<width>_<height> folder.
 
+    returns None if the near-duplicates are not skipped.
+    """
+    if not args.dedup:
+        return None
 
-    #Horizontal rotation true will make the width of the image larger than the height.
-    if horizontal_rotation:
-        image=horizontal_rotation_function(image)
+    return os.path.join(all_directory,'phash_index_'+str(args.dedup_hash)+'_'+
+                        str(args.reshaped_width)+'_'+str(args.reshaped_height)+'.txt')
 
-    #Vertical rotation true will make the height of the image larger than the width.
-    if vertical_rotation:
-        image=vertical_rotation_function(image)
+#function to get the levels of the pyramid given in the command.
+def command_pyramid_levels(args):
+    """
+    args: args indications used in the command to run the code.
+
+    returns the list of levels given by output_pyramid.parse_pyramid_levels. Their
+    all_<width>_<height> folders are created.
+    """
+    from output_pyramid import parse_pyramid_levels
 
+    pyramid_levels=parse_pyramid_levels(args.pyramid)
 
-    #Rotation and resizing options depending on the given information
-    if resize:
-        image=image_resizing(image,new_width,new_height)
+    for level in pyramid_levels:
+        if (level['new_width'],level['new_height'],level['ratio_width']) == (args.reshaped_width,args.reshaped_height,None):
+            raise ValueError('The pyramid level %dx%d is the main resolution' %(level['new_width'],level['new_height']))
+        os.makedirs(os.path.join('./','all'+'_'+str(level['new_width'])+'_'+str(level['new_height'])),exist_ok=True)
 
+    return pyramid_levels
 
-    #save the frame
-    print (image_name)
-    cv2.imwrite(image_name,image)
-    print (os.path.join('./all_'+str(new_width)+"_"+str(new_height),str(new_name)+'.png'))
-    cv2.imwrite(os.path.join('./all_'+str(new_width)+"_"+str(new_height), str(new_name)+'.png'),image)
+#function to get the output folders of the levels of the pyramid for a field and date.
+def pyramid_level_folders(pyramid_levels,field,date,media):
+    """
+    @args
+    pyramid_levels: list of levels given by command_pyramid_levels.
+    field: name of the field.
+    date: name of the date folder.
+    media: 'videos' or 'raw_images'.
 
+    returns a copy of the levels with their 'output' folder,
+    ./<field>_<width>_<height>/<date>/<media>, which is created.
+    """
+    date_levels=[]
 
-#Function to scan all the folder with videos and extract the frames.
-def video_to_frame_folders(args):
+    for level in pyramid_levels:
+        level_output=os.path.join('./',str(field)+'_'+str(level['new_width'])+'_'+str(level['new_height']),str(date),media)
+        os.makedirs(level_output,exist_ok=True)
+        date_levels.append(dict(level,output=level_output))
+
+    return date_levels
+
+#function to get the path of the timings file given in the command.
+def command_profile_path(args,all_directory,media,part_name=None):
     """
     args: args indications used in the command to run the code.
+    all_directory: path of the all_<width>_<height> folder.
+    media: 'videos' or 'images'.
+    part_name: name of the shard or process, when several of them share the
+    folder. Each one has its own timings.
+
+    returns None if the stages are not timed. Every run has its own file, named
+    with the time it started and its process id, so the timings of the other
+    runs are kept.
     """
+    if not args.profile:
+        return None
+
+    run_id=time.strftime('%Y%m%d_%H%M%S')+'_'+str(os.getpid())
+    profile_name='profile_'+media+'_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+'.run_'+run_id
+    if part_name is not None:
+        profile_name=profile_name+'.part_'+str(part_name)
 
-    #List formats for images and videos.
-    img_formats = ['bmp', 'jpg', 'jpeg', 'png', 'tif', 'tiff', 'dng', 'webp', 'JPG','JPEG','PNG']
-    vid_formats = ['mov', 'avi', 'mp4', 'mpg', 'mpeg', 'm4v', 'wmv', 'mkv', 'MOV','MP4', 'AVI','MPG','MPEG']
+    return os.path.join(all_directory,profile_name+'.jsonl')
 
+#function to save and print the report of the timings of a run.
+def write_profile_report(profile_path,elapsed_seconds):
+    """
+    @args
+    profile_path: JSON Lines file with the timings. The report is saved next to
+    it, with the extension .json.
+    elapsed_seconds: wall time of the run.
+    """
+    if not os.path.exists(profile_path):
+        return
+
+    report=profile_report(profile_path,os.path.splitext(profile_path)[0]+'.json',
+                        elapsed_seconds=elapsed_seconds)
+
+    print ('%d outputs in %.1f s (%.1f per second)' %(report['total']['frames'],report['total']['seconds'],
+                                                        report['total']['frames_per_second']))
+    print ('%-8s %10s %10s %10s %10s %12s' %('stage','p50 ms','p95 ms','p99 ms','mean ms','per second'))
+    for stage, statistics in report['total']['stages'].items():
+        print ('%-8s %10.2f %10.2f %10.2f %10.2f %12.1f' %(stage,statistics['p50_ms'],statistics['p95_ms'],
+                                                        statistics['p99_ms'],statistics['mean_ms'],
+                                                        statistics['frames_per_second']))
+
+#function to get the name of the part of the work done by this process.
+def command_part_name(args):
+    """
+    args: args indications used in the command to run the code.
+
+    returns None if this process extracts all the videos of the fields.
+    """
+    part_names=[]
+    if args.shard:
+        part_names.append('shard%dof%d' %parse_shard(args.shard))
+    if args.work_queue:
+        part_names.append(process_owner())
+
+    return '_'.join(part_names) if part_names else None
+
+#function to get the name of the dictionary of the extracted videos.
+def videos_dictionary_name(args):
+    """
+    args: args indications used in the command to run the code.
+    """
+    return "json_videos"+"_"+str(args.fields)+'_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+"dict.json"
+
+#Function to merge the dictionaries saved by the shards and processes of a
+#distributed extraction (--shard, --work_queue) in the final dictionary.
+def merge_video_shards(args):
+    """
+    args: args indications used in the command to run the code.
+    """
+    alternative_directory_save_new_data_all=os.path.join('./','all'+'_'+str(args.reshaped_width)+'_'+str(args.reshaped_height))
+    json_name=videos_dictionary_name(args)
+
+    video_frame_dictionary=merge_shard_dictionaries(os.path.join(alternative_directory_save_new_data_all,json_name))
+
+    #save the json file in current directory
+    f = open(os.path.join("./",json_name),"w")
+    f.write(json.dumps(video_frame_dictionary))
+    f.close()
+
+#function to estimate and print the frames and bytes saved from the videos.
+def command_video_plans(args,video_jobs,video_probes):
+    """
+    args: args indications used in the command to run the code.
+    video_jobs: list of the videos to extract, with their arguments and options.
+    video_probes: dictionary path -> probe given by video_probe.VideoProbeCache.
+
+    returns a dictionary path -> plan given by video_probe.video_extraction_plan.
+    With --plan, the plan of every video is printed too.
+    """
+    from video_probe import video_extraction_plan
+
+    #the copy in the "all" folder takes space only if it is a real copy
+    copies=2 if args.all_copy == 'copy' and args.output_sink == 'files' else 1
+
+    video_plans={}
+    for video_path, images_video_name, extraction_arguments, extraction_options, manifest_parameters in video_jobs:
+        video_plans[video_path]=video_extraction_plan(video_probes[video_path],args.fpsinterval,
+                                        resize=args.resize,horizontal_rotation=args.hrotation,
+                                        vertical_rotation=args.vrotation,new_width=args.reshaped_width,
+                                        new_height=args.reshaped_height,sampling=args.sampling,
+                                        sampling_seconds=args.sampling_seconds,image_format=args.image_format,
+                                        pyramid_levels=extraction_options['pyramid_levels'],copies=copies)
+
+        if args.plan:
+            probe=video_probes[video_path]
+            plan=video_plans[video_path]
+            if plan['frames'] is None:
+                print ('%s: the number of frames or the size is unknown' %str(video_path))
+                continue
+            print ('%s (%s): %d frames, %.1f s, %dx%d rotated %d -> %d frames %dx%d, %.1f MB' %(str(video_path),
+                    str(images_video_name),probe['frame_count'],probe['duration'] or 0,probe['width'],
+                    probe['height'],probe['rotation'] or 0,plan['frames'],plan['output_shape'][1],
+                    plan['output_shape'][0],plan['bytes']/float(1<<20)))
+
+    planned=[plan for plan in video_plans.values() if plan['frames'] is not None]
+    print ('%d videos: about %d frames and %.2f GB will be saved%s' %(len(video_plans),
+            sum(plan['frames'] for plan in planned),sum(plan['bytes'] for plan in planned)/float(1<<30),
+            ' at most' if args.sampling == 'scene' or args.dedup else ''))
+    if len(planned) < len(video_plans):
+        print ('%d videos without number of frames or size are not in the estimate' %(len(video_plans)-len(planned)))
+
+    return video_plans
+
+#Function to scan all the folder with videos and extract the frames.
+def video_to_frame_folders(args):
+    """
+    args: args indications used in the command to run the code.
+    """
+    from frame_archive import close_frame_archives
+    from video_probe import VideoProbeCache, longest_first
 
     #printing statement to verify the number of fields
     print ('There are %s fields to scan' %str(len(args.fields.split(" "))))
@@ -288,6 +1474,88 @@ def video_to_frame_folders(args):
     #video frames.
     video_frame_dictionary={}
 
+    #options of the image encoder
+    encoding_options=command_encoding_options(args)
+
+    #perceptual hash index of the all_<width>_<height> collection
+    dedup_index_path=command_dedup_index_path(args,alternative_directory_save_new_data_all)
+
+    #other resolutions saved from the same frames. See output_pyramid.
+    pyramid_levels=command_pyramid_levels(args)
+
+    #metadata of every extracted frame, written as the frames are saved. See metadata_sink.
+    metadata_path=os.path.join(alternative_directory_save_new_data_all,
+                        'metadata_videos_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+'.jsonl')
+
+    #With --shard i/N, only the videos of the shard are extracted. With
+    #--work_queue, every video is claimed in a queue shared by all the processes
+    #that use the same all_<width>_<height> folder. Each shard or process saves its
+    #own dictionary, merged with --merge_shards. See work_sharding.
+    shard=parse_shard(args.shard) if args.shard else None
+    part_name=command_part_name(args)
+    work_queue=None
+    if args.work_queue:
+        work_queue=WorkQueue(os.path.join(alternative_directory_save_new_data_all,
+                            'work_queue_videos_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)),
+                            lease_seconds=args.lease_seconds)
+
+    #With --profile, the timings of every video are saved, and merged in a
+    #report at the end. With --progress, a progress bar replaces the prints of
+    #every frame.
+    profile_path=command_profile_path(args,alternative_directory_save_new_data_all,'videos',part_name)
+    progress_bar=ProgressBar('frames') if args.progress else None
+    run_start=time.perf_counter()
+
+    #With --resume, the videos already extracted with the same parameters are
+    #skipped, and interrupted videos continue from their last checkpoint.
+    manifest=None
+    if args.resume:
+        manifest_name='manifest_videos_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+'.jsonl'
+        manifest=ProcessingManifest(os.path.join(alternative_directory_save_new_data_all,manifest_name),
+                                    use_checksum=args.manifest_checksum)
+
+    #function to keep track of a video once its frames are extracted.
+    def video_extracted(video_path,images_video_name,manifest_parameters,work_key,saved_frames):
+        video_frame_dictionary[os.path.basename(video_path)]['frames']=saved_frames
+
+        if manifest is not None:
+            manifest.record(video_path,manifest_parameters,image_name=images_video_name,frames=saved_frames)
+
+        if work_queue is not None:
+            work_queue.complete(work_key,{'image_name':images_video_name,'frames':saved_frames})
+
+    #videos whose extraction raised an error. They are not in the dictionary nor
+    #in the manifest, so the next run extracts them again.
+    failed_videos=[]
+
+    #function to keep track of a video whose extraction failed. The rest of the
+    #videos are still extracted.
+    def video_failed(video_path,images_video_name,manifest_parameters,work_key,error):
+        print ('The extraction of video %s failed: %s' %(str(video_path),repr(error)))
+        video_frame_dictionary.pop(os.path.basename(video_path),None)
+        failed_videos.append(video_path)
+
+        #another process can take it
+        if work_queue is not None:
+            work_queue.release(work_key)
+
+    #function to get the result of a video extracted by a worker.
+    def worker_video_finished(future,finished_job):
+        """
+        returns the number of saved frames, or None if the extraction failed.
+        """
+        try:
+            saved_frames=future.result()
+        except Exception as error:
+            video_failed(*finished_job,error=error)
+            return None
+
+        video_extracted(*finished_job,saved_frames=saved_frames)
+        return saved_frames
+
+    #videos to extract, found in the scan of the fields
+    video_jobs=[]
+
     #Go through every field
     for field in args.fields.split(" "):
 
@@ -299,34 +1567,28 @@ def video_to_frame_folders(args):
 
         os.makedirs(alternative_directory_save_new_data,exist_ok=True)
 
-        #printing statement to keep track
-        print ('There are %s dates in the field %s' %(len(os.listdir(os.path.join('./',field))), str(field)))
+        #counter of the dates, printed once the field is scanned
+        date_counter=0
 
-        #access to the folders within the field directory, adn loop through them
-        for date in os.listdir(os.path.join('./',field)):
+        #access to the folders within the field directory, adn loop through them.
+        #The directories are read while the videos are extracted.
+        for date in scan_directories(os.path.join('./',field)):
             print ('Scanning the videos in ' + str(date))
+            date_counter=date_counter+1
 
             #Access to all the videos on that date and that field
             #path of the videos directory
             video_path=os.path.join('./',str(field),str(date),'videos')
 
-            #Create a list for the paths of the video files we need to transfrom.
-            video_files_paths=[]
-
-            #Get all the video files in the directory of the field and date
-            for video_extension in vid_formats:
-                #Get the names of all the files within the video folder
-                for file in os.listdir(video_path):
-                    #Get the videos with a video file extension.
-                    if file.endswith(video_extension):
-                        video_files_paths.append(os.path.join(video_path,file))
-
-            #Print the number of videos for that field and that specific date
-            print ('There are %s videos in the recording at field' %(str(len(video_files_paths))),str(field))
+            #Get all the video files in the directory of the field and date, in
+            #one pass over the directory. The files are sorted, so a video gets
+            #the same name on every machine, with or without splitting the work.
+            video_files_paths=scan_media_files(video_path,video_extensions,sort=True)
 
             #create a folder to put the placed extracted images.
             save_frames_directory=os.path.join(alternative_directory_save_new_data,str(date),'videos')
             os.makedirs(save_frames_directory,exist_ok=True)
+            date_pyramid_levels=pyramid_level_folders(pyramid_levels,field,date,'videos')
 
             #counter for the video naming. Each video will be associated with a
             #number. THis is to keep track of the videos.
@@ -335,36 +1597,232 @@ def video_to_frame_folders(args):
             #Go through every video we have to extract the frames.
             for video_path in video_files_paths:
                 #all the frames extracted from this video will have this name
-                #in front of it.
+                #in front of it. The name is set here, before the job is sent to a
+                #worker, so the names are the same in serial and parallel runs.
                 images_video_name=str(field)+'_'+str(date)+'_'+'v'+'_'+str(video_counter)
 
+                #video counter update
+                video_counter = video_counter+1
+
+                #the videos of the other shards are counted too, so the names are
+                #the same in every shard.
+                if not in_shard(video_path,shard):
+                    continue
+
                 #fill the entry in the dictionary to keep track of the characteristics
                 #of the videos
                 video_frame_dictionary[os.path.basename(video_path)]={
                 'image_name':str(images_video_name),'field':str(field),
                 'date':date}
 
+                #arguments of the extraction job
+                extraction_arguments=(video_path,args.fpsinterval,save_frames_directory)
+                extraction_options={'resize':args.resize,'horizontal_rotation':args.hrotation,
+                                    'vertical_rotation':args.vrotation,
+                                    'new_width':args.reshaped_width,'new_height':args.reshaped_height,
+                                    'rename_videoframe':True,'new_name':images_video_name,
+                                    'sparse_extraction':args.sparse,
+                                    'frame_accuracy':args.frame_accuracy,
+                                    'pipelined':args.pipeline,'writer_threads':args.writer_threads,
+                                    'queue_size':args.queue_size,'all_copy_mode':args.all_copy,
+                                    'image_format':args.image_format,'encoding_options':encoding_options,
+                                    'batch_size':args.batch_size,'backend':args.backend,
+                                    'sampling':args.sampling,'sampling_seconds':args.sampling_seconds,
+                                    'scene_threshold':args.scene_threshold,'scene_metric':args.scene_metric,
+                                    'dedup_index_path':dedup_index_path,'dedup_distance':args.dedup_distance,
+                                    'dedup_hash':args.dedup_hash,'metadata_path':metadata_path,
+                                    'metadata_fields':{'field':str(field),'date':str(date),
+                                                    'video':os.path.basename(video_path)},
+                                    'profile_path':profile_path,'verbose':not args.progress,
+                                    'pyramid_levels':date_pyramid_levels,'output_sink':args.output_sink}
+
+                #parameters that change the extracted frames. The threading and copy
+                #options do not change them.
+                manifest_parameters={'fpsinterval':args.fpsinterval,'output':save_frames_directory}
+                manifest_parameters.update({key:value for key, value in extraction_options.items()
+                                    if key not in ('pipelined','writer_threads','queue_size','all_copy_mode','batch_size',
+                                                    'metadata_path','metadata_fields','profile_path','verbose')})
+
+                #skip the videos that did not change since the last run.
+                if manifest is not None:
+                    record=manifest.processed_record(video_path,manifest_parameters)
+                    if record is not None:
+                        video_frame_dictionary[os.path.basename(video_path)]['frames']=record['frames']
+                        print ('Video %s already extracted; skipping it' %str(video_path))
+                        continue
+
+                    extraction_options['checkpoint_path']=os.path.join(save_frames_directory,
+                                                            '.'+images_video_name+'.checkpoint.json')
+
+                video_jobs.append((video_path,images_video_name,extraction_arguments,
+                                    extraction_options,manifest_parameters))
 
-                #extract all
-                print ('normal')
-                image_extraction_video(video_path,args.fpsinterval,save_frames_directory,
-                                            resize=args.resize,horizontal_rotation=args.hrotation,
-                                            vertical_rotation=args.vrotation,
-                                            new_width=args.reshaped_width, new_height=args.reshaped_height,
-                                            rename_videoframe=True, new_name=images_video_name)
+            #Print the number of videos for that field and that specific date
+            print ('There are %s videos in the recording at field' %(str(video_counter)),str(field))
 
+        #printing statement to keep track
+        print ('There are %s dates in the field %s' %(str(date_counter), str(field)))
+
+    #Every video is probed before any is extracted: number of frames, frame
+    #rate, size and rotation of the container. The probes are cached in the
+    #"all" folder, and only the new or modified videos are opened. See video_probe.
+    probe_cache=VideoProbeCache(os.path.join(alternative_directory_save_new_data_all,'video_probes.jsonl'))
+    video_probes=probe_cache.probe_all([video_job[0] for video_job in video_jobs])
+    probe_cache.close()
+
+    #estimate of the frames and bytes saved from every video. With --plan, the
+    #estimate is printed and nothing is extracted.
+    video_plans=command_video_plans(args,video_jobs,video_probes)
+    if args.plan:
+        if work_queue is not None:
+            work_queue.close()
+        if manifest is not None:
+            manifest.close()
+        return
+
+    #With more than one worker, every video is extracted in a process pool.
+    #OpenCV threads are split between the workers to avoid oversubscription.
+    #The videos that take longest are sent first, so no worker is left with a
+    #long video at the end while the others wait. The names were given in the
+    #scan, so they do not depend on this order.
+    executor=None
+    extraction_jobs={}
+    if args.workers > 1:
+        opencv_threads=max(1,(os.cpu_count() or 1)//args.workers)
+        executor=ProcessPoolExecutor(max_workers=args.workers,
+                                    initializer=extraction_worker_initializer,
+                                    initargs=(opencv_threads,))
+        video_jobs_by_path={video_job[0]:video_job for video_job in video_jobs}
+        video_jobs=[video_jobs_by_path[video_path] for video_path in longest_first(list(video_jobs_by_path),video_plans)]
+
+    #number of videos sent to the pool, and finished
+    submitted_videos=0
+    finished_videos=0
+
+    #the workers, leases and manifest are closed even if the run is interrupted
+    try:
+        #the videos leased by another process are checked again after the others,
+        #until they are done or their lease expires and this process takes them.
+        remaining_jobs=video_jobs
+        while(True):
+            leased_jobs=[]
+
+            for video_path, images_video_name, extraction_arguments, extraction_options, manifest_parameters in remaining_jobs:
+                #the workers do not open the video to know its frame rate and size
+                extraction_options['video_probe']=video_probes[video_path]
+
+                #claim the video in the queue. The parameters are part of the key,
+                #so the videos are extracted again with other parameters.
+                work_key=None
+                if work_queue is not None:
+                    #the videos are only claimed when a worker is free to start them,
+                    #so the other processes can take the rest.
+                    if executor is not None:
+                        for future, finished_job in wait_for_free_slot(extraction_jobs,args.workers):
+                            saved_frames=worker_video_finished(future,finished_job)
+                            finished_videos=finished_videos+1
+                            if saved_frames is None:
+                                continue
+                            if progress_bar is not None:
+                                progress_bar.update(saved_frames,description=os.path.basename(finished_job[0]))
+                            else:
+                                print ('Video %s modified; progress %s videos' %(finished_job[0],str(finished_videos)))
+
+                    work_key=stable_path_key(video_path)+'|'+parameters_key(manifest_parameters)
+                    if not work_queue.claim(work_key):
+                        done=work_queue.done_result(work_key)
+                        if done is None:
+                            leased_jobs.append((video_path,images_video_name,extraction_arguments,
+                                                extraction_options,manifest_parameters))
+                            print ('Video %s is being extracted by another process; checking it later' %str(video_path))
+                        else:
+                            video_frame_dictionary[os.path.basename(video_path)]['frames']=done['result']['frames']
+                            print ('Video %s already extracted by %s; skipping it' %(str(video_path),str(done['owner'])))
+                        continue
+
+                #send the job to the pool. The results are collected below.
+                if executor is not None:
+                    future=executor.submit(image_extraction_video,*extraction_arguments,**extraction_options)
+                    extraction_jobs[future]=(video_path,images_video_name,manifest_parameters,work_key)
+                    submitted_videos=submitted_videos+1
+                    continue
 
-                #video counter update
-                video_counter = video_counter+1
+                #extract all
+                try:
+                    saved_frames=image_extraction_video(*extraction_arguments,progress_bar=progress_bar,
+                                                        **extraction_options)
+                except Exception as error:
+                    video_failed(video_path,images_video_name,manifest_parameters,work_key,error)
+                    continue
+                video_extracted(video_path,images_video_name,manifest_parameters,work_key,saved_frames)
+                finished_videos=finished_videos+1
 
                 #printing statment to keep track of the progress.
-                print ('Video %s modified; progress %s out of %s videos' %(video_path,str(video_counter),str(len(video_files_paths))))
+                if progress_bar is None:
+                    print ('Video %s modified; progress %s out of %s videos' %(video_path,str(finished_videos),str(len(video_jobs))))
+
+            if not leased_jobs:
+                break
+
+            remaining_jobs=leased_jobs
+            poll_seconds=max(1.0,min(60.0,args.lease_seconds/3.0))
+            print ('%s videos are being extracted by other processes; checking them again in %d s' %(str(len(leased_jobs)),int(poll_seconds)))
+            time.sleep(poll_seconds)
+
+        #collect the results of the workers as they finish.
+        if executor is not None:
+            for future in as_completed(extraction_jobs):
+                video_path=extraction_jobs[future][0]
+                saved_frames=worker_video_finished(future,extraction_jobs[future])
+                finished_videos=finished_videos+1
+                if saved_frames is None:
+                    continue
+
+                #printing statment to keep track of the progress. The workers cannot
+                #update the progress bar, it is updated when every video finishes.
+                if progress_bar is not None:
+                    progress_bar.update(saved_frames,description=os.path.basename(video_path))
+                else:
+                    print ('Video %s modified; progress %s out of %s videos' %(video_path,str(finished_videos),str(submitted_videos)))
+
+    finally:
+        #the videos not started yet are cancelled if the run stops
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+        if work_queue is not None:
+            work_queue.close()
+
+        if manifest is not None:
+            manifest.close()
+
+        #the shards of the archive are ended, so they are complete tar files
+        close_frame_archives()
 
+        if progress_bar is not None:
+            progress_bar.close()
 
+    if failed_videos:
+        print ('%s videos failed and were not extracted: %s' %(str(len(failed_videos)),', '.join(failed_videos)))
+
+    #report with the timings of every video, field and the whole run.
+    if profile_path is not None:
+        write_profile_report(profile_path,time.perf_counter()-run_start)
 
     #Save the dictionary we have created to keep track of things.
     json_file= json.dumps(video_frame_dictionary)
-    json_name="json_videos"+"_"+str(args.fields)+'_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+"dict.json"
+    json_name=videos_dictionary_name(args)
+
+    #a shard or process only has part of the videos. Its dictionary is saved
+    #apart, and the parts are merged once all of them are finished.
+    if part_name is not None:
+        part_path=shard_part_path(os.path.join(alternative_directory_save_new_data_all,json_name),part_name)
+        f = open(part_path,"w")
+        f.write(json_file)
+        f.close()
+        print ('Dictionary of %s videos saved in %s; merge the parts with --merge_shards' %(str(len(video_frame_dictionary)),part_path))
+        return
+
     f = open(os.path.join(alternative_directory_save_new_data_all,json_name),"w")
     f.write(json_file)
     f.close()
@@ -380,8 +1838,7 @@ def image_modification(args):
     """
     args: args indications used in the command to run the code.
     """
-    #List formats for images and videos.
-    img_formats = ['bmp', 'jpg', 'jpeg', 'png', 'tif', 'tiff', 'dng', 'webp','JPG','JPEG','PNG']
+    from frame_archive import close_frame_archives
 
     #printing statement to verify the number of fields
     print ('Images: There are %s fields to scan' %str(len(args.fields)))
@@ -390,9 +1847,53 @@ def image_modification(args):
     alternative_directory_save_new_data_all=os.path.join('./',
                 'all'+'_'+str(args.reshaped_width)+'_'+str(args.reshaped_height))
 
-    #creation of dictionary to keep track of the characteristics of the extracted
-    #video frames.
-    image_frame_dictionary={}
+    os.makedirs(alternative_directory_save_new_data_all,exist_ok=True)
+
+    #dictionary to keep track of the images, keyed by their new name (camera
+    #names like DJI_0001.JPG repeat between dates and fields). It is written to
+    #the file as the images are found, and copied to the current directory at
+    #the end. The metadata of every output is in the metadata file.
+    json_name="json_images"+"_"+str(args.fields)+'_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+"dict.json"
+    image_frame_dictionary=JsonObjectWriter(os.path.join(alternative_directory_save_new_data_all,json_name))
+
+    #options of the image encoder
+    encoding_options=command_encoding_options(args)
+
+    #perceptual hash index of the all_<width>_<height> collection
+    dedup_index_path=command_dedup_index_path(args,alternative_directory_save_new_data_all)
+
+    #other resolutions saved from the same images. See output_pyramid.
+    pyramid_levels=command_pyramid_levels(args)
+
+    #metadata of every modified image, written as the images are saved. See metadata_sink.
+    metadata_path=os.path.join(alternative_directory_save_new_data_all,
+                        'metadata_images_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+'.jsonl')
+
+    #With --profile, the timings of the images of every field are saved, and
+    #merged in a report at the end. With --progress, a progress bar replaces the
+    #prints of every image.
+    profile_path=command_profile_path(args,alternative_directory_save_new_data_all,'images')
+    field_profilers={}
+    progress_bar=ProgressBar('images') if args.progress else None
+    run_start=time.perf_counter()
+
+    #With --resume, the images already modified with the same parameters are skipped.
+    manifest=None
+    if args.resume:
+        manifest_name='manifest_images_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+'.jsonl'
+        manifest=ProcessingManifest(os.path.join(alternative_directory_save_new_data_all,manifest_name),
+                                    use_checksum=args.manifest_checksum)
+
+    #With more than one worker, the images are processed in a thread pool (OpenCV
+    #releases the GIL while decoding, transforming and encoding). Only
+    #max_in_flight images are submitted at a time, so no more than that many
+    #decoded images are held in memory.
+    executor=None
+    jobs_in_flight={}
+    processed_images=0
+    if args.workers > 1:
+        max_in_flight=args.max_in_flight if args.max_in_flight > 0 else 2*args.workers
+        executor=ThreadPoolExecutor(max_workers=args.workers)
 
     #Go through every field.
     for field in args.fields.split(" "):
@@ -406,13 +1907,19 @@ def image_modification(args):
 
         os.makedirs(alternative_directory_save_new_data,exist_ok=True)
 
-        #printing statement to keep track
-        print ('There are %s dates in the field %s' %(len(os.listdir(os.path.join('./',field))), str(field)))
+        #timings of the images of the field, shared by all the threads.
+        if profile_path is not None:
+            field_profilers[str(field)]=StageProfiler()
+
+        #counter of the dates, printed once the field is scanned
+        date_counter=0
 
-        #access to the folders within the field directory, and loop through them
-        for date in os.listdir(os.path.join('./',str(field))):
+        #access to the folders within the field directory, and loop through them.
+        #The directories are read while the images are processed.
+        for date in scan_directories(os.path.join('./',str(field))):
             #printing statement for safety// knowing what is going on.
             print ('Scanning the raw images  in ' + str(date))
+            date_counter=date_counter+1
 
             #Access to all the images on that date and that field
             #path of the videos directory
@@ -421,28 +1928,36 @@ def image_modification(args):
             #Print statement to verify correct development.
             print ('Scanning images in the s% directory '+str(images_path))
 
-            #Create an empy file to store the image paths that we are going to modify
-            image_files_paths=[]
-
-            #Get all the video files in the directory of the field and date
-            for img_extension in img_formats:
-                #Get the names of all the files within the video folder
-                for file in os.listdir(images_path):
-                    #Get the videos with a video file extension.
-                    if file.endswith(img_extension):
-                        image_files_paths.append(os.path.join(images_path,file))
-
-            #Print the number of images for that field and that specific date
-            print ('There are %s images in the recordings ' + str(len(image_files_paths)))
+            #Get all the image files in the directory of the field and date, in
+            #one pass over the directory.
+            image_files_paths=scan_media_files(images_path,image_extensions)
 
             #create a folder to put the placed extracted images.
             save_frames_directory=os.path.join(alternative_directory_save_new_data,str(date),'raw_images')
             os.makedirs(save_frames_directory,exist_ok=True)
+            date_pyramid_levels=pyramid_level_folders(pyramid_levels,field,date,'raw_images')
 
             #counter for the image naming. Each image will be associated with a number.
             #This is to keep track of the images.
             image_counter=0
 
+            #options shared by all the images of this date
+            common_options={'resize':args.resize,'horizontal_rotation':args.hrotation,
+                            'vertical_rotation':args.vrotation,'new_width':1980,
+                            'new_height':1080,'rename_image':True,'image_ratio':True,
+                            'ratio_width':args.ratiolongside,'ratio_height':args.ratioshortside,
+                            'all_copy_mode':args.all_copy,'image_format':args.image_format,
+                            'encoding_options':encoding_options,'dedup_index_path':dedup_index_path,
+                            'dedup_distance':args.dedup_distance,'dedup_hash':args.dedup_hash,
+                            'metadata_path':metadata_path,'metadata_fields':{'field':str(field),'date':str(date)},
+                            'profiler':field_profilers.get(str(field)),'progress_bar':progress_bar,
+                            'verbose':not args.progress,'reduced_decode':args.reduced_decode,
+                            'pyramid_levels':date_pyramid_levels,'output_sink':args.output_sink}
+
+            #images of this date sent to the pipeline, and their manifest parameters
+            image_jobs=[]
+            pipeline_parameters={}
+
             #Go through every video we have to extract the frames.
             for image_path in image_files_paths:
                 #New image name
@@ -450,40 +1965,134 @@ def image_modification(args):
 
                 #fill the entry in the dictionary to keep track of the characteristics
                 #of the images
+                image_frame_dictionary.add(image_name,{'source':image_path,'image_name':str(image_name),
+                                                        'field':str(field),'date':date})
 
-                #extract all
-                image_processing(image_path,save_frames_directory,resize=args.resize,
-                                horizontal_rotation=args.hrotation,
-                                vertical_rotation=args.vrotation,new_width=1980,
-                                new_height=1080, rename_image=True,
-                                new_name=image_name,image_ratio=True,
-                                ratio_width=args.ratiolongside, ratio_height=args.ratioshortside)
-
+                #arguments of the image job
+                processing_arguments=(image_path,save_frames_directory)
+                #the peak memory of the process is only the peak of one image
+                #when the images are processed one after another
+                processing_options=dict(common_options,new_name=image_name,
+                                        measure_peak_memory=executor is None)
 
                 #update counter
                 image_counter = image_counter+ 1
 
+                #parameters that change the output image.
+                manifest_parameters={'output':save_frames_directory}
+                manifest_parameters.update({key:value for key, value in processing_options.items()
+                                            if key not in ('all_copy_mode','metadata_path','metadata_fields',
+                                                            'profiler','progress_bar','verbose',
+                                                            'measure_peak_memory')})
+
+                #skip the images that did not change since the last run.
+                if manifest is not None and manifest.processed_record(image_path,manifest_parameters) is not None:
+                    print ('Image %s already modified; skipping it' %str(image_path))
+                    continue
+
+                #the pipeline processes all the images of the date together.
+                if args.pipeline:
+                    image_jobs.append((image_path,image_name))
+                    pipeline_parameters[image_path]=manifest_parameters
+                    continue
+
+                #send the job to the pool once there is room for it.
+                if executor is not None:
+                    for future, (finished_image_path, finished_parameters) in wait_for_free_slot(jobs_in_flight,max_in_flight):
+                        future.result()
+                        if manifest is not None:
+                            manifest.record(finished_image_path,finished_parameters)
+                        processed_images=processed_images+1
+                        if progress_bar is None:
+                            print ('Image %s modified; progress %s images' %(finished_image_path,str(processed_images)))
+
+                    future=executor.submit(image_processing,*processing_arguments,**processing_options)
+                    jobs_in_flight[future]=(image_path,manifest_parameters)
+                    continue
+
+                #extract all
+                image_processing(*processing_arguments,**processing_options)
+
+                if manifest is not None:
+                    manifest.record(image_path,manifest_parameters)
+
                 #printing statment to keep track of the progress.
-                print ('Image %s modified; progress %s out of %s images' %(image_path,str(image_counter),str(len(image_files_paths))))
+                if progress_bar is None:
+                    print ('Image %s modified; progress %s images' %(image_path,str(image_counter)))
+
+            #Print the number of images for that field and that specific date
+            print ('There are %s images in the recordings %s' %(str(image_counter),str(images_path)))
+
+            #Decode, transform and write the images of this date in separate threads.
+            if image_jobs:
+                #the manifest is updated from the writer threads as soon as every image is saved.
+                def image_saved(image_path,image_name):
+                    if manifest is not None:
+                        manifest.record(image_path,pipeline_parameters[image_path])
+
+                saved_images=image_processing_pipeline(image_jobs,save_frames_directory,
+                                    writer_threads=args.writer_threads,queue_size=args.queue_size,
+                                    on_image_saved=image_saved,**common_options)
+
+                #printing statment to keep track of the progress.
+                print ('%s images modified in %s' %(str(saved_images),str(images_path)))
+
+        #printing statement to keep track
+        print ('There are %s dates in the field %s' %(str(date_counter), str(field)))
+
+    #wait for the last images in the pool.
+    if executor is not None:
+        for future in as_completed(jobs_in_flight):
+            future.result()
+            finished_image_path, finished_parameters = jobs_in_flight[future]
+            if manifest is not None:
+                manifest.record(finished_image_path,finished_parameters)
+            processed_images=processed_images+1
+            if progress_bar is None:
+                print ('Image %s modified; progress %s images' %(finished_image_path,str(processed_images)))
+
+        executor.shutdown()
+
+    if manifest is not None:
+        manifest.close()
+
+    close_frame_archives()
+
+    if progress_bar is not None:
+        progress_bar.close()
+
+    #report with the timings of every field and the whole run. The images of a
+    #field overlap in the threads, so the time of a field is the sum of its stages.
+    if profile_path is not None:
+        for field_name, profiler in field_profilers.items():
+            timings=profiler.to_dict()
+            open_metadata_sink(profile_path).record(field=field_name,frames=timings.get('write',{}).get('count',0),
+                                                    seconds=sum(timing['seconds'] for timing in timings.values()),
+                                                    timings=timings)
+        write_profile_report(profile_path,time.perf_counter()-run_start)
 
     #Save the dictionary we have created to keep track of things.
-    json_file= json.dumps(image_frame_dictionary)
-    json_name="json_images"+"_"+str(args.fields)+'_'+str(args.reshaped_width)+'_'+str(args.reshaped_height)+"dict.json"
-    f = open(os.path.join(alternative_directory_save_new_data_all,json_name),"w")
-    f.write(json_file)
-    f.close()
+    image_frame_dictionary.close()
 
     #save the json file in current directory
-    f = open(os.path.join("./",json_name),"w")
-    f.write(json_file)
-    f.close()
+    shutil.copyfile(os.path.join(alternative_directory_save_new_data_all,json_name),os.path.join("./",json_name))
 
-if __name__ == '__main__':
+#function to get the parser of the command, also used by the benchmarks.
+def command_parser():
+    """
+    returns the argparse.ArgumentParser of the options of this code.
+    """
+    from image_output import all_copy_modes, image_formats, encoder_backends
+    from frame_sampling import sampling_modes, scene_metrics
+    from perceptual_hash_index import hash_methods
 
     #Parser to make this code work.
     parser = argparse.ArgumentParser()
-    parser.add_argument('--video', type=str, default='image', help='initial image')
-    parser.add_argument('--output', type=str, default='image', help='initial image')
+    parser.add_argument('--mode', type=str, default='images', choices=['images','videos','both','video'],
+                        help='images: process the raw_images of the fields. videos: extract the frames of the videos '
+                            'of the fields. both: videos and images. video: extract the frames of --video in --output')
+    parser.add_argument('--video', type=str, default='image', help='video extracted with --mode video')
+    parser.add_argument('--output', type=str, default='image', help='output folder with --mode video')
     parser.add_argument('--fpsinterval', type=int, default=30, help='fps interval')
     parser.add_argument('--fields', type=str, default='bbro near30 walledgarden',
                         help='Name of the fields to transform the videos to images.')
@@ -496,8 +2105,150 @@ if __name__ == '__main__':
     parser.add_argument('--vrotation', action='store_true', help='Save images vertically')
     parser.add_argument('--ratiolongside', type=int, default=16)
     parser.add_argument('--ratioshortside', type=int, default=9)
+    parser.add_argument('--sparse', action='store_true',
+                        help='Skip the discarded frames without converting them')
+    parser.add_argument('--frame_accuracy', type=str, default='exact', choices=['exact','keyframe'],
+                        help='exact: grab every frame and retrieve the kept ones. keyframe: seek to the kept frames')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of videos or images processed in parallel')
+    parser.add_argument('--max_in_flight', type=int, default=0,
+                        help='Maximum number of images submitted to the workers at a time (default 2*workers)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Decode, transform and write in separate threads')
+    parser.add_argument('--writer_threads', type=int, default=2,
+                        help='Number of threads encoding and writing images when --pipeline is used')
+    parser.add_argument('--queue_size', type=int, default=8,
+                        help='Maximum number of images waiting between two stages of the pipeline')
+    parser.add_argument('--all_copy', type=str, default='copy', choices=all_copy_modes,
+                        help='How the second copy of every image in the all_<width>_<height> folder is made')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip the videos and images already processed with the same parameters')
+    parser.add_argument('--manifest_checksum', action='store_true',
+                        help='Identify the processed files by their size and sha1 instead of their size and modification time')
+    parser.add_argument('--image_format', type=str, default='png', choices=image_formats,
+                        help='Format of the saved images')
+    parser.add_argument('--quality', type=int, default=None,
+                        help='Quality of jpg (0-100) and webp (1-100, 101 is lossless) images')
+    parser.add_argument('--png_compression', type=int, default=None,
+                        help='zlib compression level of png images (0-9)')
+    parser.add_argument('--png_fast', action='store_true',
+                        help='Lossless fast png mode: level 1 with run-length encoding')
+    parser.add_argument('--encoder_backend', type=str, default='opencv', choices=encoder_backends,
+                        help='simd uses simplejpeg for jpg images when it is installed')
+    parser.add_argument('--batch_size', type=int, default=1,
+                        help='Number of video frames resized and rotated together')
+    parser.add_argument('--backend', type=str, default='opencv', choices=['opencv','ffmpeg-pipe','ffmpeg'],
+                        help='Video decoder: OpenCV, FFmpeg through a pipe, or FFmpeg doing all the processing')
+    parser.add_argument('--sampling', type=str, default='frames', choices=sampling_modes,
+                        help='frames: every fpsinterval frames. seconds: every sampling_seconds seconds. scene: frames with a scene change')
+    parser.add_argument('--sampling_seconds', type=float, default=1.0,
+                        help='Seconds of video between two kept frames with --sampling seconds')
+    parser.add_argument('--scene_threshold', type=float, default=None,
+                        help='Minimum change to keep a frame with --sampling scene (default 12 for luma, 0.2 for histogram)')
+    parser.add_argument('--scene_metric', type=str, default='luma', choices=scene_metrics,
+                        help='Change measure with --sampling scene')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time every stage of every frame and save a report in the all_<width>_<height> folder')
+    parser.add_argument('--progress', action='store_true',
+                        help='Show a progress bar instead of printing every saved frame or image')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Skip the frames and images with a near-duplicate in the all_<width>_<height> collection')
+    parser.add_argument('--dedup_distance', type=int, default=4,
+                        help='Maximum Hamming distance between the hashes of two near-duplicates')
+    parser.add_argument('--dedup_hash', type=str, default='dhash', choices=hash_methods,
+                        help='Perceptual hash used to find near-duplicates')
+    parser.add_argument('--output_sink', type=str, default='files', choices=['files','archive'],
+                        help='files: save every output as two files. archive: append the outputs and their metadata '
+                            'to tar shards in all_<width>_<height>/frames_archive instead')
+    parser.add_argument('--pyramid', type=str, default='',
+                        help='Other output resolutions made from the same decoded frames and images, e.g. '
+                            '"1280x720 640x360 480x360:4:3" (<width>x<height>[:<ratio width>:<ratio height>]). '
+                            'Each one is saved in its own <field>_<width>_<height> and all_<width>_<height> folders')
+    parser.add_argument('--reduced_decode', action='store_true',
+                        help='Decode large images at a reduced size when the output is much smaller (JPEG scaling, '
+                            'memory mapped uncompressed TIFF with tifffile)')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='i/N: extract only the videos of the shard i (0 to N-1) of N, chosen by a hash of their path')
+    parser.add_argument('--work_queue', action='store_true',
+                        help='Claim every video in a queue shared by the processes using the same all_<width>_<height> folder')
+    parser.add_argument('--lease_seconds', type=float, default=600,
+                        help='Time after which the video of a process that stopped renewing its claim is taken by another')
+    parser.add_argument('--plan', action='store_true',
+                        help='Only probe the videos and print the frames and bytes that would be saved, without extracting')
+    parser.add_argument('--merge_shards', action='store_true',
+                        help='Merge the dictionaries of the shards and processes in the json_videos dictionary, without extracting')
+
+    return parser
+
+
+#function to extract the frames of the --video given in the command.
+def single_video_extraction(args):
+    """
+    args: args indications used in the command to run the code.
+
+    The frames are saved in <output>/framerate<fpsinterval>/frame<frame index>.
+    Only the options in single_video_options are used. See check_single_video_options.
+    """
+    from extraction_api import extract_frames
+
+    output=os.path.join(args.output,'framerate'+str(args.fpsinterval))
+    saved_frames=0
+
+    for result in extract_frames(args.video,args.fpsinterval,output=output,image_name='frame',
+                                resize=args.resize,horizontal_rotation=args.hrotation,
+                                vertical_rotation=args.vrotation,new_width=args.reshaped_width,
+                                new_height=args.reshaped_height,image_format=args.image_format,
+                                encoding_options=command_encoding_options(args),
+                                sparse_extraction=args.sparse,frame_accuracy=args.frame_accuracy,
+                                backend=args.backend):
+        if not args.progress:
+            print ('Creating...' + result['output'])
+        saved_frames+=1
+
+    print ('%s frames saved in %s' %(str(saved_frames),str(output)))
+
+#options of the command used by --mode video. The rest only apply to the fields.
+single_video_options = ('mode','video','output','fpsinterval','reshaped_width','reshaped_height','resize',
+                        'hrotation','vrotation','sparse','frame_accuracy','image_format','quality',
+                        'png_compression','png_fast','encoder_backend','backend','progress')
+
+#function to check that --mode video is only given the options it uses.
+def check_single_video_options(parser,args):
+    """
+    @args
+    parser: parser of the command, given by command_parser.
+    args: args indications used in the command to run the code.
+    """
+    unsupported_options=['--'+action.dest for action in parser._actions
+                        if action.dest != 'help' and action.dest not in single_video_options
+                        and getattr(args,action.dest) != action.default]
+    if unsupported_options:
+        parser.error('%s cannot be used with --mode video' %', '.join(unsupported_options))
+
+    #the native FFmpeg backend is not available for a single video
+    if args.backend == 'ffmpeg':
+        parser.error('--backend ffmpeg cannot be used with --mode video; use opencv or ffmpeg-pipe')
+
+#function to run the command.
+def main(argv=None):
+    """
+    @args
+    argv: list of command options. None uses the options of the command line.
+    """
+    parser=command_parser()
+    args=parser.parse_args(argv)
+
+    if args.mode == 'video':
+        check_single_video_options(parser,args)
+        single_video_extraction(args)
+    if args.mode in ('videos','both'):
+        if args.merge_shards:
+            merge_video_shards(args)
+        else:
+            video_to_frame_folders(args)
+    if args.mode in ('images','both'):
+        image_modification(args)
 
-    args=parser.parse_args()
 
-    #video_to_frame_folders(args)
-    image_modification(args)
+if __name__ == '__main__':
+    main()
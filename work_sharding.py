@@ -0,0 +1,286 @@
+# Importing all necessary libraries
+import os
+import json
+import time
+import fcntl
+import socket
+import hashlib
+import threading
+import contextlib
+
+
+#Split of the videos of the fields between several processes or machines that
+#share the same filesystem. Two ways, that can be used together:
+#- Static shards (--shard i/N): a video belongs to the shard
+#  sha1(<relative path of the video>) mod N. The hash does not depend on the
+#  machine, the Python process (hash() is salted) or the order of the directories,
+#  so every shard agrees on the owner of every video without talking to the others.
+#- Work queue (--work_queue): every process claims a video before extracting it
+#  by writing a lease file in a shared folder. The lease is renewed while the
+#  video is extracted; if its process dies the lease expires and another process
+#  takes the video. A finished video gets a done file, so it is not extracted twice.
+#Every process saves the dictionary of its own videos in a part file, and
+#merge_shard_dictionaries joins the parts in the final dictionary.
+
+
+#function to parse the --shard option.
+def parse_shard(text):
+    """
+    @args
+    text: 'i/N', the shard i (from 0 to N-1) of N shards.
+
+    returns the tuple (i, N).
+    """
+    try:
+        shard_index, shard_count = [int(value) for value in str(text).split('/')]
+    except ValueError:
+        raise ValueError('the shard must be i/N, e.g. 0/4, not %s' %str(text))
+
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError('the shard i/N needs 0 <= i < N, not %s' %str(text))
+
+    return shard_index, shard_count
+
+#function to get the name of a path that is the same on every machine.
+def stable_path_key(path):
+    """
+    @args
+    path: path of the video relative to the directory of the fields, e.g.
+    ./<field>/<date>/videos/a.mp4. The machines can mount the directory in
+    different places, but they run the command from it.
+    """
+    return os.path.normpath(path).replace(os.sep,'/')
+
+#function to get the shard of a path.
+def shard_of(path,shard_count):
+    """
+    @args
+    path: path of the video relative to the directory of the fields.
+    shard_count: number of shards.
+    """
+    digest=hashlib.sha1(stable_path_key(path).encode('utf-8')).hexdigest()
+    return int(digest[:16],16) % shard_count
+
+#function to check whether a path belongs to a shard.
+def in_shard(path,shard):
+    """
+    @args
+    path: path of the video relative to the directory of the fields.
+    shard: tuple (i, N) given by parse_shard, or None when there are no shards.
+    """
+    if shard is None:
+        return True
+
+    shard_index, shard_count = shard
+    return shard_of(path,shard_count) == shard_index
+
+#function to get the name of the work done by this process.
+def process_owner():
+    return socket.gethostname()+'-'+str(os.getpid())
+
+
+class WorkQueue:
+    """
+    Leases on the videos of a folder shared by several processes or machines.
+    The leases and done files are checked and written while holding a lock on
+    <queue_directory>/queue.lock (fcntl, also supported by NFS v4), so two
+    processes never claim the same video. The leases of this process are renewed
+    by a thread every lease_seconds/3. lease_seconds must be longer than the
+    difference between the clocks of the machines.
+    @args
+    queue_directory: shared folder of the leases. Removing it starts the work again.
+    lease_seconds: time without renewal after which a lease is taken by another process.
+    owner: name of this process in the leases. By default <host>-<pid>.
+    """
+
+    def __init__(self,queue_directory,lease_seconds=600,owner=None):
+        self.queue_directory=queue_directory
+        self.lease_seconds=lease_seconds
+        self.owner=owner if owner is not None else process_owner()
+        self.lock_path=os.path.join(queue_directory,'queue.lock')
+
+        os.makedirs(queue_directory,exist_ok=True)
+
+        #the fcntl lock is per process, the threads of the process use this one
+        self.lock=threading.Lock()
+
+        #key -> path of the leases held by this process
+        self.held_leases={}
+
+        self.stop_renewal=threading.Event()
+        self.renewal_thread=None
+
+    #context to hold the lock of the queue.
+    @contextlib.contextmanager
+    def _locked_queue(self):
+        with self.lock:
+            descriptor=os.open(self.lock_path,os.O_RDWR|os.O_CREAT,0o644)
+            try:
+                fcntl.lockf(descriptor,fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(descriptor)
+
+    #function to get the lease and done files of a work item
+    def _paths(self,key):
+        name=hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return (os.path.join(self.queue_directory,name+'.lease'),
+                os.path.join(self.queue_directory,name+'.done'))
+
+    #function to write a JSON file that is never seen half written
+    def _write_file(self,path,content):
+        temporary_path=path+'.'+self.owner+'.tmp'
+        f = open(temporary_path,"w")
+        f.write(json.dumps(content))
+        f.close()
+        os.replace(temporary_path,path)
+
+    #function to claim a work item.
+    def claim(self,key):
+        """
+        @args
+        key: name of the work item, the same in every process (e.g. the path of
+        the video and its parameters).
+
+        returns True if this process has to do the work. False if it is done, or
+        another process has a valid lease on it.
+        """
+        lease_path, done_path = self._paths(key)
+
+        with self._locked_queue():
+            if os.path.exists(done_path):
+                return False
+
+            try:
+                lease_age=time.time()-os.stat(lease_path).st_mtime
+            except FileNotFoundError:
+                lease_age=None
+
+            if lease_age is not None:
+                if lease_age < self.lease_seconds:
+                    return False
+                print ('The lease of %s expired %d s ago; taking it' %(key,int(lease_age-self.lease_seconds)))
+
+            self._write_file(lease_path,{'key':key,'owner':self.owner,'claimed':time.time()})
+            self.held_leases[key]=lease_path
+
+        self._start_renewal()
+        return True
+
+    #function to mark a claimed work item as done.
+    def complete(self,key,result=None):
+        """
+        @args
+        key: name of the work item given to claim.
+        result: anything serializable to JSON, given back by done_result.
+        """
+        lease_path, done_path = self._paths(key)
+
+        #the done file is written before the lease is removed, so nobody can claim it in between
+        with self._locked_queue():
+            self._write_file(done_path,{'key':key,'owner':self.owner,'finished':time.time(),'result':result})
+            self.held_leases.pop(key,None)
+            if os.path.exists(lease_path):
+                os.remove(lease_path)
+
+    #function to give back a claimed work item that was not done.
+    def release(self,key):
+        lease_path, done_path = self._paths(key)
+
+        #the lease is not removed if another process took it after it expired
+        with self._locked_queue():
+            if self.held_leases.pop(key,None) is not None and self._lease_owner(lease_path) == self.owner:
+                os.remove(lease_path)
+
+    #function to read the owner of a lease file. Called with the queue locked.
+    def _lease_owner(self,lease_path):
+        try:
+            with open(lease_path,'r') as lease_file:
+                return json.load(lease_file)['owner']
+        except (FileNotFoundError,ValueError,KeyError):
+            return None
+
+    #function to get the result saved by the process that did a work item.
+    def done_result(self,key):
+        """
+        returns the dictionary with 'owner', 'finished' and 'result', or None if
+        the work item is not done.
+        """
+        lease_path, done_path = self._paths(key)
+
+        try:
+            with open(done_path,'r') as done_file:
+                return json.load(done_file)
+        except FileNotFoundError:
+            return None
+
+    #function to start the thread that renews the leases of this process
+    def _start_renewal(self):
+        with self.lock:
+            if self.renewal_thread is not None:
+                return
+            self.renewal_thread=threading.Thread(target=self._renew_leases,daemon=True)
+            self.renewal_thread.start()
+
+    def _renew_leases(self):
+        while not self.stop_renewal.wait(self.lease_seconds/3.0):
+            with self.lock:
+                held_leases=list(self.held_leases.items())
+
+            #a lease that expired and was taken by another process is not renewed,
+            #or both processes would keep it alive.
+            for key, lease_path in held_leases:
+                with self._locked_queue():
+                    if self._lease_owner(lease_path) == self.owner:
+                        os.utime(lease_path)
+                        continue
+                    self.held_leases.pop(key,None)
+                print ('The lease of %s was taken by another process; it is not renewed' %key)
+
+    #function to stop renewing and give back the leases not done.
+    def close(self):
+        self.stop_renewal.set()
+        if self.renewal_thread is not None:
+            self.renewal_thread.join()
+
+        for key in list(self.held_leases):
+            self.release(key)
+
+
+#function to get the part file of the dictionary of a shard or process.
+def shard_part_path(json_path,part_name):
+    """
+    @args
+    json_path: path of the final dictionary, e.g. all_1920_1080/json_videos_<fields>_1920_1080dict.json
+    part_name: name of the shard or process, e.g. shard0of4.
+    """
+    return os.path.splitext(json_path)[0]+'.part_'+str(part_name)+'.json'
+
+#function to merge the dictionaries of the shards in the final dictionary.
+def merge_shard_dictionaries(json_path):
+    """
+    @args
+    json_path: path of the final dictionary. The parts saved next to it with
+    shard_part_path are merged and it is written.
+
+    returns the merged dictionary. If a video is in several parts (e.g. a video
+    taken again after an expired lease) the most recent part is used.
+    """
+    prefix=os.path.basename(os.path.splitext(json_path)[0])+'.part_'
+    directory=os.path.dirname(json_path) or '.'
+
+    part_paths=[os.path.join(directory,name) for name in os.listdir(directory)
+                if name.startswith(prefix) and name.endswith('.json')]
+
+    merged_dictionary={}
+    for part_path in sorted(part_paths,key=os.path.getmtime):
+        with open(part_path,'r') as part_file:
+            merged_dictionary.update(json.load(part_file))
+
+    print ('%s parts merged in %s with %s videos' %(str(len(part_paths)),str(json_path),str(len(merged_dictionary))))
+
+    f = open(json_path,"w")
+    f.write(json.dumps(merged_dictionary))
+    f.close()
+
+    return merged_dictionary